@@ -0,0 +1,7 @@
+"""
+cli/__init__.py
+
+The command line interface of the application, see cli/main.py.
+"""
+
+from cli.main import main
@@ -0,0 +1,13 @@
+"""
+cli/__main__.py
+
+Runs the command line interface with python -m cli.
+"""
+
+# Imports
+import sys
+
+from cli.main import main
+
+if __name__ == "__main__":
+    sys.exit(main())
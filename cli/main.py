@@ -0,0 +1,505 @@
+"""
+cli/main.py
+
+This module is responsible for running the engines of the application
+from the command line, without the interactive menus, so that runs can
+be scripted and scheduled.
+
+Ex: python -m cli kmeans --dataset Coronal/Density/MASTER --k 4,6,8,13 --out data/generated/kmeans.csv
+
+"""
+
+# Imports
+import argparse
+from typing import Callable, Optional
+
+from pandas import DataFrame
+
+# Config
+from providers.config import Config
+from providers.data import Data
+
+# Drivers
+from drivers.clustering.main import Clustering
+from drivers.clustering.kmeans import KMeans
+from drivers.clustering.hac import HAC
+from drivers.clustering.kmeans_streaming import stream_kmeans
+
+# Constants
+from util.constants import (
+    CONFIG_FILE,
+    KMEANS_DTYPES,
+    HAC_LINKAGES,
+    SPATIAL_ADJACENCIES,
+    STREAM_CHUNK_ROWS,
+    STREAM_OPERATIONS,
+    STRUCTURE_IDS_COLUMN
+)
+
+# Utilities
+from util.data import save_csv_file, get_all_cluster_id_columns
+from util.compositions import get_cluster_compositions, to_long_format
+from util.binning import bin_density
+from util.brainscan import print_density_bins
+from util.streaming import StreamingDataset
+
+from util.print import (
+    error,
+    success,
+    info
+)
+
+
+def parse_int_list(value: str) -> list[int]:
+    """
+    Parses a comma separated list of positive integers, ex: "4,6,8,13".
+
+    :param value:
+    :return:
+    """
+
+    try:
+        values = [int(v) for v in value.split(",") if v.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a comma separated list of integers, got {value!r}")
+
+    if not values or any(v < 1 for v in values):
+        raise argparse.ArgumentTypeError(f"Expected a comma separated list of positive integers, got {value!r}")
+
+    return values
+
+
+def write_output(data: DataFrame, out: Optional[str]):
+    """
+    Saves the result of a command to a csv file, or prints its first rows.
+
+    :param data:
+    :param out: The path of the csv file, None to print the result.
+    :return:
+    """
+
+    if out is None:
+        print(data.head())
+        return
+
+    save_csv_file(data, out)
+    print(success(f"Saved {data.shape[0]} x {data.shape[1]} data set to {out}"))
+
+
+def list_datasets(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Prints the name of every data set, one per line.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    for name in data.data_cache.get_leafs():
+        print(name)
+
+    return 0
+
+
+def run_kmeans(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Clusters a data set with KMeans for every K.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    # Command line options only apply to this run
+    overrides = {
+        "kmeans_workers": args.workers,
+        "kmeans_dtype": args.dtype,
+        "kmeans_mini_batch_min_k": args.mini_batch_min_k,
+        "kmeans_warm_start": args.warm_start
+    }
+
+    for key, value in overrides.items():
+        if value is not None:
+            config.override(key, value)
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    new_data = KMeans(Clustering(config, data)).cluster_dataset(dataset, args.k)
+
+    if new_data is None:
+        return 1
+
+    write_output(new_data, args.out)
+
+    return 0
+
+
+def run_selection(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Scores a range of K of a data set, to help choose K.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    overrides = {
+        "gap_references": args.references,
+        "kmeans_workers": args.workers
+    }
+
+    for key, value in overrides.items():
+        if value is not None:
+            config.override(key, value)
+
+    if not 1 <= args.min_k <= args.max_k:
+        print(error("--min-k must be at least 1 and at most --max-k."))
+        return 1
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    scores = KMeans(Clustering(config, data)).select_dataset(dataset, list(range(args.min_k, args.max_k + 1)))
+
+    if scores is None:
+        return 1
+
+    if args.out is not None:
+        write_output(scores, args.out)
+
+    return 0
+
+
+def run_consensus(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Clusters a data set with KMeans and measures how stable every K is.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    overrides = {
+        "consensus_runs": args.runs,
+        "consensus_subsample_percent": args.subsample_percent,
+        "kmeans_workers": args.workers
+    }
+
+    for key, value in overrides.items():
+        if value is not None:
+            config.override(key, value)
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    new_data = KMeans(Clustering(config, data)).consensus_dataset(dataset, args.k)
+
+    if new_data is None:
+        return 1
+
+    write_output(new_data, args.out)
+
+    return 0
+
+
+def run_predict(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Labels a data set with the clusters of a K fitted on another data set.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    if args.dtype is not None:
+        config.override("kmeans_dtype", args.dtype)
+
+    fitted = data.get_dataset(args.fitted)
+
+    if fitted is None:
+        return 1
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    new_data = KMeans(Clustering(config, data)).predict_dataset(fitted, dataset, args.k)
+
+    if new_data is None:
+        return 1
+
+    write_output(new_data, args.out)
+
+    return 0
+
+
+def run_hac(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Clusters a data set with HAC, cutting its merge tree at every K.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    if args.linkage is not None:
+        config.override("hac_linkage", args.linkage)
+
+    if args.adjacency is not None:
+        config.override("spatial_adjacency", args.adjacency)
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    new_data = HAC(Clustering(config, data), spatial=args.spatial).cluster_dataset(dataset, args.k)
+
+    if new_data is None:
+        return 1
+
+    write_output(new_data, args.out)
+
+    return 0
+
+
+def run_compositions(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Counts the Structure-IDs of every cluster of every cluster column, as
+    one table with a row for every K, cluster and Structure-ID.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    if STRUCTURE_IDS_COLUMN not in dataset.columns or not get_all_cluster_id_columns(dataset):
+        print(error(f"Data set {args.dataset} needs a {STRUCTURE_IDS_COLUMN} column and cluster columns."))
+        return 1
+
+    write_output(to_long_format(get_cluster_compositions(dataset)), args.out)
+
+    return 0
+
+
+def run_brainscan(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Bins the density values of a data set into log-decade buckets.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    dataset = data.get_dataset(args.dataset)
+
+    if dataset is None:
+        return 1
+
+    bins = bin_density(dataset)
+    print_density_bins(bins)
+
+    if args.out is not None:
+        write_output(bins.to_frame(), args.out)
+
+    return 0
+
+
+def run_stream(args: argparse.Namespace, config: Config, data: Data) -> int:
+    """
+    Processes a csv file that is too large for memory one chunk of rows at a time.
+
+    :param args:
+    :param config:
+    :param data:
+    :return: The exit code.
+    """
+
+    if args.operation != "brainscan" and args.out is None:
+        print(error(f"The {args.operation} operation needs --out."))
+        return 1
+
+    dataset = StreamingDataset(args.path, args.chunk_rows)
+
+    if args.operation == "filter-structure-ids":
+        if args.structure_ids is None:
+            print(error("The filter-structure-ids operation needs --structure-ids."))
+            return 1
+
+        rows = dataset.filter_structure_ids(args.structure_ids, args.out)
+        print(success(f"Kept {rows} rows, saved to {args.out}"))
+
+    elif args.operation == "replace-nan":
+        replaced = dataset.replace_nan(args.value, args.out)
+        print(success(f"Replaced {replaced} NaN values with {args.value}, saved to {args.out}"))
+
+    elif args.operation == "reduce-columns":
+        removed = dataset.reduce_columns(args.threshold, args.out)
+        print(success(f"Removed {len(removed)} columns, saved to {args.out}"))
+
+    elif args.operation == "brainscan":
+        bins = dataset.bin_density()
+        print_density_bins(bins)
+
+        if args.out is not None:
+            write_output(bins.to_frame(), args.out)
+
+    elif args.operation == "kmeans":
+        if args.k is None:
+            print(error("The kmeans operation needs --k."))
+            return 1
+
+        try:
+            report = stream_kmeans(dataset, args.k, args.out, passes=args.passes)
+        except ValueError as e:
+            print(error(str(e)))
+            return 1
+
+        print(report.to_string())
+        print(success(f"Saved the clustered rows to {args.out}"))
+
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Builds the parser of the command line arguments.
+
+    :return:
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="python -m cli",
+        description="Runs the engines of the application without the interactive menus."
+    )
+
+    parser.add_argument("--config", default=CONFIG_FILE,
+                        help="The configuration file. The defaults are used if it does not exist.")
+    parser.add_argument("--compact", action="store_true", default=None,
+                        help="Load data sets with float32 genes and small integer labels, which halves their memory.")
+
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help="List the data sets.")
+    list_parser.set_defaults(run=list_datasets)
+
+    kmeans_parser = commands.add_parser("kmeans", help="Cluster a data set with KMeans.")
+    kmeans_parser.add_argument("--dataset", required=True, help="The name of the data set, ex: Coronal/Density/MASTER.")
+    kmeans_parser.add_argument("--k", required=True, type=parse_int_list, help="The values of K, ex: 4,6,8,13.")
+    kmeans_parser.add_argument("--out", help="The csv file to save the clustered data set to.")
+    kmeans_parser.add_argument("--workers", type=int, help="The number of processes, 0 for one per CPU.")
+    kmeans_parser.add_argument("--dtype", choices=KMEANS_DTYPES, help="The precision to cluster with.")
+    kmeans_parser.add_argument("--mini-batch-min-k", type=int, help="The smallest K fitted with mini-batches.")
+    kmeans_parser.add_argument("--warm-start", action="store_true", default=None,
+                               help="Start each K from the clusters of the previous K.")
+    kmeans_parser.set_defaults(run=run_kmeans)
+
+    select_parser = commands.add_parser("select-k", help="Score a range of K to help choose K.")
+    select_parser.add_argument("--dataset", required=True, help="The name of the data set.")
+    select_parser.add_argument("--min-k", type=int, default=2, help="The smallest K to score.")
+    select_parser.add_argument("--max-k", type=int, default=20, help="The largest K to score.")
+    select_parser.add_argument("--out", help="The csv file to save the scores to.")
+    select_parser.add_argument("--references", type=int, help="The number of reference data sets of the gap statistic.")
+    select_parser.add_argument("--workers", type=int, help="The number of processes, 0 for one per CPU.")
+    select_parser.set_defaults(run=run_selection)
+
+    consensus_parser = commands.add_parser("consensus", help="Measure how stable the clusters of KMeans are.")
+    consensus_parser.add_argument("--dataset", required=True, help="The name of the data set.")
+    consensus_parser.add_argument("--k", required=True, type=parse_int_list, help="The values of K, ex: 4,6,8,13.")
+    consensus_parser.add_argument("--out", help="The csv file to save the clustered data set to.")
+    consensus_parser.add_argument("--runs", type=int, help="The number of refits of every K.")
+    consensus_parser.add_argument("--subsample-percent", type=int, help="The percentage of rows every refit is fitted on.")
+    consensus_parser.add_argument("--workers", type=int, help="The number of processes, 0 for one per CPU.")
+    consensus_parser.set_defaults(run=run_consensus)
+
+    predict_parser = commands.add_parser("predict", help="Label a data set with clusters fitted on another data set.")
+    predict_parser.add_argument("--fitted", required=True, help="The data set the clusters were fitted on.")
+    predict_parser.add_argument("--dataset", required=True, help="The data set to label.")
+    predict_parser.add_argument("--k", required=True, type=int, help="The K of the clusters to label with.")
+    predict_parser.add_argument("--out", help="The csv file to save the labeled data set to.")
+    predict_parser.add_argument("--dtype", choices=KMEANS_DTYPES, help="The precision the clusters were fitted with.")
+    predict_parser.set_defaults(run=run_predict)
+
+    hac_parser = commands.add_parser("hac", help="Cluster a data set with HAC.")
+    hac_parser.add_argument("--dataset", required=True, help="The name of the data set.")
+    hac_parser.add_argument("--k", required=True, type=parse_int_list, help="The values of K, ex: 4,6,8,13.")
+    hac_parser.add_argument("--out", help="The csv file to save the clustered data set to.")
+    hac_parser.add_argument("--linkage", choices=HAC_LINKAGES, help="How the distance between clusters is measured.")
+    hac_parser.add_argument("--spatial", action="store_true",
+                            help="Only merge neighboring voxels (Ward), so that clusters are contiguous.")
+    hac_parser.add_argument("--adjacency", choices=SPATIAL_ADJACENCIES, help="How voxels are connected with --spatial.")
+    hac_parser.set_defaults(run=run_hac)
+
+    compositions_parser = commands.add_parser("compositions", help="Count the Structure-IDs of every cluster.")
+    compositions_parser.add_argument("--dataset", required=True, help="A clustered data set.")
+    compositions_parser.add_argument("--out", help="The csv file to save the table to.")
+    compositions_parser.set_defaults(run=run_compositions)
+
+    brainscan_parser = commands.add_parser("brainscan", help="Bin the density values of a data set.")
+    brainscan_parser.add_argument("--dataset", required=True, help="The name of the data set.")
+    brainscan_parser.add_argument("--out", help="The csv file to save the bin counts to.")
+    brainscan_parser.set_defaults(run=run_brainscan)
+
+    stream_parser = commands.add_parser("stream", help="Process a csv file too large for memory, in chunks.")
+    stream_parser.add_argument("operation", choices=STREAM_OPERATIONS)
+    stream_parser.add_argument("--path", required=True, help="The csv file to read.")
+    stream_parser.add_argument("--out", help="The csv file to write the result to.")
+    stream_parser.add_argument("--chunk-rows", type=int, default=STREAM_CHUNK_ROWS, help="The number of rows per chunk.")
+    stream_parser.add_argument("--structure-ids", type=parse_int_list, help="The Structure-IDs to keep.")
+    stream_parser.add_argument("--value", type=float, default=0.0, help="The value that replaces NaN.")
+    stream_parser.add_argument("--threshold", type=float, default=0.0,
+                               help="Gene columns with a value below it are removed.")
+    stream_parser.add_argument("--k", type=parse_int_list, help="The values of K to cluster with.")
+    stream_parser.add_argument("--passes", type=int, default=1, help="The number of times the file is read to fit KMeans.")
+    stream_parser.set_defaults(run=run_stream)
+
+    return parser
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    """
+    Runs a command.
+
+    :param argv: The command line arguments, None to use sys.argv.
+    :return: The exit code.
+    """
+
+    args = build_parser().parse_args(argv)
+
+    config = Config(args.config, interactive=False)
+
+    if args.compact is not None:
+        config.override("compact_dtypes", True)
+
+    data = Data(config)
+
+    command: Callable[[argparse.Namespace, Config, Data], int] = args.run
+
+    print(info(f"Running {args.command}..."))
+
+    try:
+        return command(args, config, data)
+    except KeyboardInterrupt:
+        print(error("Interrupted."))
+        return 130
@@ -9,6 +9,9 @@ for the engines.
 from typing import Optional, List, Tuple
 from pandas import DataFrame
 
+# Constants
+from util.constants import CAN_CLUSTER
+
 from util.input import (
     text_input,
     get_text_input_with_back
@@ -20,6 +23,12 @@ from util.print import (
     info
 )
 
+from util.data import (
+    remove_non_gene_columns,
+    combine_data,
+    has_1465_rows
+)
+
 from util.string_util import get_most_alike_from_list
 
 from providers.data import Data
@@ -31,3 +40,42 @@ class Clusterer:
 
     def run(self):
         raise NotImplementedError("The run method must be implemented by the subclass.")
+
+    def split_dataset(self, dataset: DataFrame) -> tuple[DataFrame, DataFrame] | None:
+        """
+        Splits a data set into its gene columns and the rest.
+
+        :param dataset:
+        :return: The gene columns and the removed columns, or None if the genes cannot be clustered.
+        """
+        # Strip the dataset of non-genetic columns
+        genes, removed_columns = remove_non_gene_columns(dataset)
+
+        # Only the gene columns are clustered, the profile of the whole data set covers them
+        properties = self.data_driver.get_data_properties(dataset, list(genes.columns))
+
+        if not properties[CAN_CLUSTER]:
+            print(error("This dataset cannot be clustered."))
+            return None
+
+        return genes, removed_columns
+
+    def restore_non_gene_columns(self, new_data: DataFrame, removed_columns: DataFrame) -> DataFrame:
+        """
+        Adds the non-gene columns back to a clustered data set. The columns
+        of a data set that was already clustered with the same K are replaced.
+
+        :param new_data:
+        :param removed_columns:
+        :return:
+        """
+        removed_columns = removed_columns.drop(columns=new_data.columns, errors="ignore")
+        new_data = combine_data(removed_columns, new_data)
+
+        if has_1465_rows(new_data):
+            # get NonGeneColumns
+            non_gene_columns = self.data_driver.data_cache.get("NonGeneColumns")
+            if non_gene_columns is not None:
+                new_data = combine_data(non_gene_columns, new_data)
+
+        return new_data
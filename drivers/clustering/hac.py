@@ -0,0 +1,197 @@
+"""
+clustering/hac.py
+
+This module is responsible for providing the HAC (hierarchical
+agglomerative clustering) engine for the application.
+"""
+
+# Imports
+import hashlib
+from typing import List
+
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+from drivers.clustering.clusterer import Clusterer
+from drivers.clustering.hac_tree import HierarchyTree, build_tree, build_spatial_tree, cut_tree
+
+# Constants
+from util.constants import XYZ_COLUMNS
+
+# Utilities
+from util.input import (
+    get_comma_separated_int_input,
+    get_yes_no_input
+)
+
+from util.data import combine_data, get_data_fingerprint
+from util.spatial import get_adjacency
+
+from util.print import (
+    error,
+    info
+)
+
+
+class HAC(Clusterer):
+    """
+    A class that represents the HAC clustering engine.
+
+    Attributes
+    ----------
+    clusterer : Clusterer
+        The clusterer instance.
+    spatial : bool
+        Whether only neighboring voxels can be merged, see util/spatial.py.
+
+    Methods
+    -------
+    __init__(clusterer: Clusterer, spatial: bool)
+        Initializes the HAC engine.
+    run()
+        Runs the HAC engine.
+    cluster_dataset(dataset: DataFrame, ks: List[int]) -> DataFrame | None
+        Clusters a data set without asking the user anything.
+    get_connectivity(dataset: DataFrame) -> csr_matrix
+        Gets the voxel neighbor graph of a data set, building it only once.
+    get_tree(data: DataFrame, connectivity: csr_matrix | None) -> HierarchyTree
+        Gets the merge tree of the data, building it only once.
+    """
+
+    clusterer: Clusterer
+
+    def __init__(self, clusterer: Clusterer, spatial: bool = False):
+        self.clusterer = clusterer
+        self.spatial = spatial
+        super().__init__(clusterer.config, clusterer.data_driver)
+
+    def run(self):
+        """
+        Runs the HAC engine.
+        """
+        print(info(f"Running the {'spatial ' if self.spatial else ''}HAC engine."))
+
+        while True:
+            dataset = self.data_driver.retrieve_dataset()
+
+            if dataset is None:
+                return
+
+            cluster_k_values = get_comma_separated_int_input("Enter the list of K values to cluster: ")
+
+            if not cluster_k_values:
+                continue
+
+            new_data = self.cluster_dataset(dataset, cluster_k_values)
+
+            if new_data is not None:
+                print(new_data.head())
+
+                self.data_driver.ask_to_save_data_in_memory(new_data)
+
+            cluster_more = get_yes_no_input("Would you like to cluster more data with HAC?")
+
+            if not cluster_more:
+                return
+
+    def cluster_dataset(self, dataset: DataFrame, ks: List[int]) -> DataFrame | None:
+        """
+        Clusters a data set without asking the user anything, the way run() does.
+
+        :param dataset: The data set, with or without its non-gene columns.
+        :param ks: The numbers of clusters to create.
+        :return: The data set with a cluster column for every K, or None if it cannot be clustered.
+        """
+        split = self.split_dataset(dataset)
+
+        if split is None:
+            return None
+
+        genes, removed_columns = split
+
+        try:
+            connectivity = self.get_connectivity(dataset) if self.spatial else None
+            new_data = self.cluster(genes, ks, connectivity)
+        except ValueError as e:
+            print(error(str(e)))
+            return None
+
+        return self.restore_non_gene_columns(new_data, removed_columns)
+
+    def get_connectivity(self, dataset: DataFrame) -> csr_matrix:
+        """
+        Gets the neighbor graph of the voxels of a data set, building it
+        only the first time the voxels are clustered with the configured
+        adjacency.
+
+        :param dataset: The data set with its X, Y and Z columns.
+        :return:
+        """
+        adjacency = self.config.get('spatial_adjacency')
+        neighbors = self.config.get('spatial_neighbors')
+
+        if any(column not in dataset.columns for column in XYZ_COLUMNS):
+            raise ValueError("Spatial clustering needs the X, Y and Z columns of the voxels.")
+
+        key = f"Spatial/{get_data_fingerprint(dataset[XYZ_COLUMNS])}/{adjacency}/{neighbors}"
+
+        connectivity = self.data_driver.cache.get(key)
+
+        if connectivity is None:
+            connectivity = get_adjacency(dataset, adjacency, neighbors)
+            self.data_driver.cache.set(key, connectivity)
+
+            print(info(f"Connected {dataset.shape[0]} voxels with {connectivity.nnz // 2} edges."))
+
+        return connectivity
+
+    def get_tree(self, data: DataFrame, connectivity: csr_matrix | None = None) -> HierarchyTree:
+        """
+        Gets the merge tree of the data, building it only the first time
+        the data is clustered with the configured linkage, or with the
+        neighbor graph.
+
+        :param data:
+        :param connectivity: The neighbor graph of the rows, None to merge any two rows.
+        :return:
+        """
+        if connectivity is None:
+            linkage = self.config.get('hac_linkage')
+            key = f"HAC/{get_data_fingerprint(data)}/{linkage}"
+        else:
+            # Graphs of the same voxels built with other settings have other edges
+            linkage = "spatial ward"
+            edges = hashlib.sha1(connectivity.indptr.tobytes() + connectivity.indices.tobytes()).hexdigest()
+            key = f"HAC/{get_data_fingerprint(data)}/spatial/{edges}"
+
+        tree = self.data_driver.cache.get(key)
+
+        if tree is None:
+            print(info(f"Building the {linkage} linkage tree of {data.shape[0]} rows..."))
+
+            if connectivity is None:
+                tree = build_tree(data, linkage)
+            else:
+                tree = build_spatial_tree(data, connectivity)
+
+            self.data_driver.cache.set(key, tree)
+
+            print(info(f"Built the tree in {format(tree.seconds, '.2f')} s."))
+
+        return tree
+
+    def cluster(self, data: DataFrame, ks: List[int], connectivity: csr_matrix | None = None) -> DataFrame:
+        """
+        Clusters the data by cutting its merge tree at every K.
+
+        :param data: The data to cluster.
+        :param ks: The numbers of clusters to create.
+        :param connectivity: The neighbor graph of the rows, None to merge any two rows.
+        """
+        new_df, report = cut_tree(self.get_tree(data, connectivity), ks, index=data.index)
+
+        print(info(f"Cut the tree at {len(report)} values of K:"))
+        print(report.round({"Height": 4}).to_string())
+
+        # Combine the data
+        return combine_data(new_df, data)
@@ -0,0 +1,251 @@
+"""
+clustering/hac_tree.py
+
+This module is responsible for hierarchical agglomerative clustering. The
+merge tree of a data set is computed once, after which the tree can be
+cut into any number of clusters without clustering the data set again:
+cutting it into K clusters is applying its first n - K merges.
+
+The tree is built from the pairwise distances of the rows, or, for the
+spatially constrained mode, with Ward merges along the edges of a voxel
+neighbor graph only, which keeps the clusters contiguous.
+
+"""
+
+# Imports
+from time import perf_counter
+
+import numpy as np
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    HAC_LINKAGES,
+    HAC_MAX_DISTANCE_MEGABYTES
+)
+
+# Utilities
+from util.conversion import byte_to_mb
+
+# SciPy
+from scipy.cluster.hierarchy import linkage as get_linkage
+from scipy.sparse import csr_matrix
+
+# SciKit-Learn
+from sklearn.cluster import ward_tree
+
+
+class HierarchyTree:
+    """
+    A class that represents the merge tree of a data set.
+
+    Attributes
+    ----------
+    children : np.ndarray
+        The two nodes merged at every step, in the order they were merged.
+        Nodes below n_leaves are rows, node n_leaves + i is the i-th merge.
+    heights : np.ndarray
+        The distance between the two nodes of every merge.
+    n_leaves : int
+        The number of rows.
+    seconds : float
+        The time it took to build the tree.
+
+    Methods
+    -------
+    cut(ks: list[int]) -> dict[int, np.ndarray]
+        Gets the cluster labels of every K.
+    get_height(k: int) -> float
+        Gets the height the tree is cut at for K clusters.
+    """
+
+    def __init__(self, children: np.ndarray, heights: np.ndarray, n_leaves: int, seconds: float = 0.0):
+        self.children = children
+        self.heights = heights
+        self.n_leaves = n_leaves
+        self.seconds = seconds
+
+    def cut(self, ks: list[int]) -> dict[int, np.ndarray]:
+        """
+        Cuts the tree into K clusters for every K. The merges are applied
+        once, in order, and the labels are taken whenever the number of
+        clusters reaches one of the values of K.
+
+        :param ks:
+        :return: The labels of every K, from 0 to K - 1.
+        """
+
+        for k in ks:
+            if not 1 <= k <= self.n_leaves:
+                raise ValueError(f"K = {k} must be between 1 and the number of rows ({self.n_leaves}).")
+
+        # The rows of every cluster point to one row of the cluster
+        parent = np.arange(self.n_leaves)
+        # The row that stands for every node of the tree
+        representative = np.concatenate([parent, np.zeros(len(self.children), dtype=parent.dtype)])
+
+        def find(row: int) -> int:
+            while parent[row] != row:
+                parent[row] = parent[parent[row]]
+                row = parent[row]
+
+            return row
+
+        labels = {}
+        remaining = sorted(set(ks), reverse=True)
+        clusters = self.n_leaves
+
+        for i, (a, b) in enumerate(self.children):
+            while remaining and remaining[0] == clusters:
+                labels[remaining.pop(0)] = self.get_labels(parent)
+
+            if not remaining:
+                break
+
+            root = find(representative[a])
+            parent[find(representative[b])] = root
+            representative[self.n_leaves + i] = root
+            clusters -= 1
+
+        # A tree that is not fully connected stops above one cluster
+        for k in remaining:
+            if k != clusters:
+                raise ValueError(f"The tree cannot be cut into {k} clusters, it has at least {clusters}.")
+
+            labels[k] = self.get_labels(parent)
+
+        return labels
+
+    @staticmethod
+    def get_labels(parent: np.ndarray) -> np.ndarray:
+        """
+        Gets the cluster of every row from the parent pointers.
+
+        :param parent:
+        :return: The labels, from 0 to K - 1.
+        """
+
+        roots = parent.copy()
+
+        # Follow the pointers of every row at once until they all reach their root
+        while True:
+            next_roots = roots[roots]
+
+            if np.array_equal(next_roots, roots):
+                break
+
+            roots = next_roots
+
+        return np.unique(roots, return_inverse=True)[1].astype(np.int32)
+
+    def get_height(self, k: int) -> float:
+        """
+        Gets the height the tree is cut at for K clusters, the height of
+        the last merge that is applied.
+
+        :param k:
+        :return:
+        """
+
+        merges = self.n_leaves - k
+
+        if merges <= 0:
+            return 0.0
+
+        return float(self.heights[merges - 1])
+
+
+def get_distance_megabytes(rows: int) -> float:
+    """
+    Gets the size of the pairwise distance matrix of a number of rows.
+
+    :param rows:
+    :return:
+    """
+
+    return byte_to_mb(rows * (rows - 1) // 2 * np.dtype(np.float64).itemsize)
+
+
+def build_tree(data: DataFrame, linkage: str = HAC_LINKAGES[0]) -> HierarchyTree:
+    """
+    Builds the merge tree of a data set from its pairwise distances.
+
+    :param data: The gene columns to cluster.
+    :param linkage: One of HAC_LINKAGES.
+    :return:
+    """
+
+    if linkage not in HAC_LINKAGES:
+        raise ValueError(f"Invalid linkage: {linkage}. Expected one of {HAC_LINKAGES}")
+
+    megabytes = get_distance_megabytes(len(data.index))
+
+    if megabytes > HAC_MAX_DISTANCE_MEGABYTES:
+        raise ValueError(
+            f"The pairwise distances of {len(data.index)} rows take {format(megabytes, '.0f')} MB, "
+            f"more than {HAC_MAX_DISTANCE_MEGABYTES} MB."
+        )
+
+    start = perf_counter()
+    tree = get_linkage(np.ascontiguousarray(data.to_numpy(dtype=np.float64)), method=linkage)
+    seconds = perf_counter() - start
+
+    return HierarchyTree(tree[:, :2].astype(np.intp), tree[:, 2], len(data.index), seconds)
+
+
+def build_spatial_tree(data: DataFrame, connectivity: csr_matrix) -> HierarchyTree:
+    """
+    Builds the Ward merge tree of a data set in which only neighboring rows
+    can be merged. Only the distances along the edges of the neighbor graph
+    are computed, so the memory grows with the number of edges instead of
+    the square of the number of rows.
+
+    :param data: The gene columns to cluster.
+    :param connectivity: The sparse adjacency matrix of the rows, see util/spatial.py.
+    :return:
+    """
+
+    start = perf_counter()
+    # get_adjacency joins the parts of the graph at their nearest voxels; ward_tree would join
+    # them at their closest rows in gene space instead, and the clusters would not be contiguous
+    children, _, n_leaves, _, heights = ward_tree(
+        np.ascontiguousarray(data.to_numpy(dtype=np.float64)),
+        connectivity=connectivity,
+        return_distance=True
+    )
+    seconds = perf_counter() - start
+
+    return HierarchyTree(children.astype(np.intp), heights, n_leaves, seconds)
+
+
+def cut_tree(tree: HierarchyTree, ks: list[int], index=None) -> tuple[DataFrame, DataFrame]:
+    """
+    Cuts a tree into K clusters for every K, and reports the height and
+    the sizes of the clusters of each K.
+
+    :param tree:
+    :param ks: The values of K.
+    :param index: The index of the cluster label columns.
+    :return: The cluster label columns, and the report indexed by K.
+    """
+
+    ks = sorted(set(ks))
+    cuts = tree.cut(ks)
+
+    labels = DataFrame({f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}": cuts[k] for k in ks}, index=index)
+
+    report = DataFrame(
+        [
+            {
+                "K": k,
+                "Height": tree.get_height(k),
+                "Largest Cluster": int(np.bincount(cuts[k]).max()),
+                "Smallest Cluster": int(np.bincount(cuts[k]).min())
+            }
+            for k in ks
+        ],
+        columns=["K", "Height", "Largest Cluster", "Smallest Cluster"]
+    ).set_index("K")
+
+    return labels, report
@@ -4,6 +4,8 @@ visualization/plotly.py
 This module is responsible for providing the Plotly visualization engine for the
 application.
 """
+import os
+from time import perf_counter
 from typing import List
 
 from pandas import DataFrame
@@ -12,29 +14,39 @@ from pandas import DataFrame
 from drivers.clustering.clusterer import Clusterer
 
 # Constants
-from util.constants import (
-    CAN_CLUSTER,
-    CLUSTER_LABEL_COLUMN_PREFIX,
-    KMEANS_SEED
-)
+from util.constants import CLUSTER_LABEL_COLUMN_PREFIX, KMEANS_SEED
 
 # Utilities
-from util.input import get_choice_input, get_comma_separated_int_input, get_yes_no_input
-
-from util.data import (
-    get_data_properties,
-    remove_non_gene_columns,
-    combine_data,
-    has_1465_rows
+from util.input import (
+    get_choice_input,
+    get_comma_separated_int_input,
+    get_int_input,
+    get_yes_no_input,
+    get_text_input,
+    get_text_input_with_back
 )
 
+from util.data import combine_data, get_data_fingerprint, remove_non_gene_columns
+
 from util.print import (
     error,
+    success,
     info
 )
 
-# SciKit-Learn
-from sklearn.cluster import KMeans as KMeansClusterer
+from drivers.clustering.kmeans_sweep import (
+    sweep_kmeans,
+    run_kmeans_sweep,
+    get_sweep_result,
+    to_contiguous_array
+)
+from drivers.clustering.kmeans_streaming import stream_kmeans
+from drivers.clustering.kmeans_consensus import consensus_kmeans
+from drivers.clustering.kmeans_selection import select_k
+from drivers.clustering.kmeans_predict import get_label_centers, predict_kmeans
+
+from util.streaming import StreamingDataset
+from util.model_store import get_model_key
 
 
 class KMeans(Clusterer):
@@ -52,6 +64,28 @@ class KMeans(Clusterer):
         Initializes the KMeans engine.
     run()
         Runs the KMeans engine.
+    cluster_dataset(dataset: DataFrame, ks: List[int]) -> DataFrame | None
+        Clusters a data set without asking the user anything.
+    run_streaming()
+        Clusters a csv file too large for memory with MiniBatchKMeans.
+    run_consensus()
+        Clusters a data set and measures how stable its clusters are.
+    consensus_dataset(dataset: DataFrame, ks: List[int]) -> DataFrame | None
+        Clusters a data set with stability columns without asking the user anything.
+    run_selection()
+        Scores a range of K to help choose K.
+    select_dataset(dataset: DataFrame, ks: List[int]) -> DataFrame | None
+        Scores every K without asking the user anything, and saves the scores as a data set.
+    get_model_key(fingerprint: str, k: int) -> str
+        Gets the key of the stored model of a K, see util/model_store.py.
+    fit(data: DataFrame, ks: List[int]) -> tuple[DataFrame, DataFrame]
+        Fits every K that is not stored yet, and stores it.
+    run_predict()
+        Labels a data set with the clusters fitted on another data set.
+    get_centers(dataset: DataFrame, k: int) -> DataFrame | None
+        Gets the fitted centers of a K of a data set.
+    predict_dataset(fitted: DataFrame, dataset: DataFrame, k: int) -> DataFrame | None
+        Labels a data set with fitted clusters without asking the user anything.
     """
 
     clusterer: Clusterer
@@ -72,15 +106,13 @@ class KMeans(Clusterer):
             if dataset is None:
                 return
 
-            # Strip the dataset of non-genetic columns
-            dataset, removed_columns = remove_non_gene_columns(dataset)
-
-            properties = get_data_properties(dataset)
+            split = self.split_dataset(dataset)
 
-            if not properties[CAN_CLUSTER]:
-                print(error("This dataset cannot be clustered."))
+            if split is None:
                 continue
 
+            dataset, removed_columns = split
+
             cluster_k_values = get_comma_separated_int_input("Enter the list of K values to cluster: ")
 
             if not cluster_k_values:
@@ -89,14 +121,7 @@ class KMeans(Clusterer):
             cluster_k_values.sort()
 
             new_data = self.cluster(dataset, cluster_k_values)
-            new_data = combine_data(removed_columns, new_data)
-
-            if has_1465_rows(new_data):
-                # get NonGeneColumns
-                non_gene_columns = self.data_driver.data_cache.get("NonGeneColumns")
-                if non_gene_columns is not None:
-                    new_data = combine_data(non_gene_columns, new_data)
-
+            new_data = self.restore_non_gene_columns(new_data, removed_columns)
 
             print(new_data.head())
 
@@ -107,23 +132,408 @@ class KMeans(Clusterer):
             if not cluster_more:
                 return
 
+    def run_streaming(self):
+        """
+        Clusters a csv file that is too large for memory, one chunk of rows
+        at a time, and writes it to the generated data directory.
+        """
+        print(info("Running the streaming KMeans engine."))
+
+        file_path, did_go_back = get_text_input_with_back("Enter the path of the file to cluster: ")
+
+        if did_go_back:
+            return
+
+        if not os.path.isfile(file_path):
+            print(error(f"File not found at {file_path}"))
+            return
+
+        cluster_k_values = get_comma_separated_int_input("Enter the list of K values to cluster: ")
+
+        if not cluster_k_values:
+            return
+
+        name_of_file = get_text_input("Enter the name of the file to write: ")
+        out_path = self.config.get('save_generated_data_path') + name_of_file.replace(".csv", "") + ".csv"
+
+        try:
+            report = stream_kmeans(StreamingDataset(file_path), cluster_k_values, out_path)
+        except ValueError as e:
+            print(error(str(e)))
+            return
+
+        print(report.to_string())
+        print(success(f"Saved the clustered rows to {out_path}"))
+
+    def run_consensus(self):
+        """
+        Clusters a data set with KMeans, refits every K many times, and adds
+        a stability column for every K next to its cluster column.
+        """
+        print(info("Running the KMeans stability engine."))
+
+        while True:
+            dataset = self.data_driver.retrieve_dataset()
+
+            if dataset is None:
+                return
+
+            cluster_k_values = get_comma_separated_int_input("Enter the list of K values to cluster: ")
+
+            if not cluster_k_values:
+                continue
+
+            new_data = self.consensus_dataset(dataset, cluster_k_values)
+
+            if new_data is not None:
+                print(new_data.head())
+
+                self.data_driver.ask_to_save_data_in_memory(new_data)
+
+            cluster_more = get_yes_no_input("Would you like to measure the stability of more data?")
+
+            if not cluster_more:
+                return
+
+    def consensus_dataset(self, dataset: DataFrame, ks: List[int]) -> DataFrame | None:
+        """
+        Clusters a data set, and measures the stability of every K over
+        the configured number of refits, without asking the user anything.
+
+        :param dataset: The data set, with or without its non-gene columns.
+        :param ks: The numbers of clusters to create.
+        :return: The data set with a cluster and a stability column for every K, or None if it cannot be clustered.
+        """
+        split = self.split_dataset(dataset)
+
+        if split is None:
+            return None
+
+        genes, removed_columns = split
+
+        runs = self.config.get('consensus_runs')
+        subsample_percent = self.config.get('consensus_subsample_percent')
+
+        print(info(f"Refitting every K {runs} times on {subsample_percent}% of the rows..."))
+
+        start = perf_counter()
+
+        try:
+            new_df, report, _ = consensus_kmeans(
+                genes,
+                ks,
+                runs=runs,
+                subsample_percent=subsample_percent,
+                workers=self.config.get('kmeans_workers'),
+                dtype=self.config.get('kmeans_dtype')
+            )
+        except ValueError as e:
+            print(error(str(e)))
+            return None
+
+        print(info(f"Measured the stability of {len(report)} values of K in {format(perf_counter() - start, '.2f')} s:"))
+        print(report.round(4).to_string())
+
+        return self.restore_non_gene_columns(combine_data(new_df, genes), removed_columns)
+
+    def run_selection(self):
+        """
+        Clusters a data set over a range of K and scores every K, to help
+        choose the values of K to cluster with.
+        """
+        print(info("Running the K selection engine."))
+
+        while True:
+            dataset = self.data_driver.retrieve_dataset()
+
+            if dataset is None:
+                return
+
+            min_k = get_int_input("Enter the smallest K to score (default 2): ", default=2)
+            max_k = get_int_input("Enter the largest K to score (default 20): ", default=20)
+
+            if not 1 <= min_k <= max_k:
+                print(error("The smallest K must be at least 1 and at most the largest K."))
+                continue
+
+            self.select_dataset(dataset, list(range(min_k, max_k + 1)))
+
+            select_more = get_yes_no_input("Would you like to score the values of K of more data?")
+
+            if not select_more:
+                return
+
+    def select_dataset(self, dataset: DataFrame, ks: List[int]) -> DataFrame | None:
+        """
+        Scores every K of a data set without asking the user anything, and
+        saves the scores as a data set so that they can be plotted.
+
+        :param dataset: The data set, with or without its non-gene columns.
+        :param ks: The values of K to score.
+        :return: The scores, with a row for every K, or None if the data set cannot be clustered.
+        """
+        split = self.split_dataset(dataset)
+
+        if split is None:
+            return None
+
+        genes, _ = split
+
+        if max(ks) > genes.shape[0]:
+            print(error(f"K cannot be larger than the number of rows ({genes.shape[0]})."))
+            return None
+
+        references = self.config.get('gap_references')
+
+        print(info(f"Scoring {len(ks)} values of K against {references} reference data sets..."))
+
+        start = perf_counter()
+
+        report, suggestions = select_k(
+            genes,
+            ks,
+            workers=self.config.get('kmeans_workers'),
+            dtype=self.config.get('kmeans_dtype'),
+            references=references
+        )
+
+        print(info(f"Scored {len(report)} values of K in {format(perf_counter() - start, '.2f')} s:"))
+        print(report.round(4).to_string())
+
+        for score, k in suggestions.items():
+            print(success(f"{score} suggests K = {k}"))
+
+        # Keep the curve next to the data set so it can be plotted
+        name = self.data_driver.get_dataset_name(dataset) or "Latest"
+        scores = report.reset_index()
+
+        self.data_driver.data_cache.set(f"KSelection/{name}", scores)
+        print(info(f"Saved the scores as data set KSelection/{name}"))
+
+        return scores
+
+    def run_predict(self):
+        """
+        Labels a data set, such as the sagittal voxels or a thresholded subset
+        of voxels, with the clusters fitted on another data set, without
+        fitting KMeans again.
+        """
+        print(info("Running the KMeans predict engine."))
+
+        while True:
+            print(info("Choose the data set the clusters were fitted on."))
+            fitted = self.data_driver.retrieve_dataset()
+
+            if fitted is None:
+                return
+
+            k = get_int_input("Enter the K of the clusters to label with: ")
+
+            print(info("Choose the data set to label."))
+            dataset = self.data_driver.retrieve_dataset()
+
+            if dataset is None:
+                continue
+
+            new_data = self.predict_dataset(fitted, dataset, k)
+
+            if new_data is not None:
+                print(new_data.head())
+
+                self.data_driver.ask_to_save_data_in_memory(new_data)
+
+            predict_more = get_yes_no_input("Would you like to label more data with fitted clusters?")
+
+            if not predict_more:
+                return
+
+    def get_centers(self, dataset: DataFrame, k: int) -> DataFrame | None:
+        """
+        Gets the centers of the clusters of a K fitted on a data set. They are
+        taken from the model store, or else computed from the Cluster_K column
+        of the data set as the mean of every cluster.
+
+        :param dataset: The data set the clusters were fitted on.
+        :param k:
+        :return: The centers, one row per cluster and one column per gene, or None if there are none.
+        """
+        split = self.split_dataset(dataset)
+
+        if split is None:
+            return None
+
+        genes, removed_columns = split
+
+        store = self.data_driver.model_store
+        model = store.get(self.get_model_key(get_data_fingerprint(genes), k)) if store is not None else None
+
+        if model is not None:
+            print(info(f"Using the stored centers of K = {k}."))
+
+            return DataFrame(model["centers"], columns=genes.columns)
+
+        column = f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}"
+
+        if column not in removed_columns.columns:
+            print(error(f"No model of K = {k} is stored for this data set, and it has no {column} column."))
+            return None
+
+        print(info(f"No model of K = {k} is stored, using the means of the clusters of {column}."))
+
+        try:
+            centers = get_label_centers(genes, removed_columns[column].to_numpy(), k)
+        except ValueError as e:
+            print(error(str(e)))
+            return None
+
+        return DataFrame(centers, columns=genes.columns)
+
+    def predict_dataset(self, fitted: DataFrame, dataset: DataFrame, k: int) -> DataFrame | None:
+        """
+        Labels every row of a data set with its nearest fitted center,
+        without asking the user anything.
+
+        :param fitted: The data set the clusters were fitted on.
+        :param dataset: The data set to label, with at least the gene columns of the fitted data set.
+        :param k:
+        :return: The data set with a cluster column for K, or None if it cannot be labeled.
+        """
+        centers = self.get_centers(fitted, k)
+
+        if centers is None:
+            return None
+
+        genes, removed_columns = remove_non_gene_columns(dataset)
+
+        missing = centers.columns.difference(genes.columns)
+
+        if len(missing):
+            print(error(f"The data set is missing {len(missing)} of the gene columns the clusters were fitted on, "
+                        f"ex: {', '.join(map(str, missing[:5]))}"))
+            return None
+
+        # Only the fitted genes are compared, in the order of the centers
+        fitted_genes = genes if genes.columns.equals(centers.columns) else genes[centers.columns]
+
+        start = perf_counter()
+
+        try:
+            new_df, report = predict_kmeans(fitted_genes, centers.to_numpy(), k)
+        except ValueError as e:
+            print(error(str(e)))
+            return None
+
+        print(info(f"Labeled {len(new_df)} rows in {format(perf_counter() - start, '.2f')} s:"))
+        print(report.round(4).to_string())
+
+        return self.restore_non_gene_columns(combine_data(new_df, genes), removed_columns)
+
+    def cluster_dataset(self, dataset: DataFrame, ks: List[int]) -> DataFrame | None:
+        """
+        Clusters a data set without asking the user anything, the way run() does.
+
+        :param dataset: The data set, with or without its non-gene columns.
+        :param ks: The numbers of clusters to create.
+        :return: The data set with a cluster column for every K, or None if it cannot be clustered.
+        """
+        split = self.split_dataset(dataset)
+
+        if split is None:
+            return None
+
+        dataset, removed_columns = split
+
+        new_data = self.cluster(dataset, sorted(ks))
+
+        return self.restore_non_gene_columns(new_data, removed_columns)
+
     def cluster(self, data: DataFrame, ks: List[int]) -> DataFrame:
         """
-        Clusters the data using KMeans.
+        Clusters the data using KMeans, fitting the values of K in parallel.
+        Values of K that were already fitted on the same data, in this or an
+        earlier session, are taken from the model store.
 
         :param data: The data to cluster.
-        :param k: The number of clusters to create.
+        :param ks: The numbers of clusters to create.
         """
-        new_df = DataFrame()
-
-        for k in ks:
-            kmeans = KMeansClusterer(n_clusters=k, random_state=KMEANS_SEED)
-            labels = kmeans.fit_predict(data)
+        new_df, report = self.fit(data, ks)
 
-            new_df[f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}"] = labels
+        self.print_report(report)
 
         # Combine the data
         data = combine_data(new_df, data)
 
         return data
 
+    def get_model_key(self, fingerprint: str, k: int) -> str:
+        """
+        Gets the key of the stored model of a K fitted on the data with the
+        given fingerprint, with the configured dtype and algorithm.
+
+        :param fingerprint: See get_data_fingerprint.
+        :param k:
+        :return:
+        """
+        mini_batch_min_k = self.config.get('kmeans_mini_batch_min_k')
+
+        parameters = {
+            "k": k,
+            "dtype": self.config.get('kmeans_dtype'),
+            "mini_batch": 0 < mini_batch_min_k <= k
+        }
+
+        return get_model_key(fingerprint, "kmeans", parameters, KMEANS_SEED)
+
+    def fit(self, data: DataFrame, ks: List[int]) -> tuple[DataFrame, DataFrame]:
+        """
+        Fits KMeans for every K that is not in the model store yet, and
+        stores the new fits. Warm started sweeps depend on the other values
+        of K that were fitted with them, so they are neither read nor stored.
+
+        :param data: The data to cluster.
+        :param ks: The numbers of clusters to create.
+        :return: The cluster label columns, and the report indexed by K.
+        """
+        workers = self.config.get('kmeans_workers')
+        dtype = self.config.get('kmeans_dtype')
+        mini_batch_min_k = self.config.get('kmeans_mini_batch_min_k')
+        warm_start = self.config.get('kmeans_warm_start')
+
+        store = self.data_driver.model_store
+
+        if store is None or warm_start:
+            return sweep_kmeans(data, ks, workers, dtype, mini_batch_min_k, warm_start)
+
+        array = to_contiguous_array(data, dtype)
+        fingerprint = get_data_fingerprint(data)
+        keys = {k: self.get_model_key(fingerprint, k) for k in sorted(set(ks))}
+
+        fits = {}
+
+        for k, key in keys.items():
+            model = store.get(key)
+
+            if model is not None and len(model["labels"]) == len(data.index):
+                # Nothing was fitted this time
+                fits[k] = {**model, "seconds": 0.0}
+
+        if fits:
+            print(info(f"Reused the stored models of K = {', '.join(str(k) for k in fits)}."))
+
+        new_fits = run_kmeans_sweep(array, [k for k in keys if k not in fits], workers, mini_batch_min_k)
+
+        for k, fit in new_fits.items():
+            store.set(keys[k], fit, description={"algorithm": "kmeans", "k": k, "dtype": dtype, "rows": len(data.index)})
+
+        return get_sweep_result(data, array, {**fits, **new_fits})
+
+    @staticmethod
+    def print_report(report: DataFrame):
+        """
+        Prints the inertia, silhouette, iterations and time of every K.
+
+        :param report:
+        """
+        print(info(f"Clustered {len(report)} values of K in {format(report['Seconds'].sum(), '.2f')} s of worker time:"))
+        print(report.round({"Inertia": 1, "Silhouette": 4, "Seconds": 2}).to_string())
+
@@ -0,0 +1,333 @@
+"""
+clustering/kmeans_consensus.py
+
+This module is responsible for measuring how stable the clusters of KMeans
+are. Every K is fitted once with KMEANS_SEED, the reference labeling that
+KMeans gives, and then refitted many times with other seeds, each time on
+a random subsample of the rows. The refits run in parallel on a pool of
+processes that receive the data set once, see kmeans_sweep.py.
+
+The refits are folded in one at a time as they finish, so the labelings
+are never all kept:
+
+- The stability of a voxel is the share of the voxels of its reference
+  cluster that it stayed with, over every refit in which both were sampled.
+- The adjusted Rand index (ARI) of every refit is measured against the
+  reference and against the refit with the seed before it, so the report
+  does not depend on the order in which the refits finish.
+- The co-association matrix counts how often every pair of voxels was
+  clustered together, as a sparse matrix. It is only built if asked for,
+  and dropped once it holds more than CONSENSUS_MAX_COASSOCIATION_ENTRIES
+  pairs.
+
+"""
+
+# Imports
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from pandas import DataFrame
+from scipy.sparse import csr_matrix, hstack
+
+# Constants
+from util.constants import (
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    STABILITY_COLUMN_PREFIX,
+    KMEANS_SEED,
+    KMEANS_DTYPES,
+    CONSENSUS_RUNS,
+    CONSENSUS_SUBSAMPLE_PERCENT,
+    CONSENSUS_MAX_COASSOCIATION_ENTRIES,
+    CONSENSUS_COASSOCIATION_BATCH
+)
+
+# Utilities
+from util.data_loader import get_worker_count
+
+import drivers.clustering.kmeans_sweep as kmeans_sweep
+from drivers.clustering.kmeans_sweep import fit_k, set_worker_array, to_contiguous_array
+
+# SciKit-Learn
+from sklearn.cluster import KMeans as KMeansClusterer
+from sklearn.metrics import adjusted_rand_score
+
+
+def fit_run(k: int, seed: int, subsample_percent: int = CONSENSUS_SUBSAMPLE_PERCENT) -> tuple[int, np.ndarray, np.ndarray]:
+    """
+    Refits KMeans for a single K on a subsample of the array of the worker.
+
+    :param k: The number of clusters.
+    :param seed: The seed of the subsample and of the fit.
+    :param subsample_percent: The percentage of rows to fit on.
+    :return: K, the sampled rows, and their labels.
+    """
+
+    array = kmeans_sweep.worker_array
+    rows = np.arange(len(array))
+
+    if subsample_percent < 100:
+        size = max(k, int(len(array) * subsample_percent / 100))
+        rows = np.sort(np.random.default_rng(seed).choice(len(array), size=size, replace=False))
+
+    model = KMeansClusterer(n_clusters=k, random_state=seed, n_init=1)
+    labels = model.fit_predict(array[rows])
+
+    return k, rows, labels.astype(np.int32, copy=False)
+
+
+class ConsensusAccumulator:
+    """
+    A class that folds the refits of a single K into the stability of
+    every voxel, the ARI of every refit and the co-association matrix.
+
+    Attributes
+    ----------
+    k : int
+        The number of clusters.
+    runs : int
+        The number of refits.
+    reference : np.ndarray
+        The labels of the reference fit.
+    agreements : np.ndarray
+        For every voxel, the number of times a voxel of its reference cluster was clustered with it.
+    comparisons : np.ndarray
+        For every voxel, the number of times a voxel of its reference cluster was sampled with it.
+    reference_ari : list[float]
+        The ARI of every refit against the reference.
+    run_ari : dict[int, float]
+        By refit, the ARI of every refit against the refit with the seed before it.
+    labelings : dict[int, np.ndarray]
+        By refit, the labels of the refits that still have to be compared with a neighboring refit.
+    coassociation : csr_matrix | None
+        How many times every pair of voxels was clustered together, None if it was not asked for or is too large to keep.
+    sampled : np.ndarray
+        The number of refits every voxel was sampled in, the diagonal of the co-association matrix.
+
+    Methods
+    -------
+    add(run: int, rows: np.ndarray, labels: np.ndarray)
+        Folds in a refit.
+    get_stability() -> np.ndarray
+        Gets the stability of every voxel.
+    get_coassociation() -> csr_matrix | None
+        Gets the co-association matrix of every refit so far.
+    """
+
+    def __init__(self, k: int, runs: int, reference: np.ndarray, coassociation: bool = False):
+        self.k = k
+        self.runs = runs
+        self.reference = reference
+        self.agreements = np.zeros(len(reference), dtype=np.int64)
+        self.comparisons = np.zeros(len(reference), dtype=np.int64)
+        self.reference_ari: list[float] = []
+        self.run_ari: dict[int, float] = {}
+        self.labelings: dict[int, np.ndarray] = {}
+        self.coassociation = csr_matrix((len(reference), len(reference)), dtype=np.int32) if coassociation else None
+        self.sampled = np.zeros(len(reference), dtype=np.int64)
+
+        # The cluster memberships of the last few refits, added to the co-association matrix together
+        self.pending: list[csr_matrix] = []
+
+    def add(self, run: int, rows: np.ndarray, labels: np.ndarray):
+        """
+        Folds in a refit.
+
+        :param run: The index of the refit, from 0 to runs - 1.
+        :param rows: The rows the refit was fitted on.
+        :param labels: The labels of those rows.
+        :return:
+        """
+
+        reference = self.reference[rows]
+
+        # How many sampled voxels of every reference cluster went to every cluster of the refit
+        table = np.bincount(reference * self.k + labels, minlength=self.k * self.k).reshape(self.k, self.k)
+
+        # A voxel is not compared with itself
+        self.agreements[rows] += table[reference, labels] - 1
+        self.comparisons[rows] += table.sum(axis=1)[reference] - 1
+        self.sampled[rows] += 1
+
+        self.reference_ari.append(adjusted_rand_score(reference, labels))
+
+        run_labels = np.full(len(self.reference), -1, dtype=np.int32)
+        run_labels[rows] = labels
+        self.labelings[run] = run_labels
+
+        # Every refit is compared with the refit before it once both have finished
+        for previous, current in ((run - 1, run), (run, run + 1)):
+            if previous in self.labelings and current in self.labelings:
+                both = (self.labelings[previous] >= 0) & (self.labelings[current] >= 0)
+                self.run_ari[current] = adjusted_rand_score(
+                    self.labelings[previous][both], self.labelings[current][both]
+                )
+
+        # A refit is only kept until it was compared with both of its neighbors
+        for neighbor in (run - 1, run, run + 1):
+            if neighbor in self.labelings \
+                    and (neighbor == 0 or neighbor in self.run_ari) \
+                    and (neighbor == self.runs - 1 or neighbor + 1 in self.run_ari):
+                del self.labelings[neighbor]
+
+        if self.coassociation is not None:
+            self.pending.append(csr_matrix(
+                (np.ones(len(rows), dtype=np.int32), (rows, labels)),
+                shape=(len(self.reference), self.k)
+            ))
+
+            if len(self.pending) >= CONSENSUS_COASSOCIATION_BATCH:
+                self.add_pending()
+
+    def add_pending(self):
+        """
+        Adds the pending refits to the co-association matrix. Side by side,
+        their memberships give the sum of their co-associations in a single
+        product, which is much faster than adding them one by one. Refits
+        pair voxels the reference does not, so the matrix is dropped once it
+        holds more than CONSENSUS_MAX_COASSOCIATION_ENTRIES pairs.
+
+        :return:
+        """
+
+        if self.pending:
+            members = hstack(self.pending).tocsr()
+            self.pending = []
+
+            coassociation = self.coassociation + members @ members.T
+            self.coassociation = coassociation if coassociation.nnz <= CONSENSUS_MAX_COASSOCIATION_ENTRIES else None
+
+    def get_coassociation(self) -> csr_matrix | None:
+        """
+        Gets how many times every pair of voxels was clustered together.
+
+        :return: The matrix, or None if it was too large to keep.
+        """
+
+        if self.coassociation is not None:
+            self.add_pending()
+
+        return self.coassociation
+
+    def get_stability(self) -> np.ndarray:
+        """
+        Gets the stability of every voxel, from 0 (it never stayed with its
+        reference cluster) to 1 (it always did). Voxels that were never
+        sampled with another voxel of their reference cluster get NaN.
+
+        :return:
+        """
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.comparisons > 0, self.agreements / self.comparisons, np.nan)
+
+
+def get_coassociation_entries(labels: np.ndarray) -> int:
+    """
+    Gets the number of voxel pairs the co-association matrix of a labeling
+    holds, at least.
+
+    :param labels:
+    :return:
+    """
+
+    return int(np.square(np.bincount(labels), dtype=np.int64).sum())
+
+
+def consensus_kmeans(data: DataFrame,
+                     ks: list[int],
+                     runs: int = CONSENSUS_RUNS,
+                     subsample_percent: int = CONSENSUS_SUBSAMPLE_PERCENT,
+                     workers: int | None = None,
+                     dtype: str = KMEANS_DTYPES[0],
+                     coassociation: bool = False) -> tuple[DataFrame, DataFrame, dict[int, csr_matrix]]:
+    """
+    Clusters a data set with KMeans for every K, and measures how stable
+    the clusters are over many refits.
+
+    :param data: The gene columns to cluster.
+    :param ks: The values of K.
+    :param runs: The number of refits of every K.
+    :param subsample_percent: The percentage of rows every refit is fitted on.
+    :param workers: The number of processes, 0 or None for one per CPU.
+    :param dtype: One of KMEANS_DTYPES.
+    :param coassociation: Whether to build the co-association matrix of every K.
+    :return: The cluster and stability columns, the report indexed by K,
+             and the co-association matrix of every K that was small enough to keep.
+    """
+
+    if runs < 1:
+        raise ValueError(f"The number of refits must be at least 1, got {runs}.")
+
+    if not 0 < subsample_percent <= 100:
+        raise ValueError(f"The subsample must be between 1 and 100 percent of the rows, got {subsample_percent}.")
+
+    ks = sorted(set(ks))
+    array = to_contiguous_array(data, dtype)
+
+    jobs = [(k, run) for k in ks for run in range(runs)]
+    workers = get_worker_count(workers, len(ks) + len(jobs))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    accumulators: dict[int, ConsensusAccumulator] = {}
+
+    def add_reference(fit: dict):
+        keep = coassociation and get_coassociation_entries(fit["labels"]) <= CONSENSUS_MAX_COASSOCIATION_ENTRIES
+        accumulators[fit["k"]] = ConsensusAccumulator(fit["k"], runs, fit["labels"], keep)
+
+    if workers == 1:
+        set_worker_array(array)
+
+        try:
+            for k in ks:
+                add_reference(fit_k(k))
+
+            for k, run in jobs:
+                k, rows, labels = fit_run(k, KMEANS_SEED + run + 1, subsample_percent)
+                accumulators[k].add(run, rows, labels)
+        finally:
+            set_worker_array(None)
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=set_worker_array,
+                                 initargs=(array, threads)) as executor:
+            # The references are needed before any refit can be folded in
+            for future in [executor.submit(fit_k, k) for k in reversed(ks)]:
+                add_reference(future.result())
+
+            futures = {
+                executor.submit(fit_run, k, KMEANS_SEED + run + 1, subsample_percent): run
+                for k, run in reversed(jobs)
+            }
+
+            for future in as_completed(futures):
+                k, rows, labels = future.result()
+                accumulators[k].add(futures[future], rows, labels)
+
+    columns = {}
+
+    for k in ks:
+        columns[f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}"] = accumulators[k].reference
+        columns[f"{STABILITY_COLUMN_PREFIX}{k}"] = accumulators[k].get_stability()
+
+    report = DataFrame(
+        [
+            {
+                "K": k,
+                "Runs": len(accumulator.reference_ari),
+                "Mean Stability": float(np.nanmean(accumulator.get_stability())),
+                "Mean ARI (Reference)": float(np.mean(accumulator.reference_ari)),
+                "Min ARI (Reference)": float(np.min(accumulator.reference_ari)),
+                "Mean ARI (Runs)": float(np.mean([accumulator.run_ari[run] for run in sorted(accumulator.run_ari)]))
+                if accumulator.run_ari else np.nan
+            }
+            for k, accumulator in accumulators.items()
+        ],
+        columns=["K", "Runs", "Mean Stability", "Mean ARI (Reference)", "Min ARI (Reference)", "Mean ARI (Runs)"]
+    ).set_index("K").sort_index()
+
+    coassociations = {k: accumulator.get_coassociation() for k, accumulator in accumulators.items()}
+
+    return DataFrame(columns, index=data.index), report, {
+        k: matrix for k, matrix in coassociations.items() if matrix is not None
+    }
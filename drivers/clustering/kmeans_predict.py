@@ -0,0 +1,129 @@
+"""
+clustering/kmeans_predict.py
+
+This module is responsible for labeling voxels with clusters that were
+already fitted, without fitting KMeans again. Every voxel gets the cluster
+of its nearest center. The distances are computed for a chunk of rows at a
+time, from the squared norms of the rows and of the centers, so labeling a
+data set costs a single pass over it and the memory stays bounded by the
+size of a chunk.
+
+"""
+
+# Imports
+import numpy as np
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+# Constants
+from util.constants import (
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    PREDICT_CHUNK_ROWS
+)
+
+
+def get_label_centers(data: DataFrame, labels: np.ndarray, k: int) -> np.ndarray:
+    """
+    Gets the mean of the rows of every cluster, the centers KMeans ends on,
+    for labelings whose fitted model is not stored.
+
+    :param data: The gene columns that were clustered.
+    :param labels: The cluster of every row, from 0 to K - 1.
+    :param k:
+    :return: The K x columns centers.
+    """
+
+    labels = np.asarray(labels)
+
+    if labels.min() < 0 or labels.max() >= k:
+        raise ValueError(f"The cluster labels must be between 0 and {k - 1}.")
+
+    sizes = np.bincount(labels, minlength=k)
+
+    if np.any(sizes == 0):
+        raise ValueError(f"Clusters {', '.join(str(c) for c in np.flatnonzero(sizes == 0))} have no rows.")
+
+    members = csr_matrix((np.ones(len(labels)), (labels, np.arange(len(labels)))), shape=(k, len(labels)))
+
+    return (members @ data.to_numpy(dtype=np.float64)) / sizes[:, None]
+
+
+def assign_to_centers(array: np.ndarray,
+                      centers: np.ndarray,
+                      chunk_rows: int = PREDICT_CHUNK_ROWS) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Assigns every row to its nearest center.
+
+    :param array: The rows, with the same columns as the centers.
+    :param centers:
+    :param chunk_rows: The number of rows whose distances are computed at once.
+    :return: The label of every row, and its distance to its center.
+    """
+
+    if array.shape[1] != centers.shape[1]:
+        raise ValueError(f"The rows have {array.shape[1]} columns, the centers {centers.shape[1]}.")
+
+    if chunk_rows < 1:
+        raise ValueError(f"The chunks must have at least 1 row, got {chunk_rows}.")
+
+    centers = np.ascontiguousarray(centers, dtype=np.float64)
+    center_norms = np.einsum("ij,ij->i", centers, centers)
+
+    labels = np.empty(len(array), dtype=np.int32)
+    distances = np.empty(len(array))
+
+    for start in range(0, len(array), chunk_rows):
+        chunk = np.asarray(array[start:start + chunk_rows], dtype=np.float64)
+
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2, the norm of x does not change which center is nearest
+        squared = center_norms - 2 * (chunk @ centers.T)
+        nearest = np.argmin(squared, axis=1)
+
+        rows = np.arange(len(chunk))
+        labels[start:start + len(chunk)] = nearest
+        distances[start:start + len(chunk)] = np.sqrt(np.maximum(
+            squared[rows, nearest] + np.einsum("ij,ij->i", chunk, chunk), 0
+        ))
+
+    return labels, distances
+
+
+def predict_kmeans(data: DataFrame,
+                   centers: np.ndarray,
+                   k: int,
+                   chunk_rows: int = PREDICT_CHUNK_ROWS) -> tuple[DataFrame, DataFrame]:
+    """
+    Labels a data set with the clusters of fitted centers.
+
+    :param data: The gene columns to label, in the order of the columns of the centers.
+    :param centers: The K x columns centers.
+    :param k:
+    :param chunk_rows: The number of rows whose distances are computed at once.
+    :return: The cluster label column, and the report indexed by cluster.
+    """
+
+    if len(centers) != k:
+        raise ValueError(f"Expected {k} centers, got {len(centers)}.")
+
+    array = data.to_numpy()
+
+    if np.isnan(array).any():
+        raise ValueError("The data set has NaN values, which cannot be labeled.")
+
+    labels, distances = assign_to_centers(array, centers, chunk_rows)
+
+    sizes = np.bincount(labels, minlength=k)
+
+    # Clusters no row went to keep NaN
+    farthest = np.full(k, np.nan)
+    np.fmax.at(farthest, labels, distances)
+
+    report = DataFrame(
+        {
+            "Voxels": sizes,
+            "Mean Distance": np.bincount(labels, weights=distances, minlength=k) / np.maximum(sizes, 1),
+            "Max Distance": farthest
+        }
+    ).rename_axis("Cluster")
+
+    return DataFrame({f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}": labels}, index=data.index), report
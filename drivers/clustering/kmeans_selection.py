@@ -0,0 +1,225 @@
+"""
+clustering/kmeans_selection.py
+
+This module is responsible for helping to choose K. The data set is
+clustered with KMeans over a range of K, and every K is scored with:
+
+- Inertia: the within-cluster sum of squares, for the elbow.
+- Silhouette: on a sample of rows whose distances are computed once.
+- Calinski-Harabasz: the between-cluster over within-cluster dispersion, higher is better.
+- Davies-Bouldin: the similarity of every cluster to its closest cluster, lower is better.
+- Gap: how much tighter the clusters are than those of uniform reference data.
+
+The fits of the data set and of the reference data sets all run in one
+pass on a pool of processes, which receive the array once, see
+kmeans_sweep.py. The scores reuse the squared norm of every row, which is
+computed once.
+
+"""
+
+# Imports
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pandas import DataFrame
+from scipy.sparse import csr_matrix
+
+# Constants
+from util.constants import (
+    KMEANS_SEED,
+    KMEANS_DTYPES,
+    GAP_REFERENCES
+)
+
+# Utilities
+from util.data_loader import get_worker_count
+
+import drivers.clustering.kmeans_sweep as kmeans_sweep
+from drivers.clustering.kmeans_sweep import (
+    fit_k,
+    set_worker_array,
+    to_contiguous_array,
+    get_silhouette_sample,
+    get_silhouette
+)
+
+# SciKit-Learn
+from sklearn.cluster import KMeans as KMeansClusterer
+
+
+def fit_reference(k: int, reference: int) -> tuple[int, int, float]:
+    """
+    Fits KMeans on a uniform reference data set drawn from the bounding box
+    of the array of the worker. Every K is fitted on the same reference data
+    sets, which are drawn from their seed again instead of being sent.
+
+    :param k: The number of clusters.
+    :param reference: The number of the reference data set.
+    :return: K, the number of the reference data set, and the log of its inertia.
+    """
+
+    array = kmeans_sweep.worker_array
+    rng = np.random.default_rng(KMEANS_SEED + reference + 1)
+
+    uniform = rng.uniform(array.min(axis=0), array.max(axis=0), size=array.shape).astype(array.dtype)
+    model = KMeansClusterer(n_clusters=k, random_state=KMEANS_SEED).fit(uniform)
+
+    return k, reference, float(np.log(model.inertia_))
+
+
+def get_cluster_scores(array: np.ndarray, row_norms: np.ndarray, labels: np.ndarray, k: int) -> tuple[float, float]:
+    """
+    Gets the Calinski-Harabasz and Davies-Bouldin scores of a labeling. The
+    squared distance of every row to its cluster mean is taken from the
+    squared norms of the rows, so the rows are only read once more.
+
+    :param array:
+    :param row_norms: The squared norm of every row.
+    :param labels:
+    :param k:
+    :return: The Calinski-Harabasz and Davies-Bouldin scores, NaN if K is 1 or K is the number of rows.
+    """
+
+    n = len(array)
+
+    if not 1 < k < n:
+        return np.nan, np.nan
+
+    members = csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(k, n))
+    sizes = np.bincount(labels, minlength=k)
+    means = (members @ array) / np.maximum(sizes, 1)[:, None]
+
+    # ||x - m||^2 = ||x||^2 - 2 x.m + ||m||^2
+    mean_norms = np.einsum("ij,ij->i", means, means)
+    squared = row_norms - 2 * np.einsum("ij,ij->i", array, means[labels]) + mean_norms[labels]
+    squared = np.maximum(squared, 0)
+
+    within = float(squared.sum())
+    overall = array.mean(axis=0)
+    total = float(row_norms.sum() - n * overall @ overall)
+
+    calinski_harabasz = np.nan if within == 0 else (total - within) * (n - k) / (within * (k - 1))
+
+    # The mean distance of the rows of every cluster to its mean
+    spread = np.bincount(labels, weights=np.sqrt(squared), minlength=k) / np.maximum(sizes, 1)
+
+    gaps = np.sqrt(np.maximum(mean_norms[:, None] - 2 * means @ means.T + mean_norms[None, :], 0))
+
+    # A cluster is not compared with itself, nor with a cluster that has the same mean, like scikit-learn
+    gaps[gaps == 0] = np.inf
+    np.fill_diagonal(gaps, np.inf)
+
+    similarity = (spread[:, None] + spread[None, :]) / gaps
+    davies_bouldin = float(np.mean(np.max(similarity, axis=1)))
+
+    return float(calinski_harabasz), davies_bouldin
+
+
+def get_suggestions(report: DataFrame) -> dict[str, int]:
+    """
+    Gets the K each score suggests.
+
+    The gap statistic suggests the smallest K whose gap is at least the gap
+    of the next K minus its standard error.
+
+    :param report:
+    :return: The suggested K of every score that could be measured.
+    """
+
+    suggestions = {}
+
+    for column, best in [("Silhouette", "max"), ("Calinski-Harabasz", "max"), ("Davies-Bouldin", "min")]:
+        scores = report[column].dropna()
+
+        if not scores.empty:
+            suggestions[column] = int(scores.idxmax() if best == "max" else scores.idxmin())
+
+    if "Gap" in report.columns:
+        gaps = report[["Gap", "Gap Error"]].dropna()
+
+        for (k, row), (_, next_row) in zip(gaps.iterrows(), gaps.iloc[1:].iterrows()):
+            if row["Gap"] >= next_row["Gap"] - next_row["Gap Error"]:
+                suggestions["Gap"] = int(k)
+                break
+
+    return suggestions
+
+
+def select_k(data: DataFrame,
+             ks: list[int],
+             workers: int | None = None,
+             dtype: str = KMEANS_DTYPES[0],
+             references: int = GAP_REFERENCES) -> tuple[DataFrame, dict[str, int]]:
+    """
+    Clusters a data set with KMeans for every K and scores every K.
+
+    :param data: The gene columns to cluster.
+    :param ks: The values of K.
+    :param workers: The number of processes, 0 or None for one per CPU.
+    :param dtype: One of KMEANS_DTYPES.
+    :param references: The number of uniform reference data sets of the gap statistic, 0 to skip it.
+    :return: The scores indexed by K, and the K each score suggests.
+    """
+
+    ks = sorted(set(ks))
+    array = to_contiguous_array(data, dtype)
+
+    reference_jobs = [(k, reference) for k in ks for reference in range(references)]
+    workers = get_worker_count(workers, len(ks) + len(reference_jobs))
+
+    reference_inertia = {k: np.empty(references) for k in ks}
+
+    if workers == 1:
+        set_worker_array(array)
+
+        try:
+            fits = {k: fit_k(k) for k in ks}
+            references_done = [fit_reference(k, reference) for k, reference in reference_jobs]
+        finally:
+            set_worker_array(None)
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=set_worker_array,
+                                 initargs=(array, threads)) as executor:
+            # The largest K take the longest, so they are started first
+            fit_futures = {k: executor.submit(fit_k, k) for k in reversed(ks)}
+            reference_futures = [executor.submit(fit_reference, k, reference) for k, reference in reversed(reference_jobs)]
+
+            fits = {k: fit_futures[k].result() for k in ks}
+            references_done = [future.result() for future in reference_futures]
+
+    for k, reference, log_inertia in references_done:
+        reference_inertia[k][reference] = log_inertia
+
+    rows, distances = get_silhouette_sample(array)
+    row_norms = np.einsum("ij,ij->i", array, array, dtype=np.float64)
+    array64 = array.astype(np.float64, copy=False)
+
+    report = []
+
+    for k in ks:
+        fit = fits[k]
+        calinski_harabasz, davies_bouldin = get_cluster_scores(array64, row_norms, fit["labels"], k)
+
+        scores = {
+            "K": k,
+            "Inertia": fit["inertia"],
+            "Silhouette": get_silhouette(distances, fit["labels"][rows]),
+            "Calinski-Harabasz": calinski_harabasz,
+            "Davies-Bouldin": davies_bouldin
+        }
+
+        if references:
+            log_inertia = reference_inertia[k]
+
+            scores["Gap"] = float(log_inertia.mean() - np.log(fit["inertia"])) if fit["inertia"] > 0 else np.nan
+            scores["Gap Error"] = float(log_inertia.std() * np.sqrt(1 + 1 / references))
+
+        report.append(scores)
+
+    report = DataFrame(report).set_index("K")
+
+    return report, get_suggestions(report)
@@ -0,0 +1,155 @@
+"""
+clustering/kmeans_streaming.py
+
+This module is responsible for clustering csv files that are too large to
+fit in memory. The file is streamed one chunk of rows at a time, see
+util/streaming.py, and read twice:
+
+1. Every chunk is fed to a MiniBatchKMeans for every K with partial_fit.
+2. Every chunk is labeled by every model and written straight to disk
+   with a Cluster_K column for every K.
+
+Memory is bounded by the size of a chunk, and the time grows linearly
+with the number of rows.
+
+"""
+
+# Imports
+from time import perf_counter
+from typing import Iterator
+
+import numpy as np
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    KMEANS_SEED,
+    KMEANS_BATCH_SIZE
+)
+
+# Utilities
+from util.streaming import StreamingDataset, write_csv_chunks
+
+# SciKit-Learn
+from sklearn.cluster import MiniBatchKMeans
+
+
+def get_batches(array: np.ndarray, batch_size: int = KMEANS_BATCH_SIZE) -> Iterator[np.ndarray]:
+    """
+    Splits the rows of a chunk into mini-batches.
+
+    :param array:
+    :param batch_size:
+    :return:
+    """
+
+    for start in range(0, len(array), batch_size):
+        yield array[start:start + batch_size]
+
+
+def fit_streaming_kmeans(dataset: StreamingDataset,
+                         ks: list[int],
+                         gene_columns: list[str],
+                         passes: int = 1,
+                         batch_size: int = KMEANS_BATCH_SIZE) -> dict[int, MiniBatchKMeans]:
+    """
+    Fits a MiniBatchKMeans for every K, one mini-batch at a time.
+
+    :param dataset:
+    :param ks: The values of K.
+    :param gene_columns: The columns to cluster.
+    :param passes: The number of times the file is read.
+    :param batch_size: The number of rows in each mini-batch.
+    :return: The model of every K.
+    """
+
+    models = {
+        k: MiniBatchKMeans(n_clusters=k, random_state=KMEANS_SEED, batch_size=batch_size)
+        for k in ks
+    }
+
+    # The first mini-batch seeds the clusters, so rows are held back until there are at least K of them
+    held_back: list[np.ndarray] | None = []
+    held_back_rows = 0
+
+    for _ in range(passes):
+        for chunk in dataset.chunks(gene_columns):
+            array = np.ascontiguousarray(chunk[gene_columns].to_numpy(dtype=np.float64))
+
+            for batch in get_batches(array, batch_size):
+                if held_back is not None:
+                    held_back.append(batch)
+                    held_back_rows += len(batch)
+
+                    if held_back_rows < max(ks):
+                        continue
+
+                    batch = np.vstack(held_back)
+                    held_back = None
+
+                for model in models.values():
+                    model.partial_fit(batch)
+
+    if held_back is not None:
+        raise ValueError(f"The file has {held_back_rows} rows, fewer than K = {max(ks)}.")
+
+    return models
+
+
+def stream_kmeans(dataset: StreamingDataset,
+                  ks: list[int],
+                  out_path: str,
+                  passes: int = 1,
+                  batch_size: int = KMEANS_BATCH_SIZE) -> DataFrame:
+    """
+    Clusters a csv file with MiniBatchKMeans for every K without loading it,
+    and writes it to a csv file with a cluster column for every K.
+
+    :param dataset:
+    :param ks: The values of K.
+    :param out_path: The csv file to write the clustered rows to.
+    :param passes: The number of times the file is read to fit the models.
+    :param batch_size: The number of rows in each mini-batch.
+    :return: The inertia of every K over the whole file, and the time it took.
+    """
+
+    ks = sorted(set(ks))
+    gene_columns = dataset.get_gene_columns()
+    gene_set = set(gene_columns)
+
+    start = perf_counter()
+    models = fit_streaming_kmeans(dataset, ks, gene_columns, passes, batch_size)
+    fit_seconds = perf_counter() - start
+
+    inertia = {k: 0.0 for k in ks}
+
+    def label(chunk: DataFrame) -> DataFrame:
+        array = np.ascontiguousarray(chunk[gene_columns].to_numpy(dtype=np.float64))
+        labels = {}
+
+        for k, model in models.items():
+            distances = model.transform(array)
+            closest = distances.argmin(axis=1)
+
+            labels[f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}"] = closest.astype(np.int32)
+            inertia[k] += float(np.square(distances[np.arange(len(array)), closest]).sum())
+
+        # Same layout as an in-memory run: non-gene columns, cluster columns, genes
+        return DataFrame({
+            **{column: chunk[column] for column in chunk.columns if column not in gene_set},
+            **labels,
+            **{column: chunk[column] for column in gene_columns}
+        }, index=chunk.index)
+
+    start = perf_counter()
+    rows = write_csv_chunks((label(chunk) for chunk in dataset.chunks()), out_path)
+    label_seconds = perf_counter() - start
+
+    return DataFrame({
+        "K": ks,
+        "Inertia": [inertia[k] for k in ks],
+        "Rows": rows,
+        "Fit Seconds": fit_seconds,
+        "Label Seconds": label_seconds
+    }).set_index("K")
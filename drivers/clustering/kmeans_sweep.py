@@ -0,0 +1,278 @@
+"""
+clustering/kmeans_sweep.py
+
+This module is responsible for clustering a data set with KMeans for many
+values of K at once. The data set is converted to a contiguous array a
+single time, and the values of K are fitted in parallel on a pool of
+processes, each of which receives the array once.
+
+"""
+
+# Imports
+import os
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import numpy as np
+from pandas import DataFrame
+
+from threadpoolctl import threadpool_limits
+
+# Constants
+from util.constants import (
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    KMEANS_SEED,
+    KMEANS_DTYPES,
+    SILHOUETTE_SAMPLE_SIZE
+)
+
+# Utilities
+from util.data_loader import get_worker_count
+
+# SciKit-Learn
+from sklearn.cluster import KMeans as KMeansClusterer, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances, silhouette_score
+
+# The array that the fits of this process run on, set once per worker
+worker_array: Optional[np.ndarray] = None
+
+
+def to_contiguous_array(data: DataFrame, dtype: str = KMEANS_DTYPES[0]) -> np.ndarray:
+    """
+    Converts a data set to a C-contiguous array, the layout KMeans works on.
+
+    :param data:
+    :param dtype: One of KMEANS_DTYPES.
+    :return:
+    """
+
+    if dtype not in KMEANS_DTYPES:
+        raise ValueError(f"Invalid dtype: {dtype}. Expected one of {KMEANS_DTYPES}")
+
+    return np.ascontiguousarray(data.to_numpy(dtype=dtype))
+
+
+def set_worker_array(array: np.ndarray | None, threads: int | None = None):
+    """
+    Stores the array in a worker, and limits the number of threads the fits
+    of the worker use so that the workers do not fight over the cores.
+
+    :param array:
+    :param threads: The number of threads, None to leave it as it is.
+    :return:
+    """
+
+    global worker_array
+    worker_array = array
+
+    if threads:
+        threadpool_limits(limits=threads)
+
+
+def fit_k(k: int, mini_batch: bool = False, init: Optional[np.ndarray] = None) -> dict:
+    """
+    Fits KMeans for a single K on the array of the worker.
+
+    :param k: The number of clusters.
+    :param mini_batch: Whether to fit with MiniBatchKMeans.
+    :param init: The starting centers, None to use k-means++.
+    :return: The labels, centers, inertia, iterations and the time it took.
+    """
+
+    start = perf_counter()
+
+    options = {"n_clusters": k, "random_state": KMEANS_SEED}
+
+    if init is not None:
+        options.update(init=init, n_init=1)
+
+    model = MiniBatchKMeans(**options) if mini_batch else KMeansClusterer(**options)
+    labels = model.fit_predict(worker_array)
+
+    return {
+        "k": k,
+        "labels": labels.astype(np.int32, copy=False),
+        "centers": model.cluster_centers_,
+        "inertia": float(model.inertia_),
+        "iterations": int(model.n_iter_),
+        "algorithm": "MiniBatchKMeans" if mini_batch else "KMeans",
+        "seconds": perf_counter() - start
+    }
+
+
+def grow_centers(array: np.ndarray, fit: dict, k: int) -> np.ndarray:
+    """
+    Adds centers to a fit until there are k of them, to warm start the
+    next K. Each new center is the point farthest from every center
+    so far, the way k-means++ would pick it without the randomness.
+
+    :param array:
+    :param fit: The fit of a smaller K.
+    :param k:
+    :return:
+    """
+
+    centers = list(fit["centers"].astype(array.dtype))
+    distances = np.linalg.norm(array - fit["centers"].astype(array.dtype)[fit["labels"]], axis=1)
+
+    while len(centers) < k:
+        farthest = int(np.argmax(distances))
+        centers.append(array[farthest])
+        distances = np.minimum(distances, np.linalg.norm(array - array[farthest], axis=1))
+
+    return np.vstack(centers)
+
+
+def get_silhouette_sample(array: np.ndarray, sample_size: int = SILHOUETTE_SAMPLE_SIZE) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Picks the rows the silhouette is measured on and computes their pairwise
+    distances, once for every K of the sweep.
+
+    :param array:
+    :param sample_size: The largest number of rows to measure.
+    :return: The sampled rows and their distance matrix.
+    """
+
+    rows = np.arange(len(array))
+
+    if len(array) > sample_size:
+        rows = np.sort(np.random.default_rng(KMEANS_SEED).choice(len(array), size=sample_size, replace=False))
+
+    return rows, pairwise_distances(array[rows])
+
+
+def get_silhouette(distances: np.ndarray, labels: np.ndarray) -> float:
+    """
+    Gets the silhouette score of a labeling from precomputed distances.
+
+    :param distances:
+    :param labels: The labels of the sampled rows.
+    :return: The score, or NaN if the labeling has a single cluster or one per row.
+    """
+
+    if not 1 < len(np.unique(labels)) < len(labels):
+        return float("nan")
+
+    return float(silhouette_score(distances, labels, metric="precomputed"))
+
+
+def run_kmeans_sweep(array: np.ndarray,
+                     ks: list[int],
+                     workers: int | None = None,
+                     mini_batch_min_k: int = 0,
+                     warm_start: bool = False) -> dict[int, dict]:
+    """
+    Fits KMeans for every K.
+
+    By default every K is fitted from scratch, in parallel, which gives the
+    same labels as fitting them one by one. With warm_start the values of K
+    are fitted in increasing order in this process, and each fit starts from
+    the centers of the previous one, which converges in fewer iterations but
+    can settle on different clusters.
+
+    :param array: A contiguous array, see to_contiguous_array.
+    :param ks: The values of K.
+    :param workers: The number of processes, 0 or None for one per CPU.
+    :param mini_batch_min_k: The smallest K fitted with MiniBatchKMeans, 0 to never use it.
+    :param warm_start:
+    :return: The fit of every K.
+    """
+
+    ks = sorted(set(ks))
+
+    def is_mini_batch(k: int) -> bool:
+        return 0 < mini_batch_min_k <= k
+
+    if not ks:
+        return {}
+
+    workers = get_worker_count(workers, len(ks))
+
+    if warm_start or workers == 1:
+        set_worker_array(array)
+
+        fits = {}
+        previous = None
+
+        try:
+            for k in ks:
+                init = grow_centers(array, previous, k) if warm_start and previous is not None else None
+                fits[k] = previous = fit_k(k, is_mini_batch(k), init)
+        finally:
+            # Do not keep the array alive once the sweep is done
+            set_worker_array(None)
+
+        return fits
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=set_worker_array,
+                             initargs=(array, threads)) as executor:
+        # The largest K take the longest, so they are started first
+        futures = {k: executor.submit(fit_k, k, is_mini_batch(k)) for k in reversed(ks)}
+
+        return {k: futures[k].result() for k in ks}
+
+
+def sweep_kmeans(data: DataFrame,
+                 ks: list[int],
+                 workers: int | None = None,
+                 dtype: str = KMEANS_DTYPES[0],
+                 mini_batch_min_k: int = 0,
+                 warm_start: bool = False) -> tuple[DataFrame, DataFrame]:
+    """
+    Clusters a data set with KMeans for every K, and reports the inertia,
+    silhouette, iterations and time of each K.
+
+    :param data: The gene columns to cluster.
+    :param ks: The values of K.
+    :param workers: The number of processes, 0 or None for one per CPU.
+    :param dtype: One of KMEANS_DTYPES. float32 halves the memory and is faster,
+                  but the labels can differ slightly from float64.
+    :param mini_batch_min_k: The smallest K fitted with MiniBatchKMeans, 0 to never use it.
+    :param warm_start: Whether each K starts from the centers of the previous K.
+    :return: The cluster label columns, and the report indexed by K.
+    """
+
+    array = to_contiguous_array(data, dtype)
+    fits = run_kmeans_sweep(array, ks, workers, mini_batch_min_k, warm_start)
+
+    return get_sweep_result(data, array, fits)
+
+
+def get_sweep_result(data: DataFrame, array: np.ndarray, fits: dict[int, dict]) -> tuple[DataFrame, DataFrame]:
+    """
+    Gets the cluster label columns and the report of the fits of a sweep.
+
+    :param data: The gene columns that were clustered.
+    :param array: The array the fits ran on, see to_contiguous_array.
+    :param fits: The fit of every K, see fit_k.
+    :return: The cluster label columns, and the report indexed by K.
+    """
+
+    fits = dict(sorted(fits.items()))
+    rows, distances = get_silhouette_sample(array)
+
+    labels = DataFrame(
+        {f"{CLUSTER_LABEL_COLUMN_PREFIX}{k}": fit["labels"] for k, fit in fits.items()},
+        index=data.index
+    )
+
+    report = DataFrame(
+        [
+            {
+                "K": k,
+                "Inertia": fit["inertia"],
+                "Silhouette": get_silhouette(distances, fit["labels"][rows]),
+                "Iterations": fit["iterations"],
+                "Algorithm": fit["algorithm"],
+                "Seconds": fit["seconds"]
+            }
+            for k, fit in fits.items()
+        ],
+        columns=["K", "Inertia", "Silhouette", "Iterations", "Algorithm", "Seconds"]
+    ).set_index("K")
+
+    return labels, report
@@ -7,8 +7,6 @@ application.
 """
 
 # Imports
-from time import sleep
-
 from drivers.main import Driver
 
 # Constants
@@ -28,6 +26,7 @@ from util.print import (
 )
 
 from drivers.clustering.kmeans import KMeans
+from drivers.clustering.hac import HAC
 from drivers.clustering.pca import PCA
 
 class Clustering:
@@ -40,8 +39,6 @@ class Clustering:
 
         print(info("Initializing the Clusterer..."))
 
-        sleep(1)
-
         print(success("Clusterer initialized."))
 
     def run(self):
@@ -52,10 +49,36 @@ class Clustering:
             kmeans.run()
             print(success("KMeans finished."))
 
+        def streaming_kmeans():
+            kmeans = KMeans(self)
+            kmeans.run_streaming()
+            print(success("Streaming KMeans finished."))
+
+        def kmeans_selection():
+            kmeans = KMeans(self)
+            kmeans.run_selection()
+            print(success("K selection finished."))
+
+        def kmeans_stability():
+            kmeans = KMeans(self)
+            kmeans.run_consensus()
+            print(success("KMeans stability finished."))
+
+        def kmeans_predict():
+            kmeans = KMeans(self)
+            kmeans.run_predict()
+            print(success("KMeans predict finished."))
+
         def hac():
-            print(info("Running HAC..."))
+            hac = HAC(self)
+            hac.run()
             print(success("HAC finished."))
 
+        def spatial_hac():
+            hac = HAC(self, spatial=True)
+            hac.run()
+            print(success("Spatial HAC finished."))
+
         def pca():
             pca = PCA(self)
             pca.run()
@@ -63,7 +86,12 @@ class Clustering:
 
         actions = {
             "KMeans": kmeans,
+            "Streaming KMeans (files too large for memory)": streaming_kmeans,
+            "KMeans stability (refit every K many times)": kmeans_stability,
+            "Choose K (elbow, silhouette, gap)": kmeans_selection,
+            "KMeans predict (label new voxels with fitted clusters)": kmeans_predict,
             "HAC": hac,
+            "Spatial HAC (contiguous voxel clusters)": spatial_hac,
             "PCA": pca
         }
 
@@ -16,20 +16,23 @@ from drivers.clustering.clusterer import Clusterer
 from util.constants import (
     CAN_CLUSTER,
     CLUSTER_LABEL_COLUMN_PREFIX,
-    KMEANS_SEED
+    KMEANS_SEED,
+    PCA_SOLVERS
 )
 
 # Utilities
 from util.input import get_choice_input, get_comma_separated_int_input, get_yes_no_input
 
 from util.data import (
-    get_data_properties,
+    get_data_fingerprint,
     remove_non_gene_columns,
     combine_data,
     has_1465_rows
 )
 
-from sklearn.decomposition import PCA as PCAComponent
+from util.model_store import get_model_key
+
+from sklearn.decomposition import PCA as PCAComponent, IncrementalPCA
 
 from util.print import (
     error,
@@ -76,15 +79,15 @@ class PCA(Clusterer):
                 return
 
             # Strip the dataset of non-genetic columns
-            dataset, removed_columns = remove_non_gene_columns(dataset)
+            genes, removed_columns = remove_non_gene_columns(dataset)
 
-            properties = get_data_properties(dataset)
+            properties = self.data_driver.get_data_properties(dataset, list(genes.columns))
 
             if not properties[CAN_CLUSTER]:
                 print(error("This dataset cannot be clustered."))
                 continue
 
-            new_data = self.cluster(dataset)
+            new_data = self.cluster(genes)
 
             print(new_data)
 
@@ -97,31 +100,13 @@ class PCA(Clusterer):
 
     def cluster(self, data: DataFrame) -> DataFrame:
         """
-        Clusters the data using KMeans.
+        Decomposes the data using PCA.
 
-        :param data: The data to cluster.
-        :param k: The number of clusters to create.
+        :param data: The data to decompose.
         """
-        new_df = DataFrame()
-
-        num_components = min(data.shape[0], data.shape[1])
-
-        # perform PCA
-        pca = PCAComponent(n_components=num_components)
-        pca.fit(data)
+        df, df_loadings = self.get_decomposition(data)
 
-        # create a new DataFrame with the PCA data
-
-        expl_var = pca.explained_variance_ratio_
-
-        df = DataFrame(
-            data=zip(range(1, len(expl_var) + 1), expl_var, expl_var.cumsum()),
-            columns=['PCA', 'Explained Variance (%)', 'Total Explained Variance (%)']
-        ).set_index('PCA').mul(100).round(1)
-
-        loadings = pca.components_.T * np.sqrt(pca.explained_variance_)
-
-        df_loadings = DataFrame(loadings, columns=[f'PC{i}' for i in range(1, num_components + 1)], index=data.columns)
+        num_components = len(df)
 
         print("LOADINGS:")
         print(df_loadings)
@@ -129,7 +114,7 @@ class PCA(Clusterer):
         # get the first 10 rows for the first 20 components
         top20df = DataFrame()
 
-        for i in range(1, 21):
+        for i in range(1, min(20, num_components) + 1):
             print(f"PC{i}")
 
             loading = df_loadings[f'PC{i}'].sort_values(ascending=False).to_frame()
@@ -166,3 +151,98 @@ class PCA(Clusterer):
             self.data_driver.ask_to_save_data_in_memory(one_pc)
 
         return df_loadings
+
+    def get_decomposition(self, data: DataFrame) -> tuple[DataFrame, DataFrame]:
+        """
+        Gets the PCA decomposition of the data, fitting it only the first time
+        the data is decomposed with the configured solver and component count.
+        Decompositions are kept in the model store, so later sessions reuse them.
+
+        :param data:
+        :return: The explained variance table and the loadings.
+        """
+        solver = self.config.get('pca_solver')
+        num_components = min(data.shape[0], data.shape[1])
+
+        if solver != "full":
+            num_components = min(num_components, self.config.get('pca_components'))
+
+        fingerprint = get_data_fingerprint(data)
+        key = f"PCA/{fingerprint}/{solver}/{num_components}"
+
+        decomposition = self.data_driver.cache.get(key)
+
+        if decomposition is not None:
+            return decomposition
+
+        # Only the randomized solver depends on the seed
+        store = self.data_driver.model_store
+        model_key = get_model_key(
+            fingerprint,
+            "pca",
+            {"solver": solver, "components": num_components},
+            KMEANS_SEED if solver == "randomized" else None
+        )
+
+        model = store.get(model_key) if store is not None else None
+
+        if model is not None:
+            print(info(f"Reused the stored {num_components} components of the {solver} solver."))
+
+            decomposition = model["variance"], model["loadings"]
+        else:
+            print(info(f"Fitting {num_components} components with the {solver} solver..."))
+
+            decomposition = decompose(data, num_components, solver)
+
+            if store is not None:
+                store.set(
+                    model_key,
+                    {"variance": decomposition[0], "loadings": decomposition[1]},
+                    description={"algorithm": "pca", "solver": solver, "components": num_components}
+                )
+
+        self.data_driver.cache.set(key, decomposition)
+
+        return decomposition
+
+
+def decompose(data: DataFrame, num_components: int, solver: str = PCA_SOLVERS[0]) -> tuple[DataFrame, DataFrame]:
+    """
+    Decomposes the data into its principal components.
+
+    The randomized solver only computes the first components, which is much
+    faster than the full SVD. The incremental solver fits the data a batch of
+    rows at a time, which bounds the memory it uses.
+
+    :param data:
+    :param num_components:
+    :param solver: One of PCA_SOLVERS.
+    :return: The explained variance table and the loadings.
+    """
+    if solver == "randomized":
+        pca = PCAComponent(n_components=num_components, svd_solver="randomized", random_state=KMEANS_SEED)
+    elif solver == "incremental":
+        pca = IncrementalPCA(n_components=num_components)
+    elif solver == "full":
+        pca = PCAComponent(n_components=num_components)
+    else:
+        raise ValueError(f"Invalid PCA solver: {solver}. Expected one of {PCA_SOLVERS}")
+
+    # Compact data sets are float32, the components are always fitted in float64
+    pca.fit(data.to_numpy(dtype=np.float64))
+
+    # create a new DataFrame with the PCA data
+
+    expl_var = pca.explained_variance_ratio_
+
+    df = DataFrame(
+        data=zip(range(1, len(expl_var) + 1), expl_var, expl_var.cumsum()),
+        columns=['PCA', 'Explained Variance (%)', 'Total Explained Variance (%)']
+    ).set_index('PCA').mul(100).round(1)
+
+    loadings = pca.components_.T * np.sqrt(pca.explained_variance_)
+
+    df_loadings = DataFrame(loadings, columns=[f'PC{i}' for i in range(1, num_components + 1)], index=data.columns)
+
+    return df, df_loadings
@@ -8,7 +8,6 @@ application.
 
 # Imports
 from pandas import DataFrame
-from time import sleep
 
 from drivers.main import Driver
 from providers.data import Data
@@ -24,7 +23,7 @@ from util.constants import (
 )
 
 # Utilities
-from util.input import user_input, get_choice_input, extract_k_value
+from util.input import user_input, get_choice_input
 
 from util.print import (
     bold,
@@ -38,8 +37,9 @@ from util.print import (
 
 from util.brainscan import brainScan
 
+from util.compositions import get_cluster_compositions, to_long_format
+
 from util.data import (
-    get_data_properties,
     get_all_cluster_id_columns
 )
 
@@ -53,8 +53,6 @@ class Quantitative:
 
         print(info("Initializing the Quantitanator..."))
 
-        sleep(1)
-
         print(success("Quantitanator initialized."))
 
     def run(self):
@@ -70,7 +68,7 @@ class Quantitative:
             if dataset is None:
                 break
 
-            properties = get_data_properties(dataset)
+            properties = self.data_driver.get_data_properties(dataset)
 
             if properties[HAS_CLUSTER_IDS] and properties[HAS_STRUCTURE_IDS]:
                 actions["Analyze cluster compositions"] = self.analyze_cluster_compositions
@@ -110,54 +108,21 @@ class Quantitative:
         for col in cluster_id_columns:
             print(f" - {col}")
 
-        # for each cluster column, count the occurrences of each cluster
-
-        new_dataframes = []
-
-        for col in cluster_id_columns:
-            # get K value
-            k = extract_k_value(col)
-
-            new_df = DataFrame()
-
-            counts = {}
-            percentages = {}
-            structure_ids = {}
-
-            new_df["Cluster"] = [i for i in range(0, k)]
-
-            for i in range(0, k):
-                count = dataset[col].value_counts().get(i, 0)
-                to_percentage = float(count / len(dataset))
-
-                counts[i] = count
-                percentages[i] = to_percentage
-
-                new_structure_ids = {}
-
-                for sid in STRUCTURE_IDS:
-                    new_structure_ids[sid] = 0
-
-                # Get the number of structure ids in the cluster
-                structure_id_list = dataset[dataset[col] == i][STRUCTURE_IDS_COLUMN].values
-                # each structure id should have a column in the new dataset with the count of the structure id
-                for structure_id in structure_id_list:
-                    new_structure_ids[structure_id] += 1
-
-                structure_ids[i] = new_structure_ids
-
-            new_df["Count"] = counts.values()
-            new_df["Percentage"] = percentages.values()
-
-            for sid in STRUCTURE_IDS:
-                new_df[STRUCTURE_ID_ABBREVIATIONS[sid]] = [structure_ids[i][sid] for i in range(0, k)]
-
-            new_dataframes.append(new_df)
+        # Every cluster column is counted in a single pass
+        compositions = get_cluster_compositions(dataset)
 
+        for k, new_df in compositions.items():
             print(f"Composition for K = {k}")
             print(new_df.head())
 
             self.data_driver.ask_to_save_data_in_memory(new_df)
 
+        print(info("All compositions in one table (one row per K, cluster and Structure-ID):"))
+
+        long_df = to_long_format(compositions)
+        print(long_df.head())
+
+        self.data_driver.ask_to_save_data_in_memory(long_df)
+
         print(success("Cluster compositions analyzed."))
 
@@ -7,8 +7,6 @@ application.
 """
 
 # Imports
-from time import sleep
-
 from drivers.main import Driver
 
 # Constants
@@ -40,8 +38,6 @@ class Visualizer:
 
     def init(self):
         print(info("Initializing the visualizer..."))
-        
-        sleep(1)
         self.engine = self.config.get('visualization_engine')
         
         print(success(f"Visualizer initialized with {underline(self.engine)}."))
@@ -25,10 +25,6 @@ from util.constants import (
 from util.input import user_input, get_choice_input, get_comma_separated_int_input, get_yes_no_input, get_formatted_input, get_text_input_with_back
 from util.colors import generate_k_distinct_colors
 
-from util.data import (
-    get_data_properties,
-)
-
 from util.print import (
     bold,
     primary,
@@ -137,7 +133,7 @@ class Matplotlib(Visualizer):
             if dataset is None:
                 return
 
-            properties = get_data_properties(dataset)
+            properties = self.data_driver.get_data_properties(dataset)
 
             if properties[HAS_XYZ]:
                 actions["Plot XYZ Coordinates"] = self.plot_xyz_coordinates
@@ -23,10 +23,6 @@ from util.constants import (
 from util.input import user_input, get_choice_input, get_comma_separated_int_input, get_yes_no_input
 from util.colors import generate_k_distinct_colors
 
-from util.data import (
-    get_data_properties,
-)
-
 from util.print import (
     bold,
     primary,
@@ -81,7 +77,7 @@ class Plotly(Visualizer):
             if dataset is None:
                 return
 
-            properties = get_data_properties(dataset)
+            properties = self.data_driver.get_data_properties(dataset)
 
             if not properties[HAS_XYZ]:
                 print(error("This dataset does not have XYZ coordinates."))
@@ -14,12 +14,25 @@ import json
 from util.input import (
     get_choice_input,
     get_yes_no_input,
-    get_text_input
+    get_text_input,
+    get_int_input
 )
 
 # Constants
 from util.constants import (
     VISUALIZATION_ENGINES,
+    LOADER_POOL_TYPES,
+    EVICTION_POLICIES,
+    MODEL_STORE_MAX_MEGABYTES,
+    KMEANS_DTYPES,
+    GAP_REFERENCES,
+    CONSENSUS_RUNS,
+    CONSENSUS_SUBSAMPLE_PERCENT,
+    PCA_SOLVERS,
+    PCA_COMPONENTS,
+    HAC_LINKAGES,
+    SPATIAL_ADJACENCIES,
+    SPATIAL_NEIGHBORS,
     CONFIG_FILE,
     SAVE_GENERATED_DATA_PATH
 )
@@ -66,15 +79,143 @@ CONFIGURATIONS: dict[
         "message": "Would you like to load generated data at startup? ",
         "type": "yes_no",
         "default": False
+    },
+    "lazy_load_datasets": {
+        "message": "Would you like to load data sets only when they are first used? ",
+        "type": "yes_no",
+        "default": True
+    },
+    "compact_dtypes": {
+        "message": "Would you like to load data sets with float32 genes and small integer labels to halve their memory? ",
+        "type": "yes_no",
+        "default": False,
+        "advanced": True
+    },
+    "loader_workers": {
+        "message": "How many workers should load data sets at startup (0 for one per CPU)? ",
+        "type": "int",
+        "default": 0,
+        "advanced": True
+    },
+    "loader_pool_type": {
+        "message": "Which kind of worker pool should load data sets at startup? ",
+        "type": "list",
+        "choices": LOADER_POOL_TYPES,
+        "default": LOADER_POOL_TYPES[0],
+        "advanced": True
+    },
+    "cache_max_megabytes": {
+        "message": "How many megabytes of data sets may be kept in memory (0 for no limit)? ",
+        "type": "int",
+        "default": 0,
+        "advanced": True
+    },
+    "cache_eviction_policy": {
+        "message": "Which data sets should be evicted first when the limit is reached? ",
+        "type": "list",
+        "choices": EVICTION_POLICIES,
+        "default": EVICTION_POLICIES[0],
+        "advanced": True
+    },
+    "persist_models": {
+        "message": "Would you like to keep fitted KMeans and PCA models on disk to reuse them in later sessions? ",
+        "type": "yes_no",
+        "default": True,
+        "advanced": True
+    },
+    "model_store_max_megabytes": {
+        "message": "How many megabytes of fitted models may be kept on disk (0 for no limit)? ",
+        "type": "int",
+        "default": MODEL_STORE_MAX_MEGABYTES,
+        "advanced": True
+    },
+    "kmeans_workers": {
+        "message": "How many processes should fit KMeans for different values of K (0 for one per CPU)? ",
+        "type": "int",
+        "default": 0,
+        "advanced": True
+    },
+    "kmeans_dtype": {
+        "message": "Which precision should KMeans cluster with? ",
+        "type": "list",
+        "choices": KMEANS_DTYPES,
+        "default": KMEANS_DTYPES[0],
+        "advanced": True
+    },
+    "kmeans_mini_batch_min_k": {
+        "message": "From which K should KMeans use mini-batches (0 to never use them)? ",
+        "type": "int",
+        "default": 0,
+        "advanced": True
+    },
+    "kmeans_warm_start": {
+        "message": "Should each K of KMeans start from the clusters of the previous K? ",
+        "type": "yes_no",
+        "default": False,
+        "advanced": True
+    },
+    "gap_references": {
+        "message": "How many reference data sets should the gap statistic of every K be measured against (0 to skip it)? ",
+        "type": "int",
+        "default": GAP_REFERENCES,
+        "advanced": True
+    },
+    "consensus_runs": {
+        "message": "How many times should every K be refitted to measure the stability of KMeans? ",
+        "type": "int",
+        "default": CONSENSUS_RUNS,
+        "advanced": True
+    },
+    "consensus_subsample_percent": {
+        "message": "On what percentage of the rows should every refit be fitted (100 to only change the seed)? ",
+        "type": "int",
+        "default": CONSENSUS_SUBSAMPLE_PERCENT,
+        "advanced": True
+    },
+    "pca_solver": {
+        "message": "How should PCA decompose data sets (full computes every component)? ",
+        "type": "list",
+        "choices": PCA_SOLVERS,
+        "default": PCA_SOLVERS[0],
+        "advanced": True
+    },
+    "pca_components": {
+        "message": "How many components should PCA compute? ",
+        "type": "int",
+        "default": PCA_COMPONENTS,
+        "advanced": True
+    },
+    "hac_linkage": {
+        "message": "How should HAC measure the distance between clusters? ",
+        "type": "list",
+        "choices": HAC_LINKAGES,
+        "default": HAC_LINKAGES[0],
+        "advanced": True
+    },
+    "spatial_adjacency": {
+        "message": "How should spatial clustering connect voxels (grid for the 6 face neighbors)? ",
+        "type": "list",
+        "choices": SPATIAL_ADJACENCIES,
+        "default": SPATIAL_ADJACENCIES[0],
+        "advanced": True
+    },
+    "spatial_neighbors": {
+        "message": "How many nearest voxels should every voxel be connected to with knn? ",
+        "type": "int",
+        "default": SPATIAL_NEIGHBORS,
+        "advanced": True
     }
 }
 
 
 class Config:
-    def __init__(self, config_file: str = CONFIG_FILE):
+    def __init__(self, config_file: str = CONFIG_FILE, interactive: bool = True):
         self.configs = {}
         self.config_file: str = config_file
 
+        # Without a user to ask, a missing configuration file falls back to the defaults
+        self.interactive = interactive
+
         self.loaded = False
         self.changed = False
 
@@ -83,9 +224,14 @@ class Config:
     def init(self):
         print(info("Initializing the configuration..."))
 
-        if not Config.config_exists():
+        if not self.config_exists():
             print(warning("No configuration file found."))
-            self.create_config_file()
+
+            if self.interactive:
+                self.create_config_file()
+            else:
+                self.configs = {key: value["default"] for key, value in CONFIGURATIONS.items()}
+                print(info("Using the default configuration."))
         else:
             # Load the configuration file to get the settings
             self.load_config_file()
@@ -95,17 +241,29 @@ class Config:
 
     def create_config_file(self):
         default_config = {}
+        configure_advanced = None
 
         for key, value in CONFIGURATIONS.items():
             if key not in default_config:
                 default_config[key] = value["default"]
 
+            # Advanced configurations keep their defaults unless the user opts in
+            if value.get("advanced"):
+                if configure_advanced is None:
+                    configure_advanced = get_yes_no_input("Would you like to change the advanced (performance) settings? ")
+
+                if not configure_advanced:
+                    continue
+
             if value["type"] == "text":
                 default_config[key] = get_text_input(value["message"], default=value["default"])
 
             elif value["type"] == "yes_no":
                 default_config[key] = get_yes_no_input(value["message"])
 
+            elif value["type"] == "int":
+                default_config[key] = get_int_input(value["message"], default=value["default"])
+
             elif value["type"] == "list":
                 default_config[key] = get_choice_input(
                     value["message"],
@@ -124,6 +282,11 @@ class Config:
             self.configs = json.load(f)
 
     def get(self, key, default=None):
+        # Fall back to the default of the configuration so that
+        # configuration files from older versions keep working
+        if default is None and key in CONFIGURATIONS:
+            default = CONFIGURATIONS[key]["default"]
+
         return self.configs.get(key, default)
 
     def set(self, key, value):
@@ -133,6 +296,17 @@ class Config:
         if old_value != value:
             self.changed = True
 
+    def override(self, key, value):
+        """
+        Sets a configuration for this run only, it is not saved.
+
+        :param key:
+        :param value:
+        :return:
+        """
+
+        self.configs[key] = value
+
     def save(self):
         if not self.changed:
             return
@@ -140,9 +314,8 @@ class Config:
         with open(self.config_file, 'w') as f:
             json.dump(self.configs, f, indent=4)
 
-    @staticmethod
-    def config_exists():
-        return os.path.exists(CONFIG_FILE)
+    def config_exists(self):
+        return os.path.exists(self.config_file)
 
     def __del__(self):
         if not self.changed:
@@ -13,6 +13,8 @@ Ex: data/parent/[4k]_DenCor_No_NaN: <4.3K x 1465> DataFrame
 
 # Imports
 import os
+import weakref
+from time import perf_counter
 from typing import Dict
 from pandas import DataFrame, Series
 
@@ -24,8 +26,9 @@ from providers.data_suite.data_saver import DataSaver
 from util.constants import (
     DATA_SETS,
     MAX_DIRECTORY_PRINT_DEPTH,
-    MASTER_DATASET,
+    MASTER_DATASET_KEY,
     STRUCTURE_IDS,
+    STREAM_OPERATIONS,
 )
 
 # Utilities
@@ -35,18 +38,29 @@ from util.data import (
     save_csv_file
 )
 
-from util.string_util import get_most_alike_from_list
+from util.dataset_profile import DatasetProfile
+from util.compact import compact_data
+
+from util.data_loader import load_csv_files
 
 from util.cache import Cache
 from util.directory_cache import DirectoryCache
+from util.model_store import ModelStore
+from util.dataset_handle import DatasetHandle, FileDataset
+from util.dataset_views import SharedDataset, GeneView, StructureView
+from util.streaming import StreamingDataset
+from drivers.clustering.kmeans_streaming import stream_kmeans
+from util.brainscan import print_density_bins
 from util.input import (
     get_choice_input,
     get_text_input,
     get_text_input_with_back,
-    get_yes_no_input
+    get_yes_no_input,
+    get_float_input,
+    get_comma_separated_int_input
 )
 
-from util.conversion import byte_to_mb
+from util.conversion import byte_to_mb, mb_to_byte
 
 from util.print import (
     bold,
@@ -63,18 +77,40 @@ from util.print import (
 class Data:
     def __init__(self, config=None):
         self.cache = Cache[object]()
-        self.data_cache = DirectoryCache()
         self.config = config
+        self.data_cache = DirectoryCache(
+            max_bytes=int(mb_to_byte(config.get('cache_max_megabytes'))),
+            policy=config.get('cache_eviction_policy')
+        )
+        self.master_dataset: SharedDataset | None = None
+
+        # Fitted models kept across sessions, None when they should not be kept
+        self.model_store = ModelStore(
+            max_bytes=int(mb_to_byte(config.get('model_store_max_megabytes')))
+        ) if config.get('persist_models') else None
+
+        # The last data set handed out and its name, so that its cached profile can be reused
+        self.retrieved: tuple[weakref.ref, str] | None = None
+
         self.init()
 
     def init(self):
         print(info("Initializing the data pipeline..."))
 
-        # Load commonly used data into the cache
-        self.load_data_recursive(DATA_SETS, self.data_cache)
+        # Collect every file to load first, so they can be loaded together
+        files = self.get_data_files_recursive(DATA_SETS)
 
-        # load shared data
-        self.load_shared_data()
+        # shared data
+        files.update(self.get_shared_data_files())
+
+        if self.config.get('load_generated_data_at_startup'):
+            print(info("Loading generated data..."))
+            files.update(self.get_generated_data_files())
+
+        # Load commonly used data into the cache
+        start = perf_counter()
+        timings = self.load_files(files)
+        elapsed = perf_counter() - start
 
         # Now that the data is loaded, we can add individual genes into the cache
         # only if the config allows it
@@ -84,9 +120,8 @@ class Data:
             self.load_structure_ids()
             self.load_single_genes()
 
-        if self.config.get('load_generated_data_at_startup'):
-            print(info("Loading generated data..."))
-            self.load_generated_data()
+        if timings:
+            self.print_load_timings(timings, elapsed)
 
         print(
             success(f"Data pipeline initialized with {bold(str(len(self.data_cache)))}" + success(" data sets ") +
@@ -119,10 +154,16 @@ class Data:
         def list_all_loaded_data():
             self.print_data()
 
+        def show_memory_usage():
+            self.print_memory_usage()
+
+        def stream_file():
+            self.stream_file_in_chunks()
+
         def import_data():
             print("Importing data from file...")
             file_path = get_text_input("Enter the path of the file: ")
-            data = get_csv_file(file_path)
+            data = self.load_csv_file(file_path)
             if data is not None:
                 self.ask_to_save_data_in_memory(data)
 
@@ -134,6 +175,8 @@ class Data:
             "Import data from file": import_data,
             "Save a dataset to file": save_dataset,
             "List all loaded data": list_all_loaded_data,
+            "Show memory usage": show_memory_usage,
+            "Process a large file in chunks": stream_file,
         }
 
         while True:
@@ -149,25 +192,55 @@ class Data:
 
         print(success("\nData pipeline finished."))
 
+    def get_master_dataset(self) -> SharedDataset:
+        """
+        Get the MASTER coronal density data set shared by the gene and
+        Structure-ID views. It is only loaded when a view is first used.
+
+        :return:
+        """
+
+        if self.master_dataset is None:
+            self.master_dataset = SharedDataset(
+                lambda: self.data_cache.get(MASTER_DATASET_KEY),
+                MASTER_DATASET_KEY,
+                lambda: self.data_cache.get_raw(MASTER_DATASET_KEY)
+            )
+
+        return self.master_dataset
+
     def load_single_genes(self):
         # CORONAL DENSITY GENES
-        cor_density_path = DATA_SETS["Coronal"]["Density"][MASTER_DATASET]
-        cor_density: DataFrame = get_csv_file(cor_density_path)
+        cor_density = self.data_cache.get_raw(MASTER_DATASET_KEY)
 
-        # For each column that is a gene, add it to the cache
+        if cor_density is None:
+            print(error(f"Data set {MASTER_DATASET_KEY} not found."))
+            return
 
-        for column in cor_density.columns:
+        if isinstance(cor_density, FileDataset):
+            columns = cor_density.probe_columns()
+        else:
+            columns = cor_density.columns
+
+        rows = cor_density.shape[0]
+        master_dataset = self.get_master_dataset()
+
+        # For each column that is a gene, add a view of it to the cache
+
+        for column in columns:
             if column_is_gene_data(column):
-                self.data_cache.set(f"Coronal/Density/Genes/{column}", cor_density[column])
+                self.data_cache.set(f"Coronal/Density/Genes/{column}", GeneView(master_dataset, column, rows))
 
     def load_structure_ids(self):
         # CORONAL DENSITY GENES
-        cor_density_path = DATA_SETS["Coronal"]["Density"][MASTER_DATASET]
-        cor_density: DataFrame = get_csv_file(cor_density_path)
+        if not self.data_cache.has(MASTER_DATASET_KEY):
+            print(error(f"Data set {MASTER_DATASET_KEY} not found."))
+            return
+
+        master_dataset = self.get_master_dataset()
 
         for structure in STRUCTURE_IDS:
-            isolated_structure = cor_density[cor_density["Structure-ID"] == structure]
-            self.data_cache.set(f"Coronal/Density/Structure-IDs/{structure}", isolated_structure)
+            self.data_cache.set(f"Coronal/Density/Structure-IDs/{structure}", StructureView(master_dataset, structure))
 
     def load_shared_data(self):
         """
@@ -176,28 +249,146 @@ class Data:
         :return:
         """
 
-        for root, dirs, files in os.walk('data/shared'):
-            for file in files:
+        self.load_files(self.get_shared_data_files())
+
+    def get_shared_data_files(self) -> dict[str, str]:
+        """
+        Get the cache keys and paths of the shared data.
+
+        :return:
+        """
+
+        files = {}
+
+        for root, dirs, files_in_directory in os.walk('data/shared'):
+            for file in files_in_directory:
                 if file.endswith(".csv"):
                     file_path = str(os.path.join(root, file)).replace("\\", "/")
-                    data = get_csv_file(file_path)
                     new_file_path = file_path.replace('data/shared/', "").replace(".csv",
                                                                                                                "")
-                    self.data_cache.set(f"Shared/{new_file_path}", data)
+                    files[f"Shared/{new_file_path}"] = file_path
+
+        return files
 
     def get_all_loaded_data(self):
         return self.data_cache.get_all()
 
     def load_data_recursive(self, data_dict: Dict[str, any], cache, keys=None):
+        self.load_files(self.get_data_files_recursive(data_dict, keys), cache)
+
+    def get_data_files_recursive(self, data_dict: Dict[str, any], keys=None) -> dict[str, str]:
+        """
+        Get the cache keys and paths of the files in a nested dictionary
+        like DATA_SETS.
+
+        :param data_dict:
+        :param keys:
+        :return:
+        """
+
         if keys is None:
             keys = []
+
+        files = {}
+
         for key, value in data_dict.items():
             if isinstance(value, dict):
-                self.load_data_recursive(value, cache, keys + [key])
+                files.update(self.get_data_files_recursive(value, keys + [key]))
             else:
-                loaded_data = get_csv_file(value)
-                if loaded_data is not None:
-                    cache.set('/'.join(keys + [key]), loaded_data)
+                files['/'.join(keys + [key])] = value
+
+        return files
+
+    def load_files(self, files: dict[str, str], cache: DirectoryCache | None = None) -> dict[str, float]:
+        """
+        Load csv files into the cache under their keys. If lazy loading
+        is enabled, only handles are stored. Otherwise, the files are
+        loaded concurrently on the configured worker pool.
+
+        :param files: A dictionary of cache keys to file paths.
+        :param cache:
+        :return: The number of seconds it took to load each file, by key.
+        """
+
+        if cache is None:
+            cache = self.data_cache
+
+        if self.config.get('lazy_load_datasets'):
+            for key, file_path in files.items():
+                self.load_file(key, file_path, cache)
+            return {}
+
+        loaded_data, timings = load_csv_files(
+            files,
+            workers=self.config.get('loader_workers'),
+            pool_type=self.config.get('loader_pool_type'),
+            compact=self.config.get('compact_dtypes')
+        )
+
+        # Insert in the original order so the tree is printed the same way.
+        # The data stays attached to its file so it can be evicted and loaded again.
+        for key, file_path in files.items():
+            if loaded_data[key] is not None:
+                cache.set(key, FileDataset.from_data(file_path, loaded_data[key], self.config.get('compact_dtypes')))
+
+        return timings
+
+    def print_load_timings(self, timings: dict[str, float], elapsed: float):
+        """
+        Print how long it took to load each file, slowest first.
+
+        :param timings:
+        :param elapsed: The number of seconds it took to load all the files.
+        :return:
+        """
+
+        print(info(f"Loaded {len(timings)} files in {format(elapsed, '.2f')} s "
+                   f"({format(sum(timings.values()), '.2f')} s of worker time):"))
+
+        for key, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+            print(info(f"    {format(seconds, '.3f')} s  {key}"))
+
+    def load_csv_file(self, file_path: str) -> DataFrame | None:
+        """
+        Load a csv file, in its compact representation if the configuration
+        asks for it, see util/compact.py.
+
+        :param file_path:
+        :return:
+        """
+
+        data = get_csv_file(file_path)
+
+        if data is not None and self.config.get('compact_dtypes'):
+            data = compact_data(data)
+
+        return data
+
+    def load_file(self, key: str, file_path: str, cache: DirectoryCache | None = None):
+        """
+        Load a csv file into the cache under the key. If lazy loading
+        is enabled, only a handle is stored and the file is parsed the
+        first time the data set is used.
+
+        :param key:
+        :param file_path:
+        :param cache:
+        :return:
+        """
+
+        if cache is None:
+            cache = self.data_cache
+
+        if self.config.get('lazy_load_datasets'):
+            if os.path.isfile(file_path):
+                cache.set(key, FileDataset(file_path, self.config.get('compact_dtypes')))
+            else:
+                print(f"File not found at {file_path}")
+            return
+
+        loaded_data = self.load_csv_file(file_path)
+        if loaded_data is not None:
+            cache.set(key, FileDataset.from_data(file_path, loaded_data, self.config.get('compact_dtypes')))
 
     def print_data(self):
         """
@@ -228,13 +419,9 @@ class Data:
             if did_go_back:
                 return None
 
-            while not self.data_cache.has(choice) or isinstance(self.data_cache.get(choice),
-                                                                dict):
-                # If the data set is not found, try to find the most alike data set
-                all_directories = self.data_cache.get_all_directories()
-                most_alike = get_most_alike_from_list(choice, all_directories)
-                print(error(f"Data set {choice} not found."))
-                print(warning(f"Did you mean {most_alike}?"))
+            while not self.data_cache.is_leaf(choice):
+                # If the data set is not found, suggest the most alike data sets
+                self.print_suggestions(choice)
                 choice, did_go_back = get_text_input_with_back("Enter the name of the data set: ")
 
                 if did_go_back:
@@ -242,17 +429,107 @@ class Data:
 
             print(info(f"\nLoading data set {choice}..."))
 
-            dataset = self.data_cache.get(choice)
+            dataset = self.get_dataset(choice)
 
-            # Convert to dataframe because it could raise errors
-            if isinstance(dataset, Series):
-                dataset = dataset.to_frame()
+            if dataset is None:
+                continue
 
             print("Dataset loaded: ")
             print(dataset.head())
 
             return dataset
 
+    def get_dataset(self, name: str) -> DataFrame | None:
+        """
+        Get a data set from the cache by name, without asking the user.
+
+        :param name:
+        :return: The data set, or None if it is not found or cannot be loaded.
+        """
+
+        if not self.data_cache.is_leaf(name):
+            self.print_suggestions(name)
+            return None
+
+        dataset = self.data_cache.get(name)
+
+        # The handle could not be loaded, ex: its file was removed
+        if dataset is None:
+            print(error(f"Data set {name} could not be loaded."))
+            return None
+
+        # Convert to dataframe because it could raise errors
+        if isinstance(dataset, Series):
+            dataset = dataset.to_frame()
+
+        self.retrieved = (weakref.ref(dataset), name)
+
+        return dataset
+
+    def get_profile(self, dataset: DataFrame) -> DatasetProfile:
+        """
+        Get the profile of a data set. The profile kept by the cache is
+        reused if the data set was retrieved from it, otherwise the data
+        set is profiled.
+
+        :param dataset:
+        :return:
+        """
+
+        name = self.get_dataset_name(dataset)
+
+        if name is not None:
+            profile = self.data_cache.get_profile(name)
+
+            if profile is not None:
+                return profile
+
+        return DatasetProfile.from_data(dataset)
+
+    def get_dataset_name(self, dataset: DataFrame) -> str | None:
+        """
+        Get the name of a data set, if it is the last one retrieved from the cache.
+
+        :param dataset:
+        :return: The name, or None if the data set did not come from the cache.
+        """
+
+        if self.retrieved is None:
+            return None
+
+        reference, name = self.retrieved
+
+        return name if reference() is dataset else None
+
+    def get_data_properties(self, dataset: DataFrame, columns: list[str] | None = None) -> dict[str, any]:
+        """
+        Get the properties of a data set, see get_data_properties in util/data.py.
+
+        :param dataset:
+        :param columns: The columns to describe, None for all of them.
+        :return:
+        """
+
+        return self.get_profile(dataset).get_properties(columns)
+
+    def print_suggestions(self, choice: str):
+        """
+        Print that a data set was not found, along with the
+        data sets whose names are most alike.
+
+        :param choice:
+        :return:
+        """
+
+        print(error(f"Data set {choice} not found."))
+
+        suggestions = self.data_cache.suggest(choice)
+
+        if suggestions:
+            print(warning("Did you mean one of these?"))
+            for suggestion in suggestions:
+                print(warning(f"    {suggestion}"))
+
     def print_tree(self):
         """
         Print the cache in a tree-like structure. It
@@ -303,9 +580,14 @@ class Data:
                     self.print_tree_recursive(value, level + 1)
 
             else:
-                # get the properties of the DataFrame
+                # get the properties of the DataFrame without loading lazy data sets
                 shape = value.shape
-                print(info(" " * (level + 1) * 4 + f"<{shape[0]} x {shape[1]}> DataFrame"))
+                not_loaded = " (not loaded)" if isinstance(value, DatasetHandle) and not value.is_loaded() else ""
+
+                if len(shape) == 1:
+                    print(info(" " * (level + 1) * 4 + f"<{shape[0]}> Series{not_loaded}"))
+                else:
+                    print(info(" " * (level + 1) * 4 + f"<{shape[0]} x {shape[1]}> DataFrame{not_loaded}"))
 
     def save_data_from_memory(self):
         """
@@ -317,17 +599,14 @@ class Data:
         print("Which data set would you like to save?")
         self.print_data()
 
-        choice = get_text_input_with_back("Enter the name of the data set: ")
+        choice, did_go_back = get_text_input_with_back("Enter the name of the data set: ")
 
-        if choice is None:
+        if did_go_back:
             return None
 
-        while not self.data_cache.has(choice) or isinstance(self.data_cache.get(choice), dict):
-            # If the data set is not found, try to find the most alike data set
-            all_directories = self.data_cache.get_all_directories()
-            most_alike = get_most_alike_from_list(choice, all_directories)
-            print(error(f"Data set {choice} not found."))
-            print(warning(f"Did you mean {most_alike}?"))
+        while not self.data_cache.is_leaf(choice):
+            # If the data set is not found, suggest the most alike data sets
+            self.print_suggestions(choice)
             choice = get_text_input("Enter the name of the data set: ")
 
         name_of_file, did_go_back = get_text_input_with_back("Enter the name of the file to save the data set to: ")
@@ -372,10 +651,74 @@ class Data:
 
         print(info(f"\nLoading data set {choice}..."))
 
-        data = get_csv_file(choice)
+        data = self.load_csv_file(choice)
 
         self.ask_to_save_data_in_memory(data)
 
+    def stream_file_in_chunks(self):
+        """
+        Process a csv file that is too large for memory one chunk of rows
+        at a time, and write the result to the generated data directory.
+
+        :return:
+        """
+
+        file_path, did_go_back = get_text_input_with_back("Enter the path of the file: ")
+
+        if did_go_back:
+            return
+
+        if not os.path.isfile(file_path):
+            print(error(f"File not found at {file_path}"))
+            return
+
+        dataset = StreamingDataset(file_path)
+
+        _, operation, did_go_back = get_choice_input("What would you like to do with the file: ",
+                                                     STREAM_OPERATIONS, can_go_back=True)
+
+        if did_go_back:
+            return
+
+        if operation == "brainscan":
+            print_density_bins(dataset.bin_density())
+            return
+
+        name_of_file = get_text_input("Enter the name of the file to write: ")
+        out_path = self.config.get('save_generated_data_path') + name_of_file.replace(".csv", "") + ".csv"
+
+        if operation == "filter-structure-ids":
+            structure_ids = get_comma_separated_int_input("Enter the list of structure ids to keep: ",
+                                                          choices=STRUCTURE_IDS)
+            rows = dataset.filter_structure_ids(structure_ids, out_path)
+            print(success(f"Kept {rows} rows."))
+
+        elif operation == "replace-nan":
+            value = get_float_input("What value would you like to replace NaN with: ")
+            replaced = dataset.replace_nan(value, out_path)
+            print(success(f"Replaced {replaced} NaN values with {value}"))
+
+        elif operation == "reduce-columns":
+            threshold = get_float_input("Enter the threshold for column reduction: ")
+            removed = dataset.reduce_columns(threshold, out_path)
+            print(success(f"Removed {len(removed)} columns"))
+
+        elif operation == "kmeans":
+            cluster_k_values = get_comma_separated_int_input("Enter the list of K values to cluster: ")
+
+            if not cluster_k_values:
+                return
+
+            try:
+                report = stream_kmeans(dataset, cluster_k_values, out_path)
+            except ValueError as e:
+                print(error(str(e)))
+                return
+
+            print(report.to_string())
+
+        print(success(f"Saved to {out_path}\n"))
+
     def unload_data_from_memory(self):
         """
         Unload a data set from memory.
@@ -391,12 +734,9 @@ class Data:
         if did_go_back:
             return None
 
-        while not self.data_cache.has(choice) or isinstance(self.data_cache.get(choice), dict):
-            # If the data set is not found, try to find the most alike data set
-            all_directories = self.data_cache.get_all_directories()
-            most_alike = get_most_alike_from_list(choice, all_directories)
-            print(error(f"Data set {choice} not found."))
-            print(warning(f"Did you mean {most_alike}?"))
+        while not self.data_cache.is_leaf(choice):
+            # If the data set is not found, suggest the most alike data sets
+            self.print_suggestions(choice)
             choice = get_text_input("Enter the name of the data set you want to unload: ")
 
         print(info(f"\nUnloading data set {choice}..."))
@@ -469,15 +809,27 @@ class Data:
         :return:
         """
 
-        # Walk through the directory and load all the files
+        self.load_files(self.get_generated_data_files())
 
-        for root, dirs, files in os.walk(self.config.get('save_generated_data_path')):
-            for file in files:
+    def get_generated_data_files(self) -> dict[str, str]:
+        """
+        Get the cache keys and paths of the generated data.
+
+        :return:
+        """
+
+        files = {}
+
+        # Walk through the directory and collect all the files
+
+        for root, dirs, files_in_directory in os.walk(self.config.get('save_generated_data_path')):
+            for file in files_in_directory:
                 if file.endswith(".csv"):
                     file_path = str(os.path.join(root, file)).replace("\\", "/")
-                    data = get_csv_file(file_path)
                     new_file_path = file_path.replace(self.config.get('save_generated_data_path'), "").replace(".csv", "")
-                    self.data_cache.set(f"Generated/{new_file_path}", data)
+                    files[f"Generated/{new_file_path}"] = file_path
+
+        return files
 
     def ask_to_save_data_in_memory(self, data: DataFrame):
         """
@@ -510,21 +862,37 @@ class Data:
 
         print(success(f"Data set {name} saved.\n"))
 
-    def get_bytes(self):
+    def get_bytes(self, deep: bool = False):
         """
-        Get the bytes of the cache.
+        Get the bytes of the cache. The shallow number is
+        kept up to date by the cache, so it is O(1).
 
+        :param deep: Whether to count the contents of object columns.
         :return: The bytes of the cache.
         """
 
-        dataframes = self.data_cache.get_leafs_values()
+        return self.data_cache.get_bytes(deep=deep)
 
-        byte_sum = 0
-        for df in dataframes:
-            mem_usage = df.memory_usage(index=True)
-            if isinstance(mem_usage, int):
-                byte_sum += mem_usage
-            else:
-                byte_sum += mem_usage.sum()
+    def print_memory_usage(self):
+        """
+        Print the bytes of every top-level directory of the cache,
+        with and without the contents of object columns.
+
+        :return:
+        """
 
-        return byte_sum
+        shallow = self.data_cache.get_bytes_breakdown()
+        deep = self.data_cache.get_bytes_breakdown(deep=True)
+
+        print(info("Memory usage (deep counts the contents of object columns):\n"))
+        horizontal_line()
+
+        for key in shallow:
+            name = key if self.data_cache.is_leaf(key) else f"{key}/"
+            print(name.ljust(40) +
+                  info(f"{format(byte_to_mb(shallow[key]), '.2f')} MB".rjust(14)) +
+                  f"{format(byte_to_mb(deep[key]), '.2f')} MB deep".rjust(20))
+
+        horizontal_line()
+        print(bold(f"{'Total'.ljust(40)}{format(byte_to_mb(sum(shallow.values())), '.2f').rjust(11)} MB"
+                   f"{format(byte_to_mb(sum(deep.values())), '.2f').rjust(12)} MB deep\n"))
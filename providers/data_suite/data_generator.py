@@ -22,22 +22,27 @@ from util.constants import (
 
 # Utilities
 from util.data import (
-    get_data_properties,
     remove_non_gene_columns,
     combine_data,
     get_all_cluster_id_columns,
-    extract_k_value
-
+    extract_k_value,
+    get_memory_usage
 )
 
+from util.compact import compact_data, get_float_precision, to_precision
+from util.conversion import byte_to_mb
+
 from util.input import (
     get_choice_input,
     get_text_input_with_back,
     get_float_input,
     get_yes_no_input,
-    get_comma_separated_int_input
+    get_comma_separated_int_input,
+    get_comma_separated_float_input
 )
 
+from util.reduction import reduce_columns as reduce_data_columns
+
 from util.string_util import get_most_alike_from_list
 from util.print import (
     error,
@@ -66,28 +71,23 @@ class DataGenerator:
 
         def reduce_columns(data: DataFrame):
             print(info("Any columns that have a single value below the threshold will be removed."))
-            threshold = get_float_input("Enter the threshold for column reduction: ")
+            thresholds = get_comma_separated_float_input(
+                "Enter the thresholds for column reduction, separated by commas: ")
 
-            print(info(f"Threshold set to {threshold}\n"))
-            # temporarily remove non-gene columns
-            data, removed_columns = remove_non_gene_columns(data)
+            print(info(f"Thresholds set to {', '.join(str(threshold) for threshold in thresholds)}\n"))
 
-            # iterate through the columns and remove the columns which for any row have a single value below the threshold
+            # One pass over the gene columns for every threshold
+            reduced, report = reduce_data_columns(data, thresholds)
 
-            def check_below_threshold(column: pd.Series):
-                return column.min() < threshold
+            print(report.to_string())
 
-            should_drop = data.apply(check_below_threshold)
-            data = data.drop(columns=should_drop[should_drop].index)
-
-            # re-add the removed columns
-            data = combine_data(removed_columns, data)
-
-            print(data.head())
+            for threshold, reduced_data in reduced.items():
+                print(info(f"\nThreshold {threshold}:"))
+                print(reduced_data.head())
 
-            print(success(f"Removed {len(should_drop)} columns"))
+                print(success(f"Removed {report.loc[threshold, 'Columns Removed']} columns"))
 
-            self.data_driver.ask_to_save_data_in_memory(data)
+                self.data_driver.ask_to_save_data_in_memory(reduced_data)
 
         def reduce_rows(data: DataFrame):
             pass
@@ -135,12 +135,15 @@ class DataGenerator:
             # strip the data of non-gene columns
             data, _ = remove_non_gene_columns(data)
 
-            # add the cluster id column back
-            data[cluster_id] = _[cluster_id]
+            # add the cluster id column back, the genes are a selection of the data and are not changed in place
+            data = combine_data(data, _[[cluster_id]])
 
             # instantiate a dictionary with range 0-k
             cluster_ids = {i: False for i in range(0, as_k)}
 
+            # Compare at the precision of the values, so float32 values equal to the threshold are not below it
+            threshold = to_precision(threshold, get_float_precision(data))
+
             # get the cluster ids where the voxel value is below the threshold
             for i in range(0, as_k):
                 all_columns_below_threshold = data[data[cluster_id] == i].min() < threshold
@@ -164,6 +167,19 @@ class DataGenerator:
             print(success(f"Replaced {nan_count} NaN values with {replacement_val}"))
             self.data_driver.ask_to_save_data_in_memory(data)
 
+        def compact_dataset(data: DataFrame):
+            print(info("Converting the genes to float32 and the labels to the smallest integers that hold them..."))
+
+            compact = compact_data(data)
+
+            before, after = get_memory_usage(data), get_memory_usage(compact)
+
+            print(success(f"Reduced the data set from {format(byte_to_mb(before), '.2f')} MB "
+                          f"to {format(byte_to_mb(after), '.2f')} MB"))
+            print(compact.dtypes.value_counts().to_string())
+
+            self.data_driver.ask_to_save_data_in_memory(compact)
+
         def filter_structure_ids(data: DataFrame):
             print(info("Filtering data by structure ids..."))
 
@@ -183,6 +199,7 @@ class DataGenerator:
                 "Reduce rows": reduce_rows,
                 "Replace NaN": replace_nan,
                 "Filter structure ids": filter_structure_ids,
+                "Compact (float32 genes, small integer labels)": compact_dataset,
                 "Get cluster ids where voxel below threshold": get_cluster_ids_where_voxel_below_threshold,
             }
 
@@ -195,7 +212,7 @@ class DataGenerator:
             print(dataset.head())
 
             # get the data properties of the dataset
-            data_properties = get_data_properties(dataset)
+            data_properties = self.data_driver.get_data_properties(dataset)
 
             # if the dataset doesn't have NaN, remove it as an action
             if not data_properties[HAS_NAN]:
@@ -0,0 +1,199 @@
+"""
+util/binning.py
+
+This module is responsible for binning the density values of a data set
+into log-decade buckets, the binning analysis of the brain scan.
+
+Every value is binned at once with np.digitize. The result is a
+DensityBins, which can be merged with the bins of other parts of the
+same data set so that a data set can also be binned one chunk at a time.
+
+"""
+
+# Imports
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    DENSITY_BIN_EDGES,
+    DENSITY_BIN_LABELS,
+    DENSITY_SUB_BIN_RANGE,
+    INACTIVE_DENSITY
+)
+
+# Utilities
+from util.compact import get_float_precision, to_precision
+
+
+class DensityBins:
+    """
+    A class that represents the binning analysis of density values.
+
+    Attributes
+    ----------
+    counts : np.ndarray
+        The number of values in each bucket of DENSITY_BIN_LABELS.
+    inactive : int
+        The number of values from -1 (fully inactive) up to 0.
+    sub_count : int
+        The number of values in DENSITY_SUB_BIN_RANGE, both ends included.
+    sub_sum : float
+        The sum of the values in DENSITY_SUB_BIN_RANGE.
+    non_numeric : int
+        The number of values that are not numbers (ex: gene names).
+    total : int
+        The number of entries that were binned.
+    minimum : float
+        The smallest number, NaN if there were none.
+    maximum : float
+        The largest number, NaN if there were none.
+
+    Methods
+    -------
+    merge(other: DensityBins) -> DensityBins
+        Combines the bins of two parts of a data set.
+    sub_mean -> float
+        The mean of the values in DENSITY_SUB_BIN_RANGE.
+    to_frame() -> DataFrame
+        Gets the counts as a table.
+    """
+
+    def __init__(self,
+                 counts: Optional[np.ndarray] = None,
+                 inactive: int = 0,
+                 sub_count: int = 0,
+                 sub_sum: float = 0.0,
+                 non_numeric: int = 0,
+                 total: int = 0,
+                 minimum: float = np.nan,
+                 maximum: float = np.nan):
+        self.counts = np.zeros(len(DENSITY_BIN_LABELS), dtype=np.int64) if counts is None else counts
+        self.inactive = inactive
+        self.sub_count = sub_count
+        self.sub_sum = sub_sum
+        self.non_numeric = non_numeric
+        self.total = total
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def merge(self, other: "DensityBins") -> "DensityBins":
+        """
+        Combines the bins of two parts of a data set.
+
+        :param other:
+        :return: The bins of both parts.
+        """
+
+        return DensityBins(
+            counts=self.counts + other.counts,
+            inactive=self.inactive + other.inactive,
+            sub_count=self.sub_count + other.sub_count,
+            sub_sum=self.sub_sum + other.sub_sum,
+            non_numeric=self.non_numeric + other.non_numeric,
+            total=self.total + other.total,
+            minimum=np.fmin(self.minimum, other.minimum),
+            maximum=np.fmax(self.maximum, other.maximum)
+        )
+
+    @property
+    def sub_mean(self) -> float:
+        if self.sub_count == 0:
+            return np.nan
+
+        return self.sub_sum / self.sub_count
+
+    def to_frame(self) -> DataFrame:
+        """
+        Gets the counts of every bucket, the inactive values and the
+        non-numeric values as a table.
+
+        :return:
+        """
+
+        return DataFrame({
+            "Bin": DENSITY_BIN_LABELS + ["-1 (fully inactive)", "Non-numeric"],
+            "Count": np.append(self.counts, [self.inactive, self.non_numeric])
+        })
+
+    def __repr__(self):
+        return f"DensityBins(total={self.total}, counts={self.counts.tolist()})"
+
+
+def get_numeric_values(data: DataFrame) -> tuple[np.ndarray, int]:
+    """
+    Gets every numeric value of a data set as a flat float array. Text
+    columns are converted where they hold numbers.
+
+    :param data:
+    :return: The values, and the number of entries that are not numbers.
+    """
+
+    numeric = data.select_dtypes(include=["number", "bool"])
+    values = [numeric.to_numpy(dtype=np.float64).ravel()]
+    non_numeric = 0
+
+    for column in data.columns.difference(numeric.columns, sort=False):
+        column_data = data[column]
+        converted = pd.to_numeric(column_data, errors="coerce")
+
+        # Values that were missing to begin with are numbers (NaN), not errors
+        non_numeric += int((converted.isna() & column_data.notna()).sum())
+        values.append(converted.to_numpy(dtype=np.float64))
+
+    return np.concatenate(values), non_numeric
+
+
+def bin_values(values: np.ndarray, precision: np.dtype = np.dtype(np.float64)) -> DensityBins:
+    """
+    Bins density values.
+
+    :param values: A flat float array.
+    :param precision: The precision the values were stored at, the edges are rounded to it.
+    :return:
+    """
+
+    # NaN is a number, but it belongs to no bucket
+    numbers = values[~np.isnan(values)]
+
+    # float32 values equal to an edge stay in the bucket they had as float64
+    edges = np.asarray(DENSITY_BIN_EDGES, dtype=precision).astype(np.float64)
+
+    # 0 for the negative values, i for the i-th bucket
+    buckets = np.digitize(numbers, edges)
+    counts = np.bincount(buckets, minlength=len(edges) + 1)
+
+    low, high = (to_precision(bound, precision) for bound in DENSITY_SUB_BIN_RANGE)
+    sub_values = numbers[(numbers >= low) & (numbers <= high)]
+
+    return DensityBins(
+        counts=counts[1:],
+        inactive=int(np.count_nonzero((numbers >= to_precision(INACTIVE_DENSITY, precision)) & (numbers < 0))),
+        sub_count=len(sub_values),
+        sub_sum=float(sub_values.sum()),
+        total=len(values),
+        minimum=float(numbers.min()) if len(numbers) else np.nan,
+        maximum=float(numbers.max()) if len(numbers) else np.nan
+    )
+
+
+def bin_density(data: DataFrame) -> DensityBins:
+    """
+    Bins every value of a data set into log-decade buckets.
+
+    Ex: 0 to 0.000001: 512312, 0.000001 to 0.00001: 14005, ...
+
+    :param data:
+    :return:
+    """
+
+    values, non_numeric = get_numeric_values(data)
+
+    bins = bin_values(values, get_float_precision(data))
+    bins.non_numeric = non_numeric
+    bins.total = data.size
+
+    return bins
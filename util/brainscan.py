@@ -5,7 +5,6 @@
 # Importing global packages
 import pandas as pd
 import matplotlib.pyplot as plt
-import statistics
 from sklearn.cluster import KMeans
 import numpy as np
 
@@ -14,6 +13,39 @@ import numpy as np
 # matplotlib.use('TkAgg')
 
 from util.input import get_choice_input
+from util.binning import DensityBins, bin_density
+
+from util.constants import DENSITY_BIN_LABELS
+
+
+def print_density_bins(bins: DensityBins):
+    """
+    Prints the binning analysis of density values.
+
+    :param bins:
+    :return:
+    """
+
+    print("\n-- Binning Analysis --\n")
+
+    for label, count in zip(DENSITY_BIN_LABELS, bins.counts):
+        print(f"{label}: ", count)
+
+    print("\nKaiwen's Add-In:")
+    print("0.001 to 0.002: ", bins.sub_count)
+    print(f"Average Expression Value: {bins.sub_mean}")
+
+    print("\n")
+
+    print("-1 (fully inactive): ", bins.inactive)
+    print("Error cases / gene names: ", bins.non_numeric)
+    print(f"Total entries in DataFrame: {bins.total}")
+
+    print("\n")
+
+    print("Minimum value: ", bins.minimum)
+    print("Maximum values: ", bins.maximum)
+
 
 def brainScan(df: pd.DataFrame = None):
     """
@@ -34,80 +66,13 @@ def brainScan(df: pd.DataFrame = None):
 
     # Protocol 1: DENSITY ANALYSIS
     if choice_int in [1, 3, 5]:
-        # Initializing accumulators
-        counterList1 = 0  # 0 to 0.000001
-        counterList2 = 0  # 0.000001 to 0.00001
-        counterList3 = 0  # 0.00001 to 0.0001
-        counterList4 = 0  # 0.0001 to 0.001
-        counterList5 = 0  # 0.001 to 0.01
-        counterList6 = 0  # 0.01 to 0.1
-        counterList7 = 0  # 0.1 and greater
-        counterList8 = 0  # -1
-        counterList9 = 0  # gene labels?
-
-        # Kaiwen add-in --> Will keep track of the actual values that range between 0.001 and 0.002
-        counterList10 = []
-
-        # Checking if values are within specified ranges
-        for row in df.values:
-            for value in row:
-                try:
-                    num_value = float(value)
-                    if 0 <= num_value < 0.000001:
-                        counterList1 += 1
-                    elif 0.000001 <= num_value < 0.00001:
-                        counterList2 += 1
-                    elif 0.00001 <= num_value < 0.0001:
-                        counterList3 += 1
-                    elif 0.0001 <= num_value < 0.001:
-                        counterList4 += 1
-                    elif 0.001 <= num_value < 0.01:
-                        counterList5 += 1
-                        # Kaiwen add-in
-                        if num_value <= 0.002:
-                            counterList10.append(num_value)
-                    elif 0.01 <= num_value < 0.1:
-                        counterList6 += 1
-                    elif num_value >= 0.1:
-                        counterList7 += 1
-                    elif 0 > num_value >= -1:
-                        counterList8 += 1
-                except ValueError:  # Handling cases where the value cannot be converted to a number (i.e. gene names)
-                    print(f"Error converting value to number: {value}")
-                    counterList9 += 1
-                    pass
-
-        print("\n-- Binning Analysis --")
-        print("\n0 to 0.000001: ", counterList1)
-        print("0.000001 to 0.00001: ", counterList2)
-        print("0.00001 to 0.0001: ", counterList3)
-        print("0.0001 to 0.001: ", counterList4)
-        print("0.001 to 0.01: ", counterList5)
-        print("0.01 to 0.1: ", counterList6)
-        print("0.1 and greater: ", counterList7)
-
-        print("\nKaiwen's Add-In:")
-        print("0.001 to 0.002: ", len(counterList10))
-        print(f"Average Expression Value: {statistics.mean(counterList10)}")
-
-        print("\n")
-
-        print("-1 (fully inactive): ", counterList8)
-        print("Error cases / gene names: ", counterList9)
-        print(f"Total entries in DataFrame: {df.size}")
-
-        print("\n")
-
-        print("Minimum value: ", df.values.min())
-        print("Maximum values: ", df.values.max())
+        # Every value is binned at once, see util/binning.py
+        bins = bin_density(df)
+        print_density_bins(bins)
 
         # Generating a bar chart for the bin counts
-        bins = ['0 to 0.000001', '0.000001 to 0.00001', '0.00001 to 0.0001', '0.0001 to 0.001', '0.001 to 0.01',
-                '0.01 to 0.1', '0.1 and greater']
-        bin_counts = [counterList1, counterList2, counterList3, counterList4, counterList5, counterList6, counterList7]
-
-        plt.bar(bins, bin_counts)
-        plt.xlabel(bins)
+        plt.bar(DENSITY_BIN_LABELS, bins.counts)
+        plt.xlabel(DENSITY_BIN_LABELS)
         plt.ylabel('Count')
         plt.title('Distribution of Gene Expression Bins')
         plt.show()  # Showcasing the generated chart
@@ -9,9 +9,10 @@ structure that can be used to store and retrieve data
 from typing import Any, Optional, TypeVar, Generic
 
 # Constants
-from util.constants import CACHE_SIZE
+from util.constants import CACHE_SIZE, EVICTION_POLICIES
 
 # Utilities
+from util.eviction import EvictionPolicy, create_eviction_policy
 
 from util.print import (
     bold,
@@ -35,6 +36,8 @@ class Cache(Generic[T]):
         A dictionary that stores the key-value pairs.
     size : int
         The size of the cache.
+    policy : EvictionPolicy
+        Decides which key is evicted when the cache is full.
 
     Methods
     -------
@@ -54,12 +57,13 @@ class Cache(Generic[T]):
         Gets the items in the cache.
     """
 
-    def __init__(self, size: Optional[int] = None):
+    def __init__(self, size: Optional[int] = None, policy: str = EVICTION_POLICIES[0]):
         self.size = CACHE_SIZE
         if size:
             self.size = size
     
         self.cache = {}
+        self.policy: EvictionPolicy = create_eviction_policy(policy)
 
     def get(self, key: str) -> T:
         """
@@ -69,6 +73,8 @@ class Cache(Generic[T]):
         :return:
         """
 
+        self.policy.touch(key)
+
         return self.cache.get(key, None)
     
     def get_all(self) -> dict[str, T]:
@@ -92,10 +98,11 @@ class Cache(Generic[T]):
         :return:
         """
         
-        if len(self.cache) >= self.size:
-            self.cache.popitem()
+        if key not in self.cache and len(self.cache) >= self.size:
+            self.remove(next(self.policy.victims()))
 
         self.cache[key] = value
+        self.policy.add(key)
 
     def has(self, key: str) -> bool:
         """
@@ -113,6 +120,7 @@ class Cache(Generic[T]):
         """
         
         self.cache.clear()
+        self.policy.clear()
 
     def clear_except(self, keys: list[str]):
         """
@@ -124,7 +132,7 @@ class Cache(Generic[T]):
 
         for key in list(self.cache.keys()):
             if key not in keys:
-                self.cache.pop(key)
+                self.remove(key)
 
     def remove(self, key: str):
         """
@@ -136,6 +144,7 @@ class Cache(Generic[T]):
 
         if self.has(key):
             self.cache.pop(key)
+            self.policy.remove(key)
 
     def items(self):
         """
@@ -0,0 +1,161 @@
+"""
+util/compact.py
+
+This module is responsible for the compact representation of data sets.
+A compact data set keeps its gene columns as float32 instead of float64,
+its Structure-ID and cluster columns as the smallest integer type their
+values fit in, and its X, Y and Z columns as int16, which about halves the
+memory of every copy that is made of it.
+
+float32 keeps about 7 significant digits. The paths whose results depend
+on more than that convert back to float64 themselves (KMeans with the
+float64 kmeans_dtype, PCA, HAC), and the thresholds that values are compared
+with are rounded to the precision of the values, see to_precision.
+
+Ex: compact_data(data) -> <1465 x 4.3K> float32 genes, int16 Structure-ID, int16 X, Y and Z
+
+"""
+
+# Imports
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    XYZ_COLUMNS,
+    STRUCTURE_IDS_COLUMN,
+    CLUSTER_LABEL_COLUMN_PREFIX
+)
+
+# Utilities
+from util.data import get_gene_column_mask
+
+# The integer types label columns can be stored as, smallest first
+LABEL_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+
+
+def get_integer_values(column: pd.Series) -> np.ndarray | None:
+    """
+    Gets the values of a column as integers, if every value is a whole number.
+
+    :param column:
+    :return: The values, or None if the column has missing or fractional values.
+    """
+
+    if column.dtype.kind in "iu":
+        return column.to_numpy()
+
+    if column.dtype.kind != "f":
+        return None
+
+    values = column.to_numpy()
+
+    if np.isnan(values).any() or not np.array_equal(values, np.round(values)):
+        return None
+
+    return values
+
+
+def get_smallest_int_dtype(values: np.ndarray) -> np.dtype:
+    """
+    Gets the smallest signed integer type that holds every value.
+
+    :param values:
+    :return:
+    """
+
+    if len(values) == 0:
+        return np.dtype(LABEL_DTYPES[0])
+
+    low, high = values.min(), values.max()
+
+    for dtype in LABEL_DTYPES:
+        limits = np.iinfo(dtype)
+
+        if limits.min <= low and high <= limits.max:
+            return np.dtype(dtype)
+
+    return np.dtype(LABEL_DTYPES[-1])
+
+
+def compact_data(data: DataFrame) -> DataFrame:
+    """
+    Converts a data set to its compact representation. Columns that cannot
+    be made smaller without changing their values are left as they are,
+    like label columns with missing values, or X, Y and Z outside of int16.
+
+    :param data:
+    :return: The compact data set, with its columns in the same order.
+    """
+
+    is_gene = get_gene_column_mask(data)
+    is_float = np.array([dtype.kind == "f" and dtype.itemsize > 4 for dtype in data.dtypes], dtype=bool)
+
+    gene_positions = np.flatnonzero(is_gene & is_float)
+    other_positions = np.flatnonzero(~(is_gene & is_float))
+
+    # The gene columns are converted with a single copy, into a single block
+    genes = DataFrame(
+        data.iloc[:, gene_positions].to_numpy(dtype=np.float32),
+        index=data.index,
+        columns=data.columns[gene_positions]
+    )
+
+    others = {}
+
+    for position in other_positions:
+        column = data.columns[position]
+        values = data.iloc[:, position]
+
+        is_label = column == STRUCTURE_IDS_COLUMN or str(column).startswith(CLUSTER_LABEL_COLUMN_PREFIX)
+
+        if is_label or column in XYZ_COLUMNS:
+            integers = get_integer_values(values)
+
+            if integers is not None:
+                dtype = get_smallest_int_dtype(integers)
+
+                if column in XYZ_COLUMNS:
+                    dtype = max(dtype, np.dtype(np.int16), key=lambda d: d.itemsize)
+
+                values = values.astype(dtype)
+
+        others[column] = values
+
+    compact = pd.concat([DataFrame(others, index=data.index), genes], axis=1)
+
+    if not compact.columns.equals(data.columns):
+        compact = compact.iloc[:, np.argsort(np.concatenate([other_positions, gene_positions]), kind="stable")]
+
+    return compact
+
+
+def get_float_precision(data: DataFrame) -> np.dtype:
+    """
+    Gets the precision of the least precise float column of a data set.
+
+    :param data:
+    :return: float32 if a column is float32, otherwise float64.
+    """
+
+    if any(dtype.kind == "f" and dtype.itemsize <= 4 for dtype in data.dtypes):
+        return np.dtype(np.float32)
+
+    return np.dtype(np.float64)
+
+
+def to_precision(value: float, dtype: np.dtype) -> float:
+    """
+    Rounds a value to a precision, so that it compares with values stored at
+    that precision the way it would with the values before they were rounded.
+
+    Ex: 0.01 as float32 is 0.0099999998, which is below 0.01 but equal to
+    to_precision(0.01, float32).
+
+    :param value:
+    :param dtype:
+    :return:
+    """
+
+    return float(np.asarray(value, dtype=dtype))
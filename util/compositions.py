@@ -0,0 +1,157 @@
+"""
+util/compositions.py
+
+This module is responsible for counting how the voxels of every cluster
+are spread over the Structure-IDs, for every cluster column of a data set.
+
+Every cluster column is counted in a single pass: the cluster label and
+the Structure-ID of each voxel are combined into one code, and the codes
+are counted with np.bincount.
+
+"""
+
+# Imports
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    STRUCTURE_IDS,
+    STRUCTURE_IDS_COLUMN,
+    STRUCTURE_ID_ABBREVIATIONS
+)
+
+# Utilities
+from util.data import get_all_cluster_id_columns, extract_k_value
+
+
+def count_cluster_structures(labels: np.ndarray, structure_codes: np.ndarray, k: int) -> np.ndarray:
+    """
+    Counts the voxels of every Structure-ID in every cluster.
+
+    :param labels: The cluster of every voxel.
+    :param structure_codes: The position of the Structure-ID of every voxel in STRUCTURE_IDS, -1 if it is not there.
+    :param k: The number of clusters.
+    :return: A (k, len(STRUCTURE_IDS) + 1) array of counts. The last column counts the other Structure-IDs.
+    """
+
+    width = len(STRUCTURE_IDS) + 1
+
+    # Labels outside of 0..k-1 (noise, missing values) belong to no cluster
+    valid = (labels >= 0) & (labels < k)
+
+    codes = labels[valid] * width + structure_codes[valid] % width
+
+    return np.bincount(codes, minlength=k * width).reshape(k, width)
+
+
+def get_structure_codes(dataset: DataFrame) -> np.ndarray:
+    """
+    Gets the position in STRUCTURE_IDS of the Structure-ID of every voxel.
+
+    :param dataset:
+    :return: The positions, -1 for the Structure-IDs that are not in STRUCTURE_IDS.
+    """
+
+    return pd.Index(STRUCTURE_IDS).get_indexer(dataset[STRUCTURE_IDS_COLUMN])
+
+
+def get_cluster_labels(dataset: DataFrame, column: str) -> np.ndarray:
+    """
+    Gets the labels of a cluster column as integers, -1 for the missing ones.
+
+    :param dataset:
+    :param column:
+    :return:
+    """
+
+    return dataset[column].fillna(-1).to_numpy(dtype=np.int64)
+
+
+def get_cluster_composition(dataset: DataFrame, column: str, structure_codes: np.ndarray | None = None) -> DataFrame:
+    """
+    Gets the composition of the clusters of a cluster column.
+
+    Ex: Cluster  Count  Percentage  XII  IRN  ...
+        0        812    0.188       12   40   ...
+
+    :param dataset:
+    :param column: The cluster column, ex: Cluster_4.
+    :param structure_codes: See get_structure_codes, computed if not given.
+    :return: The count and fraction of voxels of every cluster, and the count of every Structure-ID.
+    """
+
+    if structure_codes is None:
+        structure_codes = get_structure_codes(dataset)
+
+    k = extract_k_value(column)
+    counts = count_cluster_structures(get_cluster_labels(dataset, column), structure_codes, k)
+
+    # Every voxel of a cluster counts, whatever its Structure-ID
+    cluster_counts = counts.sum(axis=1)
+
+    # Built in one go, inserting the columns one by one is far slower
+    return DataFrame({
+        "Cluster": np.arange(k),
+        "Count": cluster_counts,
+        "Percentage": cluster_counts / len(dataset),
+        **{
+            STRUCTURE_ID_ABBREVIATIONS[structure_id]: counts[:, i]
+            for i, structure_id in enumerate(STRUCTURE_IDS)
+        }
+    })
+
+
+def get_cluster_compositions(dataset: DataFrame) -> dict[int, DataFrame]:
+    """
+    Gets the composition of the clusters of every cluster column.
+
+    :param dataset:
+    :return: The composition of every K, see get_cluster_composition.
+    """
+
+    structure_codes = get_structure_codes(dataset)
+
+    return {
+        extract_k_value(column): get_cluster_composition(dataset, column, structure_codes)
+        for column in get_all_cluster_id_columns(dataset)
+    }
+
+
+def to_long_format(compositions: dict[int, DataFrame]) -> DataFrame:
+    """
+    Combines the compositions of every K into one table with a row
+    for every K, cluster and Structure-ID.
+
+    Ex: K  Cluster  Cluster Count  Structure-ID  Structure  Count
+        4  0        812            773           XII        12
+
+    :param compositions: See get_cluster_compositions.
+    :return:
+    """
+
+    abbreviations = [STRUCTURE_ID_ABBREVIATIONS[structure_id] for structure_id in STRUCTURE_IDS]
+    columns = ["K", "Cluster", "Cluster Count", STRUCTURE_IDS_COLUMN, "Structure", "Count"]
+
+    if not compositions:
+        return DataFrame(columns=columns)
+
+    ks, clusters, cluster_counts, structure_counts = [], [], [], []
+
+    for k, composition in compositions.items():
+        ks.append(np.full(len(composition) * len(STRUCTURE_IDS), k))
+        clusters.append(np.repeat(composition["Cluster"].to_numpy(), len(STRUCTURE_IDS)))
+        cluster_counts.append(np.repeat(composition["Count"].to_numpy(), len(STRUCTURE_IDS)))
+        structure_counts.append(composition[abbreviations].to_numpy().ravel())
+
+    rows = sum(len(values) for values in ks)
+
+    return DataFrame({
+        "K": np.concatenate(ks),
+        "Cluster": np.concatenate(clusters),
+        "Cluster Count": np.concatenate(cluster_counts),
+        STRUCTURE_IDS_COLUMN: np.resize(STRUCTURE_IDS, rows),
+        "Structure": np.resize(abbreviations, rows),
+        "Count": np.concatenate(structure_counts)
+    }, columns=columns)
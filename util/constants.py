@@ -12,6 +12,9 @@ VISUALIZATION_ENGINES = ["plotly", "matplotlib", "seaborn"]
 # CONFIG
 CONFIG_FILE = "config.json"
 
+# The kinds of worker pools that can load data sets, see util/data_loader.py
+LOADER_POOL_TYPES = ["thread", "process"]
+
 
 # TERMINAL COLORS
 class TERMINAL_COLORS:
@@ -43,6 +46,27 @@ class TERMINAL_COLORS:
 # CACHE
 CACHE_SIZE = 256
 
+# The orders in which caches evict entries, see util/eviction.py
+EVICTION_POLICIES = ["lru", "lfu"]
+
+# Where in-memory data sets are written when they are evicted
+SPILL_PATH = "data/.cache/spill/"
+
+# The number of rows read at a time from files too large for memory, see util/streaming.py
+STREAM_CHUNK_ROWS = 5000
+STREAM_OPERATIONS = ["filter-structure-ids", "replace-nan", "reduce-columns", "brainscan", "kmeans"]
+
+# Binary copies of parsed csv files, see util/csv_cache.py
+CSV_CACHE_PATH = "data/.cache/csv/"
+CSV_CACHE_VERSION = 1
+CSV_CACHE_MANIFEST = "manifest.json"
+
+# Fitted KMeans and PCA models kept across sessions, see util/model_store.py
+MODEL_STORE_PATH = "data/.cache/models/"
+MODEL_STORE_VERSION = 1
+MODEL_STORE_MANIFEST = "manifest.json"
+MODEL_STORE_MAX_MEGABYTES = 512
+
 # DATA SETS
 # MASTER: Reserved Key for the original data
 
@@ -70,8 +94,13 @@ DATA_SETS = {
     }
 }
 
+# The cache key of the MASTER coronal density data set
+MASTER_DATASET_KEY = f"Coronal/Density/{MASTER_DATASET}"
+
 MAX_DIRECTORY_PRINT_DEPTH = 10  # The maximum depth to print the directories in the cache
 
+SUGGESTION_COUNT = 5  # The number of data sets suggested when a data set is not found
+
 STRUCTURE_IDS = [
     773, 136, 1098, 939, 970, 235, 143, 978, 1107, 852, 661, 307, 1048
 ]
@@ -147,6 +176,10 @@ BACK_KEYWORD = "back"  # The keyword to go back to the previous menu
 # DATA HEADER NAMES
 
 CLUSTER_LABEL_COLUMN_PREFIX = "Cluster_"
+STABILITY_COLUMN_PREFIX = "Stability_"
+
+# Columns that describe the clusters of a voxel, not its genes
+LABEL_COLUMN_PREFIXES = (CLUSTER_LABEL_COLUMN_PREFIX, STABILITY_COLUMN_PREFIX)
 XYZ_COLUMNS = ["X", "Y", "Z"]
 STRUCTURE_IDS_COLUMN = "Structure-ID"
 VOXROWNUM_COLUMN = "voxRowNum"
@@ -178,6 +211,83 @@ HAS_NAN = "has_nan"
 CAN_VISUALIZE = "can_visualize"
 WAYS_TO_VISUALIZE = "ways_to_visualize"
 
+# BRAIN SCAN
+
+# The lower edges of the log-decade buckets that density values are binned into
+DENSITY_BIN_EDGES = [0, 0.000001, 0.00001, 0.0001, 0.001, 0.01, 0.1]
+DENSITY_BIN_LABELS = [
+    "0 to 0.000001",
+    "0.000001 to 0.00001",
+    "0.00001 to 0.0001",
+    "0.0001 to 0.001",
+    "0.001 to 0.01",
+    "0.01 to 0.1",
+    "0.1 and greater"
+]
+
+# The values from -1 up to 0 are fully inactive
+INACTIVE_DENSITY = -1
+
+# Kaiwen's add-in: the values in this range (both ends included) are kept track of
+DENSITY_SUB_BIN_RANGE = (0.001, 0.002)
+
 # KMEANS
 
 KMEANS_SEED = 25
+
+# The precisions a data set can be converted to before it is clustered
+KMEANS_DTYPES = ["float64", "float32"]
+
+# The number of rows in each mini-batch of MiniBatchKMeans
+KMEANS_BATCH_SIZE = 1024
+
+# The largest number of rows the silhouette score is measured on
+SILHOUETTE_SAMPLE_SIZE = 2000
+
+# The number of uniform reference data sets the gap statistic of a K is measured against
+GAP_REFERENCES = 5
+
+# The number of rows whose distances to the fitted centers are computed at once, see kmeans_predict.py
+PREDICT_CHUNK_ROWS = 8192
+
+# CONSENSUS
+
+# The number of times every K is refitted with another seed to measure how stable its clusters are
+CONSENSUS_RUNS = 20
+
+# The percentage of rows every refit is fitted on, 100 to only change the seed
+CONSENSUS_SUBSAMPLE_PERCENT = 80
+
+# The largest number of voxel pairs the co-association matrix of a K may hold
+CONSENSUS_MAX_COASSOCIATION_ENTRIES = 10_000_000
+
+# The number of refits added to the co-association matrix at once
+CONSENSUS_COASSOCIATION_BATCH = 10
+
+# PCA
+
+# How PCA decomposes a data set, see drivers/clustering/pca.py
+PCA_SOLVERS = ["randomized", "incremental", "full"]
+
+# The number of components computed unless the full decomposition is asked for
+PCA_COMPONENTS = 20
+
+# HAC
+
+# How the distance between two clusters is measured, see drivers/clustering/hac_tree.py
+HAC_LINKAGES = ["ward", "average", "complete", "single"]
+
+# The largest pairwise distance matrix a linkage is computed from
+HAC_MAX_DISTANCE_MEGABYTES = 4096
+
+# SPATIAL
+
+# How voxels are connected to their neighbors, see util/spatial.py
+# grid: the 6 voxels that share a face, knn: the nearest voxels
+SPATIAL_ADJACENCIES = ["grid", "knn"]
+
+# The number of nearest voxels every voxel is connected to with knn
+SPATIAL_NEIGHBORS = 6
+
+# The largest 3D grid a voxel lookup is built on, larger grids fall back to knn
+SPATIAL_MAX_GRID_CELLS = 100_000_000
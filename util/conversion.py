@@ -15,3 +15,14 @@ def byte_to_mb(byte: int) -> float:
     """
 
     return byte / 1024 / 1024
+
+
+def mb_to_byte(mb: float) -> float:
+    """
+    Converts megabytes to bytes.
+
+    :param mb:
+    :return:
+    """
+
+    return mb * 1024 * 1024
@@ -0,0 +1,365 @@
+"""
+util/csv_cache.py
+
+This module is responsible for providing an on-disk binary cache
+for csv files so that large data sets (like the MASTER density data)
+do not have to be parsed again every time the program starts.
+
+Every cached csv file gets its own directory that contains a manifest
+and one .npy block per numeric dtype. The blocks are memory-mapped
+when the data set is loaded again, so a warm load is close to free.
+
+Ex: data/.cache/csv/<digest>/manifest.json
+    data/.cache/csv/<digest>/block_0.npy     <1465 x 4.3K> float64
+    data/.cache/csv/<digest>/block_1.npy     <4 x 4.3K> int64
+
+"""
+
+# Imports
+import os
+import json
+import shutil
+import hashlib
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+# Constants
+from util.constants import (
+    CSV_CACHE_PATH,
+    CSV_CACHE_VERSION,
+    CSV_CACHE_MANIFEST,
+)
+
+# Utilities
+from util.print import warning
+
+# Column dtypes that can be stored in (and memory-mapped from) a .npy block
+NUMERIC_KINDS = "biuf"
+
+OBJECT_BLOCK = "objects"
+OBJECT_FILE = "objects.pkl"
+INDEX_FILE = "index.pkl"
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_signature(path: str) -> dict[str, int]:
+    """
+    Returns the cheap signature (size and modification time) of a file.
+
+    :param path:
+    :return:
+    """
+
+    stat = os.stat(path)
+
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns
+    }
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the sha256 digest of the contents of a file.
+
+    :param path:
+    :return:
+    """
+
+    digest = hashlib.sha256()
+
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_cache_directory(path: str, cache_path: str = CSV_CACHE_PATH) -> str:
+    """
+    Returns the cache directory of a csv file. The directory is named
+    after the absolute path of the file so that two files with the same
+    name in different directories don't collide.
+
+    :param path:
+    :param cache_path:
+    :return:
+    """
+
+    key = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()
+
+    return os.path.join(cache_path, key)
+
+
+def read_manifest(directory: str) -> dict | None:
+    """
+    Reads the manifest of a cache directory if it exists.
+
+    :param directory:
+    :return:
+    """
+
+    try:
+        with open(os.path.join(directory, CSV_CACHE_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if manifest.get("version") != CSV_CACHE_VERSION:
+        return None
+
+    return manifest
+
+
+def write_manifest(directory: str, manifest: dict):
+    """
+    Writes the manifest of a cache directory. The manifest is written
+    last so a partially written cache is never picked up.
+
+    :param directory:
+    :param manifest:
+    :return:
+    """
+
+    temp_path = os.path.join(directory, CSV_CACHE_MANIFEST + ".tmp")
+
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f)
+
+    os.replace(temp_path, os.path.join(directory, CSV_CACHE_MANIFEST))
+
+
+def is_manifest_valid(path: str, directory: str, manifest: dict) -> bool:
+    """
+    Returns True if the manifest still describes the csv file at the path.
+
+    The size and modification time are checked first. The file is only
+    hashed when the modification time changed but the size did not, which
+    is what happens when a file is touched or copied without changes.
+
+    :param path:
+    :param directory:
+    :param manifest:
+    :return:
+    """
+
+    signature = get_file_signature(path)
+
+    if manifest["size"] != signature["size"]:
+        return False
+
+    if manifest["mtime"] == signature["mtime"]:
+        return True
+
+    if manifest["hash"] != hash_file(path):
+        return False
+
+    # The contents are the same, remember the new modification time
+    manifest["mtime"] = signature["mtime"]
+    write_manifest(directory, manifest)
+
+    return True
+
+
+def write_frame_blocks(data: pd.DataFrame, directory: str) -> dict:
+    """
+    Writes a DataFrame to a directory as one .npy block per numeric dtype
+    (stored column-major so each column is contiguous) and a pickle for
+    any remaining columns. The index is pickled too, unless it is the
+    default 0..n range index.
+
+    :param data:
+    :param directory:
+    :return: The block layout of the DataFrame, to be stored in a manifest.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    groups: dict[str, list[str]] = {}
+    object_columns = []
+
+    for column, dtype in data.dtypes.items():
+        if isinstance(dtype, np.dtype) and dtype.kind in NUMERIC_KINDS:
+            groups.setdefault(dtype.str, []).append(column)
+        else:
+            object_columns.append(column)
+
+    blocks = {}
+    positions = {}
+
+    for i, (dtype, columns) in enumerate(groups.items()):
+        key = f"block_{i}"
+        block = np.empty((len(columns), len(data.index)), dtype=np.dtype(dtype))
+
+        for position, column in enumerate(columns):
+            block[position] = data[column].to_numpy()
+            positions[column] = (key, position)
+
+        np.save(os.path.join(directory, f"{key}.npy"), block)
+        blocks[key] = {"file": f"{key}.npy", "dtype": dtype, "columns": len(columns)}
+
+    if object_columns:
+        data[object_columns].to_pickle(os.path.join(directory, OBJECT_FILE))
+        blocks[OBJECT_BLOCK] = {"file": OBJECT_FILE, "dtype": "object", "columns": len(object_columns)}
+
+        for column in object_columns:
+            positions[column] = (OBJECT_BLOCK, column)
+
+    index_file = None
+
+    if not data.index.equals(pd.RangeIndex(len(data.index))):
+        index_file = INDEX_FILE
+        pd.to_pickle(data.index, os.path.join(directory, INDEX_FILE))
+
+    return {
+        "rows": len(data.index),
+        "index": index_file,
+        "blocks": blocks,
+        "columns": [[column, *positions[column]] for column in data.columns]
+    }
+
+
+def read_frame_blocks(directory: str, layout: dict) -> pd.DataFrame:
+    """
+    Reads a DataFrame that was written with write_frame_blocks. The largest
+    block becomes the base of the DataFrame without copying it, the other
+    columns are inserted around it.
+
+    :param directory:
+    :param layout:
+    :return:
+    """
+
+    blocks = {}
+
+    for key, block in layout["blocks"].items():
+        file_path = os.path.join(directory, block["file"])
+
+        if key == OBJECT_BLOCK:
+            blocks[key] = pd.read_pickle(file_path)
+        else:
+            # Copy-on-write so that in-place edits never touch the cache
+            blocks[key] = np.load(file_path, mmap_mode="c")
+
+    index = None
+
+    if layout.get("index"):
+        index = pd.read_pickle(os.path.join(directory, layout["index"]))
+
+    numeric_keys = [key for key in blocks if key != OBJECT_BLOCK]
+
+    if not numeric_keys:
+        if not blocks:
+            return pd.DataFrame(index=index if index is not None else pd.RangeIndex(layout["rows"]))
+
+        return blocks[OBJECT_BLOCK][[column for column, _, _ in layout["columns"]]]
+
+    base_key = max(numeric_keys, key=lambda k: layout["blocks"][k]["columns"])
+    base_columns = [column for column, key, _ in layout["columns"] if key == base_key]
+
+    data = pd.DataFrame(blocks[base_key].T, columns=base_columns, copy=False)
+
+    for i, (column, key, position) in enumerate(layout["columns"]):
+        if key == base_key:
+            continue
+
+        value = blocks[key][position]
+
+        # Pickled columns already carry the index, so only take their values
+        data.insert(i, column, value.array if key == OBJECT_BLOCK else value)
+
+    if index is not None:
+        data.index = index
+
+    return data
+
+
+def load_cached_csv(path: str, cache_path: str = CSV_CACHE_PATH) -> pd.DataFrame | None:
+    """
+    Loads a csv file from the binary cache if the cache is still valid.
+
+    :param path:
+    :param cache_path:
+    :return: The cached DataFrame, or None if there is no valid cache.
+    """
+
+    directory = get_cache_directory(path, cache_path)
+    manifest = read_manifest(directory)
+
+    if manifest is None or not is_manifest_valid(path, directory, manifest):
+        return None
+
+    try:
+        return read_frame_blocks(directory, manifest)
+    except (OSError, ValueError) as e:
+        print(warning(f"Could not read the cached copy of {path}: {e}"))
+        return None
+
+
+def cache_csv(path: str, data: pd.DataFrame, cache_path: str = CSV_CACHE_PATH):
+    """
+    Writes a parsed csv file to the binary cache.
+
+    :param path:
+    :param data:
+    :param cache_path:
+    :return:
+    """
+
+    directory = get_cache_directory(path, cache_path)
+
+    # Start from a clean directory so stale blocks don't linger
+    shutil.rmtree(directory, ignore_errors=True)
+
+    manifest = {
+        "version": CSV_CACHE_VERSION,
+        "source": os.path.abspath(path),
+        **get_file_signature(path),
+        "hash": hash_file(path),
+        **write_frame_blocks(data, directory)
+    }
+
+    write_manifest(directory, manifest)
+
+
+def get_cached_csv_file(path: str,
+                        read: Callable[[str], pd.DataFrame],
+                        cache_path: str = CSV_CACHE_PATH) -> pd.DataFrame:
+    """
+    Retrieves a csv file through the binary cache. On a miss the file is
+    parsed with the given reader and the result is written to the cache.
+
+    :param path:
+    :param read: The function that parses the csv file.
+    :param cache_path:
+    :return:
+    """
+
+    data = load_cached_csv(path, cache_path)
+
+    if data is not None:
+        return data
+
+    data = read(path)
+
+    try:
+        cache_csv(path, data, cache_path)
+    except OSError as e:
+        print(warning(f"Could not cache {path}: {e}"))
+
+    return data
+
+
+def clear_csv_cache(cache_path: str = CSV_CACHE_PATH):
+    """
+    Removes every cached csv file.
+
+    :param cache_path:
+    :return:
+    """
+
+    shutil.rmtree(cache_path, ignore_errors=True)
+
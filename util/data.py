@@ -12,6 +12,8 @@ This includes getting data, writing data, and manipulating data.
 from typing import Tuple
 
 import os
+import hashlib
+import numpy as np
 import pandas as pd
 from numpy import bool_
 
@@ -21,30 +23,42 @@ from util.constants import (
     XYZ_COLUMNS,
     STRUCTURE_IDS_COLUMN,
     CLUSTER_LABEL_COLUMN_PREFIX,
-
-    HAS_CLUSTER_IDS,
-    HAS_GENES,
-    HAS_NON_GENES,
-    HAS_XYZ,
-    HAS_STRUCTURE_IDS,
-    CAN_CLUSTER,
-    HAS_NAN,
-    CAN_VISUALIZE,
-    WAYS_TO_VISUALIZE,
+    LABEL_COLUMN_PREFIXES
 )
 
+from util.csv_cache import get_cached_csv_file
+from util.dataset_profile import DatasetProfile
+
 
-def get_csv_file(path: str) -> pd.DataFrame | None:
+def read_csv_file(path: str) -> pd.DataFrame:
+    """
+    Parses the csv file at the specified path.
+
+    :param path:
+    :return:
+    """
+
+    return pd.read_csv(path, header=0, float_precision='high', index_col=False)
+
+
+def get_csv_file(path: str, use_cache: bool = True) -> pd.DataFrame | None:
     """
     Retrieves a csv file at the specified path if it exists, otherwise
     throws an error.
 
+    The parsed file is kept in a binary cache (see util/csv_cache.py) so
+    that later retrievals of an unchanged file skip the csv parser.
+
     :param path:
+    :param use_cache: Whether to go through the binary cache.
     :return:
     """
 
     try:
-        return pd.read_csv(path, header=0, float_precision='high', index_col=False)
+        if use_cache:
+            return get_cached_csv_file(path, read_csv_file)
+
+        return read_csv_file(path)
     except FileNotFoundError:
         print(f"File not found at {path}")
         return None
@@ -60,14 +74,48 @@ def save_csv_file(data: pd.DataFrame, path: str, index=True) -> None:
     """
 
     # Create the directory if it doesn't exist
-    new_path = path.split("/")
-    new_path.pop()
-    new_path = "/".join(new_path)
-    os.makedirs(new_path, exist_ok=True)
+    new_path = os.path.dirname(path)
+
+    if new_path:
+        os.makedirs(new_path, exist_ok=True)
 
     data.to_csv(path, index=index)
 
 
+def get_memory_usage(data: pd.DataFrame | pd.Series, deep: bool = False) -> int:
+    """
+    Returns the number of bytes that a DataFrame or Series is using.
+
+    :param data:
+    :param deep: Whether to also count the contents of object columns.
+    :return:
+    """
+
+    mem_usage = data.memory_usage(index=True, deep=deep)
+
+    if isinstance(mem_usage, pd.Series):
+        return int(mem_usage.sum())
+
+    return int(mem_usage)
+
+
+def get_data_fingerprint(data: pd.DataFrame | pd.Series) -> str:
+    """
+    Returns a hash of the contents of the data, its index and its column names,
+    so results computed from the data can be reused while it stays the same.
+
+    :param data:
+    :return:
+    """
+
+    digest = hashlib.sha1(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+
+    if isinstance(data, pd.DataFrame):
+        digest.update(repr(list(data.columns)).encode())
+
+    return digest.hexdigest()
+
+
 def column_is_gene_data(column: str) -> bool:
     """
     Returns True if the column is gene data, otherwise False.
@@ -77,7 +125,7 @@ def column_is_gene_data(column: str) -> bool:
     :return:
     """
 
-    return column not in NON_GENE_COLUMNS
+    return column not in NON_GENE_COLUMNS and not str(column).startswith(LABEL_COLUMN_PREFIXES)
 
 
 def combine_data(data: pd.DataFrame, other_data: pd.DataFrame) -> pd.DataFrame:
@@ -92,28 +140,43 @@ def combine_data(data: pd.DataFrame, other_data: pd.DataFrame) -> pd.DataFrame:
     return pd.concat([data, other_data], axis=1)
 
 
-def remove_non_gene_columns(data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def get_gene_column_mask(data: pd.DataFrame) -> np.ndarray:
     """
-    Removes non-gene columns from the data and return the new data along with the removed columns.
+    Returns a mask of the columns that are gene data, i.e. neither
+    non-gene columns nor cluster and stability columns.
 
     :param data:
     :return:
     """
 
-    new_data = data.copy()
-    removed_columns = pd.DataFrame()
+    return np.array([column_is_gene_data(column) for column in data.columns], dtype=bool)
+
 
-    for column in NON_GENE_COLUMNS:
-        if column in new_data.columns:
-            new_data = new_data.drop(columns=column)
-            removed_columns[column] = data[column]
-            
-    # remove cluster ids
-    for column in get_all_cluster_id_columns(new_data):
-        new_data = new_data.drop(columns=column)
-        removed_columns[column] = data[column]
+def split_gene_columns(data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Splits the data into its gene columns and its other columns (non-gene and
+    cluster columns). The columns are sorted in one pass and each side is
+    taken with a single selection, so the data is copied once in total.
+    Both sides keep the original order of their columns.
+
+    :param data:
+    :return: The gene columns, and the other columns.
+    """
+
+    is_gene = get_gene_column_mask(data)
+
+    return data.iloc[:, np.flatnonzero(is_gene)], data.iloc[:, np.flatnonzero(~is_gene)]
+
+
+def remove_non_gene_columns(data: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Removes non-gene columns from the data and return the new data along with the removed columns.
+
+    :param data:
+    :return:
+    """
 
-    return new_data, removed_columns
+    return split_gene_columns(data)
 
 
 def contains_non_gene_columns(data: pd.DataFrame) -> bool:
@@ -229,22 +292,13 @@ def ways_to_visualize(data: pd.DataFrame) -> list[str]:
 
 def get_data_properties(data: pd.DataFrame) -> dict[str, bool_]:
     """
-    Returns the properties of the data
+    Returns the properties of the data. The data is scanned once; for a data
+    set from the cache, use Data.get_data_properties, which reuses its profile.
     :param data:
     :return:
     """
 
-    return {
-        HAS_CLUSTER_IDS: contains_cluster_ids_column(data),
-        HAS_GENES: contains_non_gene_columns(data),
-        HAS_NON_GENES: contains_non_gene_columns(data),
-        HAS_XYZ: contains_xyz_column(data),
-        HAS_STRUCTURE_IDS: contains_structure_ids_column(data),
-        CAN_CLUSTER: can_be_clustered_with_kmeans(data),
-        HAS_NAN: contains_nan(data),
-        CAN_VISUALIZE: can_be_visualized(data),
-        WAYS_TO_VISUALIZE: ways_to_visualize(data)
-    }
+    return DatasetProfile.from_data(data).get_properties()
 
 
 def has_1465_rows(data: pd.DataFrame) -> bool:
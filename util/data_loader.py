@@ -0,0 +1,111 @@
+"""
+util/data_loader.py
+
+This module is responsible for loading many csv files at once
+on a pool of workers, so that loading all the data sets at
+startup scales with the number of cores instead of the number
+of files.
+
+"""
+
+# Imports
+import os
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Executor
+
+from pandas import DataFrame
+
+# Constants
+from util.constants import LOADER_POOL_TYPES
+
+# Utilities
+from util.data import get_csv_file
+from util.compact import compact_data
+
+
+def get_csv_file_timed(path: str, compact: bool = False) -> tuple[DataFrame | None, float]:
+    """
+    Retrieves a csv file and measures how long it took.
+
+    :param path:
+    :param compact: Whether to convert the data to its compact representation, see util/compact.py.
+    :return: The data and the number of seconds it took to load it.
+    """
+
+    start = perf_counter()
+    data = get_csv_file(path)
+
+    if compact and data is not None:
+        data = compact_data(data)
+
+    return data, perf_counter() - start
+
+
+def get_worker_count(workers: int | None, jobs: int) -> int:
+    """
+    Returns the number of workers to use for a number of jobs. A worker
+    count of 0 or None means one worker per CPU.
+
+    :param workers:
+    :param jobs:
+    :return:
+    """
+
+    if not workers or workers < 1:
+        workers = os.cpu_count() or 1
+
+    return max(1, min(workers, jobs))
+
+
+def create_executor(pool_type: str, workers: int) -> Executor:
+    """
+    Creates a pool of workers.
+
+    Threads are cheap to start and share memory, and the csv parser
+    releases the GIL for most of its work. Processes sidestep the GIL
+    entirely, but the parsed data has to be sent back to this process.
+
+    :param pool_type: One of LOADER_POOL_TYPES.
+    :param workers:
+    :return:
+    """
+
+    if pool_type == "thread":
+        return ThreadPoolExecutor(max_workers=workers)
+    elif pool_type == "process":
+        return ProcessPoolExecutor(max_workers=workers)
+
+    raise ValueError(f"Invalid pool type: {pool_type}. Expected one of {LOADER_POOL_TYPES}")
+
+
+def load_csv_files(files: dict[str, str],
+                   workers: int | None = None,
+                   pool_type: str = LOADER_POOL_TYPES[0],
+                   compact: bool = False) -> tuple[dict[str, DataFrame | None], dict[str, float]]:
+    """
+    Loads csv files concurrently.
+
+    :param files: A dictionary of keys to the paths of the files to load.
+    :param workers: The number of workers, 0 or None for one per CPU.
+    :param pool_type: One of LOADER_POOL_TYPES.
+    :param compact: Whether to convert the data to its compact representation, see util/compact.py.
+    :return: The loaded data and the load time in seconds, both by key.
+    """
+
+    if not files:
+        return {}, {}
+
+    workers = get_worker_count(workers, len(files))
+
+    # Not worth starting a pool for a single worker
+    if workers == 1:
+        loaded = {key: get_csv_file_timed(path, compact) for key, path in files.items()}
+    else:
+        with create_executor(pool_type, workers) as executor:
+            futures = {key: executor.submit(get_csv_file_timed, path, compact) for key, path in files.items()}
+            loaded = {key: future.result() for key, future in futures.items()}
+
+    data = {key: result[0] for key, result in loaded.items()}
+    timings = {key: result[1] for key, result in loaded.items()}
+
+    return data, timings
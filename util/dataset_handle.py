@@ -0,0 +1,333 @@
+"""
+util/dataset_handle.py
+
+This module is responsible for providing lazy data set handles
+that can be stored as leaves in the DirectoryCache.
+
+A handle knows where its data set comes from but only loads it
+the first time it is asked for, so registering a data set is
+close to free.
+
+"""
+
+# Imports
+import os
+import csv
+import shutil
+import uuid
+from typing import Optional
+
+import pandas as pd
+from pandas import DataFrame, Series
+
+# Utilities
+from util.csv_cache import (
+    get_cache_directory,
+    get_file_signature,
+    read_manifest,
+    read_frame_blocks,
+    write_frame_blocks
+)
+
+from util.data import get_csv_file, get_memory_usage
+from util.compact import compact_data
+
+LINE_COUNT_CHUNK_SIZE = 1024 * 1024
+
+
+class DatasetHandle:
+    """
+    A class that represents a lazily loaded data set.
+
+    Attributes
+    ----------
+    data : DataFrame | Series | None
+        The loaded data set, or None if it has not been loaded yet.
+
+    Methods
+    -------
+    get() -> DataFrame | Series | None
+        Gets the data set, loading it if needed.
+    load() -> DataFrame | Series | None
+        Loads the data set. Must be implemented by the subclass.
+    unload()
+        Drops the loaded data set so it is loaded again on the next get().
+    is_loaded() -> bool
+        Checks if the data set is loaded.
+    get_bytes() -> int
+        Gets the number of bytes the loaded data set owns.
+    source_key -> str | None
+        The cache key of the data set this handle is a view of.
+    shape -> tuple[int, ...]
+        The shape of the data set, probed cheaply if it is not loaded.
+    """
+
+    def __init__(self):
+        self.data: DataFrame | Series | None = None
+
+    def get(self) -> DataFrame | Series | None:
+        """
+        Gets the data set, loading it if it has not been loaded yet.
+
+        :return:
+        """
+
+        if self.data is None:
+            self.data = self.load()
+
+        return self.data
+
+    def load(self) -> DataFrame | Series | None:
+        raise NotImplementedError("The load method must be implemented by the subclass.")
+
+    def unload(self):
+        """
+        Drops the loaded data set. It will be loaded again on the next get().
+
+        :return:
+        """
+
+        self.data = None
+
+    def is_loaded(self) -> bool:
+        return self.data is not None
+
+    def get_bytes(self) -> int:
+        """
+        Gets the number of bytes the loaded data set owns, 0 if it is not loaded.
+
+        :return:
+        """
+
+        if self.data is None:
+            return 0
+
+        return get_memory_usage(self.data)
+
+    def discard(self):
+        """
+        Releases anything the handle keeps outside of memory. Called
+        when the handle is removed from the cache.
+
+        :return:
+        """
+
+        self.unload()
+
+    @property
+    def source_key(self) -> str | None:
+        """
+        The cache key of the data set whose memory the loaded data set
+        shares, None if the handle owns its data.
+
+        :return:
+        """
+
+        return None
+
+    @property
+    def shape(self) -> tuple[int, ...]:
+        if self.data is not None:
+            return self.data.shape
+
+        return self.probe_shape()
+
+    def probe_shape(self) -> tuple[int, ...]:
+        raise NotImplementedError("The probe_shape method must be implemented by the subclass.")
+
+
+class FileDataset(DatasetHandle):
+    """
+    A class that represents a csv file that is loaded on first use.
+
+    Attributes
+    ----------
+    path : str
+        The path of the csv file.
+    compact : bool
+        Whether the data set is loaded in its compact representation, see util/compact.py.
+    """
+
+    def __init__(self, path: str, compact: bool = False):
+        super().__init__()
+        self.path = path
+        self.compact = compact
+        self.probed_shape: Optional[tuple[int, int]] = None
+
+    @staticmethod
+    def from_data(path: str, data: DataFrame, compact: bool = False) -> "FileDataset":
+        """
+        Creates a handle for a csv file that has already been loaded.
+
+        :param path:
+        :param data:
+        :param compact: Whether the data set is loaded again in its compact representation.
+        :return:
+        """
+
+        handle = FileDataset(path, compact)
+        handle.data = data
+
+        return handle
+
+    def load(self) -> DataFrame | None:
+        data = get_csv_file(self.path)
+
+        if self.compact and data is not None:
+            data = compact_data(data)
+
+        return data
+
+    def probe_shape(self) -> tuple[int, int]:
+        """
+        Gets the shape of the csv file without parsing it. The shape is
+        taken from the binary cache when it is up to date, otherwise the
+        header is read and the lines of the file are counted.
+
+        :return:
+        """
+
+        if self.probed_shape is None:
+            self.probed_shape = self.get_cached_shape() or self.count_shape()
+
+        return self.probed_shape
+
+    def get_valid_manifest(self) -> Optional[dict]:
+        """
+        Gets the binary cache manifest of the csv file.
+
+        :return: The manifest, or None if the cache is missing or out of date.
+        """
+
+        manifest = read_manifest(get_cache_directory(self.path))
+
+        if manifest is None:
+            return None
+
+        signature = get_file_signature(self.path)
+
+        if manifest["size"] != signature["size"] or manifest["mtime"] != signature["mtime"]:
+            return None
+
+        return manifest
+
+    def get_cached_shape(self) -> Optional[tuple[int, int]]:
+        """
+        Gets the shape of the csv file from the binary cache manifest.
+
+        :return: The shape, or None if the cache is missing or out of date.
+        """
+
+        manifest = self.get_valid_manifest()
+
+        if manifest is None:
+            return None
+
+        return manifest["rows"], len(manifest["columns"])
+
+    def probe_columns(self) -> list[str]:
+        """
+        Gets the column names of the csv file without parsing its rows.
+
+        :return:
+        """
+
+        if self.data is not None:
+            return list(self.data.columns)
+
+        manifest = self.get_valid_manifest()
+
+        if manifest is not None:
+            return [column for column, _, _ in manifest["columns"]]
+
+        # Parse the header only, so the names match what pandas would load
+        return list(pd.read_csv(self.path, header=0, index_col=False, nrows=0).columns)
+
+    def count_shape(self) -> tuple[int, int]:
+        """
+        Gets the shape of the csv file by reading its header and counting
+        its lines.
+
+        :return:
+        """
+
+        with open(self.path, "r", newline="") as f:
+            header = next(csv.reader(f), [])
+
+        lines = 0
+        last_chunk = b""
+
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(LINE_COUNT_CHUNK_SIZE), b""):
+                lines += chunk.count(b"\n")
+                last_chunk = chunk
+
+        # The last line may not end with a new line
+        if last_chunk and not last_chunk.endswith(b"\n"):
+            lines += 1
+
+        return max(lines - 1, 0), len(header)
+
+    def __repr__(self):
+        return f"FileDataset({self.path!r})"
+
+
+class SpilledDataset(DatasetHandle):
+    """
+    A class that represents an in-memory data set that was evicted from
+    the cache and written to disk, so that it can be loaded again.
+
+    Attributes
+    ----------
+    directory : str
+        The directory the data set was written to.
+    layout : dict
+        The block layout of the data set, see util/csv_cache.py.
+    is_series : bool
+        Whether the data set was a Series rather than a DataFrame.
+    """
+
+    def __init__(self, directory: str, layout: dict, is_series: bool = False):
+        super().__init__()
+        self.directory = directory
+        self.layout = layout
+        self.is_series = is_series
+
+    @staticmethod
+    def spill(data: DataFrame | Series, spill_path: str) -> "SpilledDataset":
+        """
+        Writes a data set to a new directory under the spill path.
+
+        :param data:
+        :param spill_path:
+        :return: A handle that loads the data set back.
+        """
+
+        directory = os.path.join(spill_path, uuid.uuid4().hex)
+        is_series = isinstance(data, Series)
+
+        if is_series:
+            data = data.to_frame()
+
+        return SpilledDataset(directory, write_frame_blocks(data, directory), is_series)
+
+    def load(self) -> DataFrame | Series:
+        data = read_frame_blocks(self.directory, self.layout)
+
+        if self.is_series:
+            return data.iloc[:, 0]
+
+        return data
+
+    def probe_shape(self) -> tuple[int, ...]:
+        if self.is_series:
+            return (self.layout["rows"],)
+
+        return self.layout["rows"], len(self.layout["columns"])
+
+    def discard(self):
+        super().discard()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __repr__(self):
+        return f"SpilledDataset({self.directory!r})"
@@ -0,0 +1,183 @@
+"""
+util/dataset_profile.py
+
+This module is responsible for describing a data set once, so that the
+drivers can check what a data set can be used for without scanning it
+again every time it is picked.
+
+A profile is computed in a single pass over the data set and is kept
+by the DirectoryCache next to the data set, until the data set is
+replaced or removed.
+
+"""
+
+# Imports
+from typing import Iterable, Optional
+
+from pandas import DataFrame, Series
+
+# Constants
+from util.constants import (
+    NON_GENE_COLUMNS,
+    XYZ_COLUMNS,
+    STRUCTURE_IDS_COLUMN,
+    CLUSTER_LABEL_COLUMN_PREFIX,
+    LABEL_COLUMN_PREFIXES,
+
+    HAS_CLUSTER_IDS,
+    HAS_GENES,
+    HAS_NON_GENES,
+    HAS_XYZ,
+    HAS_STRUCTURE_IDS,
+    CAN_CLUSTER,
+    HAS_NAN,
+    CAN_VISUALIZE,
+    WAYS_TO_VISUALIZE,
+)
+
+
+class DatasetProfile:
+    """
+    A class that represents the properties of a data set.
+
+    Attributes
+    ----------
+    rows : int
+        The number of rows.
+    columns : list[str]
+        The column names, in order.
+    dtypes : dict[str, str]
+        The dtype of every column.
+    nan_counts : dict[str, int]
+        The number of missing values of every column.
+    cluster_columns : list[str]
+        The Cluster_K columns.
+    structure_ids : frozenset[int]
+        The Structure-IDs in the data set, empty if it has none.
+
+    Methods
+    -------
+    from_data(data: DataFrame | Series) -> DatasetProfile
+        Profiles a data set.
+    describes(data: DataFrame | Series) -> bool
+        Checks if the profile still matches the shape, columns and dtypes of a data set.
+    get_nan_count(columns: Iterable[str]) -> int
+        Gets the number of missing values of some columns.
+    get_properties(columns: Iterable[str]) -> dict[str, bool | list[str]]
+        Gets the properties of the data set, see util/data.py.
+    """
+
+    def __init__(self,
+                 rows: int,
+                 columns: list[str],
+                 dtypes: dict[str, str],
+                 nan_counts: dict[str, int],
+                 structure_ids: frozenset[int]):
+        self.rows = rows
+        self.columns = columns
+        self.dtypes = dtypes
+        self.nan_counts = nan_counts
+        self.structure_ids = structure_ids
+        self.cluster_columns = [column for column in columns if column.startswith(CLUSTER_LABEL_COLUMN_PREFIX)]
+
+    @staticmethod
+    def from_data(data: DataFrame | Series) -> "DatasetProfile":
+        """
+        Profiles a data set in a single pass.
+
+        :param data:
+        :return:
+        """
+
+        if isinstance(data, Series):
+            data = data.to_frame()
+
+        columns = [str(column) for column in data.columns]
+        structure_ids = frozenset()
+
+        if STRUCTURE_IDS_COLUMN in data.columns:
+            structure_ids = frozenset(data[STRUCTURE_IDS_COLUMN].dropna().unique().tolist())
+
+        return DatasetProfile(
+            rows=len(data.index),
+            columns=columns,
+            dtypes=dict(zip(columns, (str(dtype) for dtype in data.dtypes))),
+            nan_counts=dict(zip(columns, data.isna().sum().tolist())),
+            structure_ids=structure_ids
+        )
+
+    def describes(self, data: DataFrame | Series) -> bool:
+        """
+        Checks if the profile still matches the shape, columns and dtypes of
+        a data set. Drivers add columns to cached data sets in place, after
+        which the profile no longer describes them.
+
+        :param data:
+        :return:
+        """
+
+        if isinstance(data, Series):
+            data = data.to_frame()
+
+        return (
+            self.rows == len(data.index)
+            and self.columns == [str(column) for column in data.columns]
+            and list(self.dtypes.values()) == [str(dtype) for dtype in data.dtypes]
+        )
+
+    def get_nan_count(self, columns: Optional[Iterable[str]] = None) -> int:
+        """
+        Gets the number of missing values of some columns.
+
+        :param columns: The columns to count, None for all of them.
+        :return:
+        """
+
+        if columns is None:
+            return sum(self.nan_counts.values())
+
+        return sum(self.nan_counts.get(str(column), 0) for column in columns)
+
+    def get_properties(self, columns: Optional[Iterable[str]] = None) -> dict[str, bool | list[str]]:
+        """
+        Gets the properties of the data set, or of some of its columns
+        (ex: only the gene columns, to check if they can be clustered).
+
+        :param columns: The columns to describe, None for all of them.
+        :return: The same properties as get_data_properties in util/data.py.
+        """
+
+        columns = self.columns if columns is None else [str(column) for column in columns]
+        column_set = set(columns)
+
+        has_cluster_ids = any(column.startswith(CLUSTER_LABEL_COLUMN_PREFIX) for column in columns)
+        has_non_genes = any(column in column_set for column in NON_GENE_COLUMNS)
+        has_xyz = all(column in column_set for column in XYZ_COLUMNS)
+        has_nan = self.get_nan_count(columns) > 0
+
+        ways_to_visualize = []
+
+        if has_xyz:
+            ways_to_visualize.append("scatter")
+
+            if has_cluster_ids:
+                ways_to_visualize.append("scatter_clustered")
+
+        return {
+            HAS_CLUSTER_IDS: has_cluster_ids,
+            HAS_GENES: any(
+                column not in NON_GENE_COLUMNS and not column.startswith(LABEL_COLUMN_PREFIXES)
+                for column in columns
+            ),
+            HAS_NON_GENES: has_non_genes,
+            HAS_XYZ: has_xyz,
+            HAS_STRUCTURE_IDS: STRUCTURE_IDS_COLUMN in column_set,
+            # NAN values cannot be clustered
+            CAN_CLUSTER: not has_nan,
+            HAS_NAN: has_nan,
+            CAN_VISUALIZE: has_xyz,
+            WAYS_TO_VISUALIZE: ways_to_visualize
+        }
+
+    def __repr__(self):
+        return f"DatasetProfile(rows={self.rows}, columns={len(self.columns)}, nan={self.get_nan_count()})"
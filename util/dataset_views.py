@@ -0,0 +1,215 @@
+"""
+util/dataset_views.py
+
+This module is responsible for providing light-weight views over
+a single shared data set, so that every gene and Structure-ID of
+the MASTER data set can be stored in the DirectoryCache without
+parsing or copying the data set again.
+
+Ex: Coronal/Density/Genes/Actb-74881516: <4.3K> view of MASTER
+    Coronal/Density/Structure-IDs/773:   <312 x 1465> view of MASTER
+
+"""
+
+# Imports
+import weakref
+from typing import Callable, Optional
+
+import numpy as np
+from pandas import DataFrame, Series
+
+# Constants
+from util.constants import STRUCTURE_IDS_COLUMN
+
+# Utilities
+from util.dataset_handle import DatasetHandle
+
+
+class SharedDataset:
+    """
+    A class that represents a data set shared by many views.
+
+    The row positions of every Structure-ID are computed once, in a
+    single pass over the Structure-ID column, and reused by every
+    StructureView.
+
+    Attributes
+    ----------
+    source : Callable[[], DataFrame | None]
+        Returns the shared data set, loading it if needed.
+    key : str | None
+        The cache key of the shared data set.
+    raw_source : Callable[[], DataFrame | DatasetHandle | None]
+        Returns the shared data set without loading it, the source if not given.
+
+    Methods
+    -------
+    get() -> DataFrame | None
+        Gets the shared data set.
+    get_shape() -> tuple[int, ...] | None
+        Gets the shape of the shared data set without loading it.
+    get_structure_rows() -> dict[int, np.ndarray]
+        Gets the row positions of every Structure-ID.
+    """
+
+    def __init__(self,
+                 source: Callable[[], DataFrame | None],
+                 key: Optional[str] = None,
+                 raw_source: Optional[Callable[[], DataFrame | DatasetHandle | None]] = None):
+        self.source = source
+        self.key = key
+        self.raw_source = raw_source or source
+        # Only a weak reference, so an evicted data set can be freed
+        self.source_ref: Callable[[], DataFrame | DatasetHandle | None] = lambda: None
+        self.structure_rows: dict[int, np.ndarray] | None = None
+
+    def check_source(self):
+        """
+        Drops the Structure-ID index if the shared data set was replaced
+        in the meantime. A handle that was evicted and loaded again still
+        holds the same data set, so its index is kept.
+
+        :return:
+        """
+
+        value = self.raw_source()
+
+        if value is not self.source_ref():
+            self.source_ref = (lambda: None) if value is None else weakref.ref(value)
+            self.structure_rows = None
+
+    def get(self) -> DataFrame | None:
+        """
+        Gets the shared data set.
+
+        :return:
+        """
+
+        self.check_source()
+
+        return self.source()
+
+    def get_shape(self) -> tuple[int, ...] | None:
+        """
+        Gets the shape of the shared data set, from its handle when it is
+        not loaded.
+
+        :return: The shape, or None if there is no shared data set.
+        """
+
+        value = self.raw_source()
+
+        return None if value is None else value.shape
+
+    def get_structure_rows(self) -> dict[int, np.ndarray]:
+        """
+        Gets the row positions of every Structure-ID in the shared data set.
+        The data set is only loaded to build them.
+
+        :return:
+        """
+
+        self.check_source()
+
+        if self.structure_rows is None:
+            data = self.get()
+
+            if data is None or STRUCTURE_IDS_COLUMN not in data.columns:
+                self.structure_rows = {}
+            else:
+                structure_ids, inverse = np.unique(data[STRUCTURE_IDS_COLUMN].to_numpy(), return_inverse=True)
+
+                # A stable sort keeps the rows of each structure in their original order
+                order = np.argsort(inverse, kind="stable")
+                bounds = np.cumsum(np.bincount(inverse, minlength=len(structure_ids)))[:-1]
+
+                self.structure_rows = {
+                    structure_id.item(): rows
+                    for structure_id, rows in zip(structure_ids, np.split(order, bounds))
+                }
+
+        return self.structure_rows
+
+
+class GeneView(DatasetHandle):
+    """
+    A class that represents a single gene column of a shared data set.
+    The column is a view of the shared data, it is never copied.
+
+    Attributes
+    ----------
+    shared : SharedDataset
+        The data set the gene belongs to.
+    column : str
+        The name of the gene column.
+    rows : int
+        The number of rows of the shared data set.
+    """
+
+    def __init__(self, shared: SharedDataset, column: str, rows: int):
+        super().__init__()
+        self.shared = shared
+        self.column = column
+        self.rows = rows
+
+    def load(self) -> Series | None:
+        data = self.shared.get()
+
+        if data is None:
+            return None
+
+        return data[self.column]
+
+    def get_bytes(self) -> int:
+        # The column belongs to the shared data set, the view is evicted with it
+        return 0
+
+    @property
+    def source_key(self) -> str | None:
+        return self.shared.key
+
+    def probe_shape(self) -> tuple[int]:
+        return (self.rows,)
+
+    def __repr__(self):
+        return f"GeneView({self.column!r})"
+
+
+class StructureView(DatasetHandle):
+    """
+    A class that represents the rows of a single Structure-ID of a shared
+    data set. Only the row positions are kept; the rows are taken from
+    the shared data set when the view is first used.
+
+    Attributes
+    ----------
+    shared : SharedDataset
+        The data set the structure belongs to.
+    structure_id : int
+        The Structure-ID of the rows.
+    """
+
+    def __init__(self, shared: SharedDataset, structure_id: int):
+        super().__init__()
+        self.shared = shared
+        self.structure_id = structure_id
+
+    def get_rows(self) -> np.ndarray:
+        return self.shared.get_structure_rows().get(self.structure_id, np.empty(0, dtype=np.intp))
+
+    def load(self) -> DataFrame | None:
+        data = self.shared.get()
+
+        if data is None:
+            return None
+
+        return data.take(self.get_rows())
+
+    def probe_shape(self) -> tuple[int, int]:
+        shape = self.shared.get_shape()
+        columns = 0 if shape is None else shape[1]
+
+        return len(self.get_rows()), columns
+
+    def __repr__(self):
+        return f"StructureView({self.structure_id!r})"
@@ -9,12 +9,25 @@ other data structures.
 """
 
 # Imports
+import os
+import uuid
+import atexit
+import shutil
 from typing import Optional, TypeVar
 
+from pandas import DataFrame, Series
+
 from util.cache import Cache
+from util.dataset_handle import DatasetHandle, SpilledDataset
+from util.suggestion_index import SuggestionIndex
+from util.dataset_profile import DatasetProfile
 
 # Constants
-from util.constants import CACHE_SIZE
+from util.constants import CACHE_SIZE, EVICTION_POLICIES, SPILL_PATH, SUGGESTION_COUNT
+
+# Utilities
+from util.data import get_memory_usage
+from util.print import warning
 
 T = TypeVar("T")
 
@@ -28,12 +41,32 @@ class DirectoryCache(Cache[T | dict[str, T]]):
     cache : dict[str, Any]
         A dictionary that stores the key-value pairs.
     size : int
-        The size of the cache.
+        The maximum number of loaded leaves.
+    max_bytes : int
+        The maximum number of bytes of the loaded leaves, 0 for no limit.
+    leaf_bytes : dict[str, int]
+        The number of bytes of every loaded leaf.
+    total_bytes : int
+        The number of bytes of all the loaded leaves.
+    directory_bytes : dict[str, int]
+        The number of bytes of the loaded leaves under every directory path.
+    leaf_paths : set[str]
+        The paths of all the leaves, for O(1) lookups.
+    sorted_leaf_paths : list[str] | None
+        The paths of all the leaves in sorted order, None until they are needed again after a change.
+    directory_counts : dict[str, int]
+        The number of leaves under every directory path.
+    suggestions : SuggestionIndex
+        A trigram index of the leaf paths, for suggesting paths.
+    profiles : dict[str, DatasetProfile]
+        The profile of every leaf that was profiled, until it is replaced or removed.
 
     Methods
     -------
     get(key: str) -> Any
         Gets the value from the cache based on the key.
+    get_raw(key: str) -> Any
+        Gets the value from the cache without loading lazy leaves.
     set(key: str, value: Any)
         Sets the value in the cache based on the key.
     has(key: str) -> bool
@@ -44,18 +77,83 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         Clears the cache except for the specified keys.
     remove(key: str)
         Removes the key from the cache.
+    evict(key: str) -> bool
+        Frees the memory of a leaf, keeping it loadable.
+    evict_views(key: str)
+        Evicts the loaded views of a leaf.
+    suggest(key: str, k: int) -> list[str]
+        Gets the leaf paths most alike to a key.
+    get_profile(key: str) -> DatasetProfile | None
+        Gets the profile of a leaf, profiling it the first time.
+    get_bytes(key: str, deep: bool) -> int
+        Gets the number of bytes of the loaded leaves under a key.
+    get_bytes_breakdown(deep: bool) -> dict[str, int]
+        Gets the number of bytes of every top-level directory.
     items()
         Gets the items in the cache.
     """
 
-    def __init__(self, size: Optional[int] = None):
-        super().__init__(size)
-        self.all_directories = []   # To improve performance, we can store all the directories in a list
+    def __init__(self,
+                 size: Optional[int] = None,
+                 max_bytes: int = 0,
+                 policy: str = EVICTION_POLICIES[0],
+                 spill_path: str = SPILL_PATH):
+        super().__init__(size, policy)
+
+        # The nested dictionary is the trie of the paths. These indices are updated
+        # on every set and remove, in O(depth), so lookups never walk the tree.
+        # The sorted paths are only sorted again when they are asked for after a change.
+        self.leaf_paths: set[str] = set()
+        self.sorted_leaf_paths: list[str] | None = []
+        self.directory_counts: dict[str, int] = {}
+        self.suggestions = SuggestionIndex()
+
+        # Profiles survive eviction, which does not change the data
+        self.profiles: dict[str, DatasetProfile] = {}
+
+        self.max_bytes = max_bytes
+        self.leaf_bytes: dict[str, int] = {}
+        self.total_bytes = 0
+        self.directory_bytes: dict[str, int] = {}
+
+        # Every cache spills into its own directory, removed when the program exits
+        self.spill_path = os.path.join(spill_path, uuid.uuid4().hex)
+        self.has_spilled = False
 
     def get(self, key: str) -> T:
         """
         Gets the value from the cache based on the key.
 
+        If the value is a lazy DatasetHandle, it is loaded
+        and its data is returned.
+
+        :param key:
+        :return:
+        """
+
+        data = self.get_raw(key)
+
+        if isinstance(data, DatasetHandle):
+            was_loaded = data.is_loaded()
+            value = data.get()
+
+            if not was_loaded and data.is_loaded():
+                self.track(key, data)
+                self.enforce_limits(protected=key)
+            else:
+                self.policy.touch(key)
+
+            return value
+
+        self.policy.touch(key)
+
+        return data
+
+    def get_raw(self, key: str) -> T | DatasetHandle:
+        """
+        Gets the value from the cache based on the key
+        without loading lazy DatasetHandles.
+
         :param key:
         :return:
         """
@@ -65,7 +163,7 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         data = self.cache
 
         for k in keys:
-            if k in data:
+            if isinstance(data, dict) and k in data:
                 data = data[k]
             else:
                 return None
@@ -87,17 +185,25 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         keys = key.split("/")
         data = self.cache
 
-        for k in keys[:-1]:
-            if k not in data:
+        for i, k in enumerate(keys[:-1]):
+            if k not in data or not isinstance(data[k], dict):
+                # A leaf in the way of the path is replaced by a directory
+                if k in data:
+                    self.untrack_subtree("/".join(keys[:i + 1]), data[k])
                 data[k] = {}
             data = data[k]
 
+        if keys[-1] in data and data[keys[-1]] is not value:
+            self.untrack_subtree(key, data[keys[-1]])
+
+        # Setting the same value again may mean that it was changed in place
+        self.profiles.pop(key, None)
+
         data[keys[-1]] = value
 
-        if len(self.cache) >= self.size:
-            self.cache.popitem()
+        self.index_subtree(key, value)
 
-        self.compute_all_directories()
+        self.enforce_limits(protected=key)
 
     def has(self, key: str) -> bool:
         """
@@ -107,37 +213,392 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         :return: True if the cache has the key, False otherwise.
         """
 
+        return key in self.leaf_paths or key in self.directory_counts
+
+    def remove(self, key: str):
+        """
+        Removes the key from the cache. Directories that are
+        left empty are removed as well.
+
+        :param key:
+        :return:
+        """
+
+        if not self.has(key):
+            return
+
         keys = key.split("/")
-        data = self.cache
+        parents = [self.cache]
 
-        for k in keys:
-            if k in data:
-                data = data[k]
-            else:
-                return False
+        for k in keys[:-1]:
+            parents.append(parents[-1][k])
 
-        return True
+        self.untrack_subtree(key, parents[-1].pop(keys[-1]))
 
-    def remove(self, key: str):
+        # Prune the directories that no longer have any leaves
+        for k, parent in zip(reversed(keys[:-1]), reversed(parents[:-1])):
+            if parent[k]:
+                break
+            parent.pop(k)
+
+    def clear(self):
+        """
+        Clears the cache.
         """
-        Removes the key from the cache.
+
+        for key, value in list(self.cache.items()):
+            self.untrack_subtree(key, value)
+
+        super().clear()
+        self.compute_all_directories()
+
+    def index_add(self, key: str):
+        """
+        Adds a leaf path to the indices.
+
+        :param key:
+        :return:
+        """
+
+        if key in self.leaf_paths:
+            return
+
+        self.leaf_paths.add(key)
+        self.sorted_leaf_paths = None
+        self.suggestions.add(key)
+
+        for directory in self.get_parent_directories(key):
+            self.directory_counts[directory] = self.directory_counts.get(directory, 0) + 1
+
+    def index_remove(self, key: str):
+        """
+        Removes a leaf path from the indices.
+
+        :param key:
+        :return:
+        """
+
+        if key not in self.leaf_paths:
+            return
+
+        self.leaf_paths.remove(key)
+        self.sorted_leaf_paths = None
+        self.suggestions.remove(key)
+        self.profiles.pop(key, None)
+
+        for directory in self.get_parent_directories(key):
+            self.directory_counts[directory] -= 1
+
+            if not self.directory_counts[directory]:
+                del self.directory_counts[directory]
+
+    def index_subtree(self, key: str, value: T | dict[str, T]):
+        """
+        Adds every leaf under a key that was just set to the indices
+        and starts accounting for the loaded ones.
+
+        :param key:
+        :param value:
+        :return:
+        """
+
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self.index_subtree(f"{key}/{k}", v)
+            return
+
+        self.index_add(key)
+
+        if not isinstance(value, DatasetHandle) or value.is_loaded():
+            self.track(key, value)
+
+    def get_profile(self, key: str) -> DatasetProfile | None:
+        """
+        Gets the profile of a leaf. The leaf is profiled, and loaded if
+        needed, the first time; after that the profile is reused until
+        the leaf is replaced or removed, or its loaded data set no longer
+        has the shape, columns and dtypes it was profiled with.
+
+        :param key:
+        :return: The profile, or None if the key is not a data set.
+        """
+
+        profile = self.profiles.get(key)
+
+        if profile is not None:
+            value = self.get_raw(key)
+            data = value.data if isinstance(value, DatasetHandle) else value
+
+            # An evicted data set is loaded again unchanged, a loaded one may have been changed in place
+            if isinstance(data, (DataFrame, Series)) and not profile.describes(data):
+                del self.profiles[key]
+                profile = None
+
+        if profile is None and self.is_leaf(key):
+            data = self.get(key)
+
+            if isinstance(data, (DataFrame, Series)):
+                profile = self.profiles[key] = DatasetProfile.from_data(data)
+
+        return profile
+
+    @staticmethod
+    def get_parent_directories(key: str) -> list[str]:
+        """
+        Gets the paths of the directories that contain a key.
+        Ex: "a/b/c" -> ["a", "a/b"]
 
         :param key:
         :return:
         """
 
+        keys = key.split("/")
+
+        return ["/".join(keys[:i]) for i in range(1, len(keys))]
+
+    def get_leaf_bytes(self, value: T) -> int:
+        """
+        Gets the number of bytes a leaf is using.
+
+        :param value:
+        :return:
+        """
+
+        if isinstance(value, DatasetHandle):
+            return value.get_bytes()
+
+        if isinstance(value, (DataFrame, Series)):
+            return get_memory_usage(value)
+
+        return 0
+
+    def track(self, key: str, value: T):
+        """
+        Starts accounting for a loaded leaf.
+
+        :param key:
+        :param value:
+        :return:
+        """
+
+        nbytes = self.get_leaf_bytes(value)
+
+        self.add_bytes(key, nbytes - self.leaf_bytes.get(key, 0))
+        self.leaf_bytes[key] = nbytes
+        self.policy.add(key)
+
+    def untrack(self, key: str):
+        """
+        Stops accounting for a leaf.
+
+        :param key:
+        :return:
+        """
+
+        self.add_bytes(key, -self.leaf_bytes.pop(key, 0))
+        self.policy.remove(key)
+
+    def add_bytes(self, key: str, nbytes: int):
+        """
+        Adds bytes to the total and to every directory that contains a key.
+
+        :param key:
+        :param nbytes: The number of bytes to add, negative to subtract.
+        :return:
+        """
+
+        if not nbytes:
+            return
+
+        self.total_bytes += nbytes
+
+        for directory in self.get_parent_directories(key):
+            self.directory_bytes[directory] = self.directory_bytes.get(directory, 0) + nbytes
+
+            if not self.directory_bytes[directory]:
+                del self.directory_bytes[directory]
+
+    def get_bytes(self, key: Optional[str] = None, deep: bool = False) -> int:
+        """
+        Gets the number of bytes of the loaded leaves under a key.
+
+        The shallow number is kept up to date on every change, so it
+        is O(1). The deep number also counts the contents of object
+        columns, so it is computed on demand.
+
+        :param key: A directory or leaf path, None for the whole cache.
+        :param deep: Whether to count the contents of object columns.
+        :return:
+        """
+
+        if deep:
+            return sum(
+                get_memory_usage(value, deep=True)
+                for path, value in self.get_loaded_leafs(key)
+                if isinstance(value, (DataFrame, Series)) and self.leaf_bytes.get(path)
+            )
+
+        if key is None:
+            return self.total_bytes
+
+        return self.leaf_bytes.get(key, self.directory_bytes.get(key, 0))
+
+    def get_bytes_breakdown(self, deep: bool = False) -> dict[str, int]:
+        """
+        Gets the number of bytes of every top-level directory (and leaf).
+        Ex: {"Coronal": 51200000, "Shared": 1024000, "Generated": 0}
+
+        :param deep: Whether to count the contents of object columns.
+        :return:
+        """
+
+        return {key: self.get_bytes(key, deep) for key in self.cache}
+
+    def get_loaded_leafs(self, key: Optional[str] = None) -> list[tuple[str, T]]:
+        """
+        Gets the paths and values of the loaded leaves under a key.
+
+        :param key: A directory or leaf path, None for the whole cache.
+        :return:
+        """
+
+        if key is None:
+            keys = self.leaf_bytes
+        else:
+            keys = [path for path in self.leaf_bytes if path == key or path.startswith(f"{key}/")]
+
+        loaded = []
+
+        for path in keys:
+            value = self.get_raw(path)
+            loaded.append((path, value.data if isinstance(value, DatasetHandle) else value))
+
+        return loaded
+
+    def untrack_subtree(self, key: str, value: T | dict[str, T]):
+        """
+        Stops accounting for every leaf under a key that is being
+        removed from the cache.
+
+        :param key:
+        :param value:
+        :return:
+        """
+
+        if isinstance(value, dict):
+            for k, v in value.items():
+                self.untrack_subtree(f"{key}/{k}", v)
+            return
+
+        self.untrack(key)
+        self.index_remove(key)
+
+        if isinstance(value, DatasetHandle):
+            value.discard()
+
+        self.evict_views(key)
+
+    def replace_leaf(self, key: str, value: T):
+        """
+        Replaces the value of a leaf without any accounting.
+
+        :param key:
+        :param value:
+        :return:
+        """
+
         keys = key.split("/")
         data = self.cache
 
         for k in keys[:-1]:
-            if k in data:
-                data = data[k]
-            else:
+            data = data[k]
+
+        data[keys[-1]] = value
+
+    def is_over_limits(self) -> bool:
+        """
+        Checks if the loaded leaves exceed the count or byte limit.
+
+        :return:
+        """
+
+        if len(self.leaf_bytes) > self.size:
+            return True
+
+        return bool(self.max_bytes) and self.total_bytes > self.max_bytes
+
+    def enforce_limits(self, protected: Optional[str] = None):
+        """
+        Evicts leaves in the order of the eviction policy until
+        the loaded leaves are within the limits again.
+
+        :param protected: A key that must not be evicted, usually the one just used.
+        :return:
+        """
+
+        if not self.is_over_limits():
+            return
+
+        for key in self.policy.victims():
+            # Views are evicted along with the data set they share, they may be gone already
+            if key != protected and key in self.leaf_bytes:
+                self.evict(key)
+
+            if not self.is_over_limits():
                 return
 
-        data.pop(keys[-1])
+    def evict(self, key: str) -> bool:
+        """
+        Frees the memory of a leaf while keeping it in the cache.
+        Handles are unloaded, in-memory data sets are spilled to disk.
 
-        self.compute_all_directories()
+        :param key:
+        :return: True if the leaf was evicted, False otherwise.
+        """
+
+        value = self.get_raw(key)
+
+        if isinstance(value, DatasetHandle):
+            value.unload()
+
+        elif isinstance(value, (DataFrame, Series)) and not (isinstance(value, DataFrame)
+                                                             and value.columns.has_duplicates):
+            try:
+                spilled = SpilledDataset.spill(value, self.spill_path)
+            except OSError as e:
+                print(warning(f"Could not evict {key}: {e}"))
+                return False
+
+            if not self.has_spilled:
+                self.has_spilled = True
+                atexit.register(shutil.rmtree, self.spill_path, True)
+
+            self.replace_leaf(key, spilled)
+
+        else:
+            return False
+
+        self.untrack(key)
+        self.evict_views(key)
+
+        return True
+
+    def evict_views(self, key: str):
+        """
+        Evicts the loaded leaves that are views of a leaf (see
+        DatasetHandle.source_key). A view does not count the memory it
+        shares, so it must not keep that memory alive once the leaf it
+        shares it with is evicted, replaced or removed.
+
+        :param key:
+        :return:
+        """
+
+        for path in list(self.leaf_bytes):
+            value = self.get_raw(path)
+
+            if isinstance(value, DatasetHandle) and value.source_key == key:
+                self.evict(path)
 
     def print_tree(self):
         """
@@ -186,7 +647,8 @@ class DirectoryCache(Cache[T | dict[str, T]]):
 
     def get_leafs_values(self) -> list[T]:
         """
-        Get the leaf nodes of the cache.
+        Get the leaf nodes of the cache. Lazy DatasetHandles
+        that have not been loaded yet are skipped.
 
         :return: The leaf nodes of the cache.
         """
@@ -206,6 +668,9 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         for key, value in data.items():
             if isinstance(value, dict):
                 leafs.extend(self.get_leafs_values_recursive(value))
+            elif isinstance(value, DatasetHandle):
+                if value.is_loaded():
+                    leafs.append(value.data)
             else:
                 leafs.append(value)
 
@@ -215,32 +680,24 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         """
         Get the leaf nodes of the cache.
 
-        :return: The leaf nodes of the cache.
+        :return: The paths of the leaf nodes of the cache, sorted.
         """
 
-        return self.get_leafs_recursive(self.cache)
+        return list(self.get_sorted_leaf_paths())
 
-    def get_leafs_recursive(self, data: dict[str, T], path: str = "") -> list[str]:
-        """
-        Get the leaf nodes of the cache recursively.
+    def count(self):
+        return len(self.leaf_paths)
 
-        :param data:
-        :param path:
-        :return: The leaf nodes of the cache.
+    def suggest(self, key: str, k: int = SUGGESTION_COUNT) -> list[str]:
         """
+        Gets the leaf paths most alike to a key, best first.
 
-        leafs = []
-
-        for key, value in data.items():
-            if isinstance(value, dict):
-                leafs.extend(self.get_leafs_recursive(value, f"{path}/{key}"))
-            else:
-                leafs.append(f"{path}/{key}")
-
-        return leafs
+        :param key:
+        :param k: The number of suggestions.
+        :return:
+        """
 
-    def count(self):
-        return len(self.get_leafs())
+        return self.suggestions.query(key, k)
 
     def is_leaf(self, key: str) -> bool:
         """
@@ -250,7 +707,7 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         :return: True if the key is a leaf node, False otherwise.
         """
 
-        return key in self.get_leafs()
+        return key in self.leaf_paths
 
     def get_all_directories(self) -> list[str]:
         """
@@ -259,16 +716,38 @@ class DirectoryCache(Cache[T | dict[str, T]]):
         :return: All the directories in the cache.
         """
 
-        return self.all_directories
+        return list(self.get_sorted_leaf_paths())
+
+    def get_sorted_leaf_paths(self) -> list[str]:
+        """
+        Gets the paths of all the leaves in sorted order. They are sorted
+        once after any number of changes, in O(n log n), instead of on
+        every change.
+
+        :return: The sorted paths, which must not be changed by the caller.
+        """
+
+        if self.sorted_leaf_paths is None:
+            self.sorted_leaf_paths = sorted(self.leaf_paths)
+
+        return self.sorted_leaf_paths
 
     def compute_all_directories(self):
         """
-        Get all the directories in the cache.
+        Rebuild the path indices from the whole tree. The indices are
+        kept up to date by set and remove, so this is only needed if
+        the tree was modified directly.
 
-        :return: All the directories in the cache.
+        :return:
         """
 
-        self.all_directories = self.get_all_directories_recursive(self.cache)
+        self.leaf_paths = set()
+        self.sorted_leaf_paths = []
+        self.directory_counts = {}
+        self.suggestions.clear()
+
+        for key in self.get_all_directories_recursive(self.cache):
+            self.index_add(key)
 
     def get_all_directories_recursive(self, data: dict[str, T], path: str = "") -> list[str]:
         """
@@ -0,0 +1,142 @@
+"""
+util/eviction.py
+
+This module is responsible for providing eviction policies that
+decide which entry of a cache should be dropped first when the
+cache runs out of room.
+
+"""
+
+# Imports
+from collections import OrderedDict
+from itertools import count
+from typing import Iterator
+
+# Constants
+from util.constants import EVICTION_POLICIES
+
+
+class EvictionPolicy:
+    """
+    A class that keeps track of how the keys of a cache are used.
+
+    Methods
+    -------
+    add(key: str)
+        Starts tracking a key.
+    touch(key: str)
+        Records that a key was used.
+    remove(key: str)
+        Stops tracking a key.
+    clear()
+        Stops tracking every key.
+    victims() -> Iterator[str]
+        Iterates over the keys in the order they should be evicted.
+    """
+
+    def add(self, key: str):
+        raise NotImplementedError("The add method must be implemented by the subclass.")
+
+    def touch(self, key: str):
+        raise NotImplementedError("The touch method must be implemented by the subclass.")
+
+    def remove(self, key: str):
+        raise NotImplementedError("The remove method must be implemented by the subclass.")
+
+    def clear(self):
+        raise NotImplementedError("The clear method must be implemented by the subclass.")
+
+    def victims(self) -> Iterator[str]:
+        raise NotImplementedError("The victims method must be implemented by the subclass.")
+
+    def __contains__(self, key: str) -> bool:
+        raise NotImplementedError("The __contains__ method must be implemented by the subclass.")
+
+    def __len__(self) -> int:
+        raise NotImplementedError("The __len__ method must be implemented by the subclass.")
+
+
+class LRUPolicy(EvictionPolicy):
+    """
+    Evicts the least recently used key first.
+    """
+
+    def __init__(self):
+        self.keys: OrderedDict[str, None] = OrderedDict()
+
+    def add(self, key: str):
+        self.keys[key] = None
+        self.keys.move_to_end(key)
+
+    def touch(self, key: str):
+        if key in self.keys:
+            self.keys.move_to_end(key)
+
+    def remove(self, key: str):
+        self.keys.pop(key, None)
+
+    def clear(self):
+        self.keys.clear()
+
+    def victims(self) -> Iterator[str]:
+        # Copy the keys so the caller can evict while iterating
+        return iter(list(self.keys))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class LFUPolicy(EvictionPolicy):
+    """
+    Evicts the least frequently used key first. Ties are broken
+    by evicting the least recently used key.
+    """
+
+    def __init__(self):
+        self.uses: dict[str, int] = {}
+        self.last_used: dict[str, int] = {}
+        self.clock = count()
+
+    def add(self, key: str):
+        self.uses[key] = self.uses.get(key, 0) + 1
+        self.last_used[key] = next(self.clock)
+
+    def touch(self, key: str):
+        if key in self.uses:
+            self.add(key)
+
+    def remove(self, key: str):
+        self.uses.pop(key, None)
+        self.last_used.pop(key, None)
+
+    def clear(self):
+        self.uses.clear()
+        self.last_used.clear()
+
+    def victims(self) -> Iterator[str]:
+        return iter(sorted(self.uses, key=lambda k: (self.uses[k], self.last_used[k])))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.uses
+
+    def __len__(self) -> int:
+        return len(self.uses)
+
+
+def create_eviction_policy(name: str = EVICTION_POLICIES[0]) -> EvictionPolicy:
+    """
+    Creates an eviction policy by name.
+
+    :param name: One of EVICTION_POLICIES.
+    :return:
+    """
+
+    if name == "lru":
+        return LRUPolicy()
+    elif name == "lfu":
+        return LFUPolicy()
+
+    raise ValueError(f"Invalid eviction policy: {name}. Expected one of {EVICTION_POLICIES}")
@@ -147,16 +147,20 @@ def get_text_input_with_back(message: str, default: Optional[str] = None, can_go
     return choice, False
 
 
-def get_int_input(message: str) -> int:
+def get_int_input(message: str, default: Optional[int] = None) -> int:
     """
     Gets an integer input from the user and returns it.
 
     :param message:
+    :param default:
     :return:
     """
 
     choice = input(message)
 
+    if not choice and default is not None:
+        return default
+
     while not choice.isdigit():
         print(error("Invalid choice. Please try again."))
         choice = input()
@@ -257,6 +261,29 @@ def get_comma_separated_int_input(message: str,
 
     return new_choices
 
+
+def get_comma_separated_float_input(message: str) -> List[float]:
+    """
+    Gets a comma separated float input from the user and returns it.
+
+    :param message:
+    :return:
+    """
+
+    while True:
+        choice = input(message)
+
+        try:
+            values = [float(c) for c in choice.split(",") if c.strip()]
+        except ValueError:
+            values = []
+
+        if values:
+            return values
+
+        print(error("Invalid choice. Please try again."))
+
+
 def get_formatted_input(message: str, options: Optional[dict[str, str]]) -> str:
     """
     Formats the input message based on data that is injected into the function.
@@ -0,0 +1,269 @@
+"""
+util/model_store.py
+
+This module is responsible for keeping fitted models on disk so that a
+data set that was already clustered or decomposed with the same settings
+does not have to be fitted again in a later session.
+
+A model is keyed by the content of the data set it was fitted on (see
+get_data_fingerprint in util/data.py), the algorithm, its parameters and
+its seed. Every model gets its own directory that contains a manifest,
+one .npy file per array and one block directory per DataFrame (see
+util/csv_cache.py). When the store grows past its size limit, the models
+that were used the longest time ago are removed.
+
+Ex: data/.cache/models/<key>/manifest.json
+    data/.cache/models/<key>/centers.npy        <13 x 1465> float64
+    data/.cache/models/<key>/loadings/          <1465 x 20> DataFrame
+
+"""
+
+# Imports
+import os
+import json
+import uuid
+import shutil
+import hashlib
+from typing import Optional
+
+import numpy as np
+from pandas import DataFrame
+
+# Constants
+from util.constants import (
+    MODEL_STORE_PATH,
+    MODEL_STORE_VERSION,
+    MODEL_STORE_MANIFEST
+)
+
+# Utilities
+from util.csv_cache import write_frame_blocks, read_frame_blocks
+from util.print import warning
+
+Model = dict[str, np.ndarray | DataFrame | int | float | str | bool | None]
+
+
+def get_model_key(fingerprint: str, algorithm: str, parameters: dict, seed: Optional[int] = None) -> str:
+    """
+    Gets the key of a model.
+
+    :param fingerprint: The fingerprint of the data set the model is fitted on.
+    :param algorithm: Ex: kmeans, pca.
+    :param parameters: The parameters the result depends on.
+    :param seed: The random seed, None if the algorithm is not random.
+    :return:
+    """
+
+    description = json.dumps({
+        "fingerprint": fingerprint,
+        "algorithm": algorithm,
+        "parameters": parameters,
+        "seed": seed
+    }, sort_keys=True)
+
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+
+def get_directory_bytes(directory: str) -> int:
+    """
+    Gets the number of bytes the files of a directory take on disk.
+
+    :param directory:
+    :return:
+    """
+
+    return sum(
+        os.path.getsize(os.path.join(root, file))
+        for root, _, files in os.walk(directory)
+        for file in files
+    )
+
+
+class ModelStore:
+    """
+    A class that represents the fitted models kept on disk.
+
+    Attributes
+    ----------
+    path : str
+        The directory of the store.
+    max_bytes : int
+        The size the store is kept under, 0 for no limit.
+
+    Methods
+    -------
+    get(key: str) -> Model | None
+        Gets a model.
+    set(key: str, model: Model, description: dict)
+        Stores a model.
+    has(key: str) -> bool
+        Checks if a model is stored.
+    remove(key: str)
+        Removes a model.
+    enforce_limit(protected: str | None)
+        Removes the least recently used models until the store fits its size limit.
+    get_bytes() -> int
+        Gets the size of the store.
+    clear()
+        Removes every model.
+    """
+
+    def __init__(self, path: str = MODEL_STORE_PATH, max_bytes: int = 0):
+        self.path = path
+        self.max_bytes = max_bytes
+
+    def get_directory(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def read_manifest(self, key: str) -> dict | None:
+        try:
+            with open(os.path.join(self.get_directory(key), MODEL_STORE_MANIFEST), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != MODEL_STORE_VERSION:
+            return None
+
+        return manifest
+
+    def has(self, key: str) -> bool:
+        return self.read_manifest(key) is not None
+
+    def get(self, key: str) -> Model | None:
+        """
+        Gets a model, and marks it as used.
+
+        :param key:
+        :return: The model, or None if it is not stored.
+        """
+
+        manifest = self.read_manifest(key)
+
+        if manifest is None:
+            return None
+
+        directory = self.get_directory(key)
+        model: Model = dict(manifest["values"])
+
+        try:
+            for name in manifest["arrays"]:
+                model[name] = np.load(os.path.join(directory, f"{name}.npy"))
+
+            for name, layout in manifest["frames"].items():
+                model[name] = read_frame_blocks(os.path.join(directory, name), layout)
+        except (OSError, ValueError) as e:
+            print(warning(f"Could not read the stored model {key}: {e}"))
+            self.remove(key)
+            return None
+
+        # The modification time of the manifest is the last time the model was used
+        os.utime(os.path.join(directory, MODEL_STORE_MANIFEST))
+
+        return model
+
+    def set(self, key: str, model: Model, description: Optional[dict] = None):
+        """
+        Stores a model. Arrays are written as .npy files, DataFrames as
+        blocks, and every other value in the manifest. The model is written
+        to a temporary directory first, so a half written model is never read.
+
+        :param key:
+        :param model:
+        :param description: What the model was fitted on, kept in the manifest for reference.
+        :return:
+        """
+
+        directory = self.get_directory(key)
+        temp_directory = os.path.join(self.path, f".{key}.{uuid.uuid4().hex}.tmp")
+
+        manifest = {
+            "version": MODEL_STORE_VERSION,
+            "description": description or {},
+            "values": {},
+            "arrays": [],
+            "frames": {}
+        }
+
+        try:
+            os.makedirs(temp_directory)
+
+            for name, value in model.items():
+                if isinstance(value, np.ndarray):
+                    np.save(os.path.join(temp_directory, f"{name}.npy"), value)
+                    manifest["arrays"].append(name)
+                elif isinstance(value, DataFrame):
+                    manifest["frames"][name] = write_frame_blocks(value, os.path.join(temp_directory, name))
+                else:
+                    manifest["values"][name] = value
+
+            with open(os.path.join(temp_directory, MODEL_STORE_MANIFEST), "w") as f:
+                json.dump(manifest, f)
+
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(temp_directory, directory)
+        except (OSError, TypeError, ValueError) as e:
+            print(warning(f"Could not store the model {key}: {e}"))
+            return
+        finally:
+            shutil.rmtree(temp_directory, ignore_errors=True)
+
+        self.enforce_limit(protected=key)
+
+    def remove(self, key: str):
+        shutil.rmtree(self.get_directory(key), ignore_errors=True)
+
+    def get_keys(self) -> list[str]:
+        if not os.path.isdir(self.path):
+            return []
+
+        return [
+            key for key in os.listdir(self.path)
+            if not key.startswith(".") and os.path.isdir(self.get_directory(key))
+        ]
+
+    def get_bytes(self) -> int:
+        return sum(get_directory_bytes(self.get_directory(key)) for key in self.get_keys())
+
+    def enforce_limit(self, protected: Optional[str] = None):
+        """
+        Removes the least recently used models until the store fits its
+        size limit. The model that was just stored is never removed.
+
+        :param protected:
+        :return:
+        """
+
+        if not self.max_bytes:
+            return
+
+        sizes = {}
+        used = {}
+
+        for key in self.get_keys():
+            directory = self.get_directory(key)
+            sizes[key] = get_directory_bytes(directory)
+
+            try:
+                used[key] = os.path.getmtime(os.path.join(directory, MODEL_STORE_MANIFEST))
+            except OSError:
+                # Models without a manifest are incomplete, remove them first
+                used[key] = 0.0
+
+        total = sum(sizes.values())
+
+        for key in sorted(used, key=used.get):
+            if total <= self.max_bytes:
+                break
+
+            if key == protected:
+                continue
+
+            self.remove(key)
+            total -= sizes[key]
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __repr__(self):
+        return f"ModelStore({self.path!r}, max_bytes={self.max_bytes})"
@@ -0,0 +1,77 @@
+"""
+util/reduction.py
+
+This module is responsible for reducing the gene columns of a data set:
+a gene column is removed if any of its values is below a threshold.
+
+The minimum of every gene column is computed once, with a single NumPy
+reduction over the gene block, so any number of thresholds can be tried
+without reading the data set again.
+
+Ex: reduce_columns(data, [0.0001, 0.001, 0.01]) -> one reduced data set per threshold
+
+"""
+
+# Imports
+import warnings
+
+import numpy as np
+from pandas import DataFrame
+
+# Utilities
+from util.data import get_gene_column_mask
+from util.compact import get_float_precision, to_precision
+
+
+def get_column_minima(data: DataFrame, positions: np.ndarray) -> np.ndarray:
+    """
+    Gets the smallest value of some columns, ignoring missing values.
+
+    :param data:
+    :param positions: The positions of the columns.
+    :return: The minimum of every column, NaN if it has no values.
+    """
+
+    values = data.iloc[:, positions].to_numpy(dtype=np.float64)
+
+    if values.shape[0] == 0:
+        return np.full(len(positions), np.nan)
+
+    # Columns with only missing values have no minimum, like pandas they get NaN
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmin(values, axis=0)
+
+
+def reduce_columns(data: DataFrame, thresholds: list[float]) -> tuple[dict[float, DataFrame], DataFrame]:
+    """
+    Removes the gene columns that have a value below each threshold.
+
+    Every reduced data set keeps the non-gene and cluster columns first,
+    followed by the gene columns that are left.
+
+    :param data:
+    :param thresholds:
+    :return: The reduced data set of every threshold, and a report of how many columns each one keeps.
+    """
+
+    is_gene = get_gene_column_mask(data)
+    gene_positions, other_positions = np.flatnonzero(is_gene), np.flatnonzero(~is_gene)
+    minima = get_column_minima(data, gene_positions)
+    precision = get_float_precision(data)
+
+    reduced = {}
+    report = []
+
+    for threshold in dict.fromkeys(thresholds):
+        # NaN is never below the threshold, so columns without values are kept, as before
+        kept = gene_positions[~(minima < to_precision(threshold, precision))]
+
+        reduced[threshold] = data.iloc[:, np.concatenate([other_positions, kept])]
+        report.append({
+            "Threshold": threshold,
+            "Columns Kept": len(kept),
+            "Columns Removed": len(gene_positions) - len(kept)
+        })
+
+    return reduced, DataFrame(report, columns=["Threshold", "Columns Kept", "Columns Removed"]).set_index("Threshold")
@@ -0,0 +1,215 @@
+"""
+util/spatial.py
+
+This module is responsible for finding the neighbors of every voxel from
+its X, Y and Z coordinates, as a sparse adjacency matrix that spatially
+constrained clustering can run on.
+
+Voxels that lie on a regular grid are looked up directly in a 3D array
+and connected to the 6 voxels they share a face with. Any other voxels
+are connected to their nearest voxels with a KD-tree. Separate parts of
+the graph are then joined at their nearest voxels, so clusters built on
+it stay contiguous in space.
+
+Ex: get_adjacency(data[XYZ_COLUMNS]) -> <4.3K x 4.3K sparse matrix with 25K edges>
+
+"""
+
+# Imports
+import numpy as np
+from pandas import DataFrame
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+# Constants
+from util.constants import (
+    XYZ_COLUMNS,
+    SPATIAL_ADJACENCIES,
+    SPATIAL_NEIGHBORS,
+    SPATIAL_MAX_GRID_CELLS
+)
+
+# Utilities
+from util.print import warning
+
+
+def get_grid_indices(xyz: np.ndarray) -> np.ndarray | None:
+    """
+    Gets the grid cell of every voxel, if the voxels lie on a regular grid.
+
+    :param xyz: The coordinates, one row per voxel.
+    :return: The integer cell of every voxel, or None if the voxels are not on a grid.
+    """
+
+    indices = np.empty(xyz.shape, dtype=np.int64)
+
+    for axis in range(xyz.shape[1]):
+        values = xyz[:, axis]
+        steps = np.diff(np.unique(values))
+
+        # The spacing of the grid along this axis is the smallest step between two voxels
+        spacing = steps.min() if len(steps) else 1.0
+        indices[:, axis] = np.rint((values - values.min()) / spacing)
+
+        if not np.allclose(indices[:, axis] * spacing + values.min(), values):
+            return None
+
+    return indices
+
+
+def to_symmetric_matrix(rows: np.ndarray, columns: np.ndarray, size: int) -> csr_matrix:
+    """
+    Builds a symmetric adjacency matrix from a list of edges.
+
+    :param rows:
+    :param columns:
+    :param size: The number of voxels.
+    :return:
+    """
+
+    matrix = coo_matrix(
+        (np.ones(len(rows) * 2, dtype=np.float64), (np.concatenate([rows, columns]), np.concatenate([columns, rows]))),
+        shape=(size, size)
+    ).tocsr()
+
+    # Edges found from both ends are summed, they only need to exist
+    matrix.data[:] = 1.0
+
+    return matrix
+
+
+def get_grid_adjacency(xyz: np.ndarray) -> csr_matrix | None:
+    """
+    Connects every voxel to the voxels it shares a face with, with a
+    direct lookup in a 3D array of the grid.
+
+    :param xyz: The coordinates, one row per voxel.
+    :return: The adjacency matrix, or None if the voxels do not fit a grid.
+    """
+
+    indices = get_grid_indices(xyz)
+
+    if indices is None:
+        return None
+
+    shape = indices.max(axis=0) + 1
+
+    if np.prod(shape, dtype=np.float64) > SPATIAL_MAX_GRID_CELLS:
+        return None
+
+    lookup = np.full(shape, -1, dtype=np.int64)
+    lookup[tuple(indices.T)] = np.arange(len(xyz))
+
+    # Two voxels in the same cell cannot be told apart on the grid
+    if np.count_nonzero(lookup >= 0) != len(xyz):
+        return None
+
+    rows, columns = [], []
+
+    for axis in range(xyz.shape[1]):
+        neighbors = indices.copy()
+        neighbors[:, axis] += 1
+
+        inside = neighbors[:, axis] < shape[axis]
+        found = np.full(len(xyz), -1, dtype=np.int64)
+        found[inside] = lookup[tuple(neighbors[inside].T)]
+
+        has_neighbor = found >= 0
+        rows.append(np.flatnonzero(has_neighbor))
+        columns.append(found[has_neighbor])
+
+    return to_symmetric_matrix(np.concatenate(rows), np.concatenate(columns), len(xyz))
+
+
+def get_knn_adjacency(xyz: np.ndarray, neighbors: int = SPATIAL_NEIGHBORS) -> csr_matrix:
+    """
+    Connects every voxel to its nearest voxels with a KD-tree.
+
+    :param xyz: The coordinates, one row per voxel.
+    :param neighbors: The number of nearest voxels.
+    :return: The adjacency matrix.
+    """
+
+    neighbors = min(neighbors, len(xyz) - 1)
+
+    if neighbors < 1:
+        return csr_matrix((len(xyz), len(xyz)), dtype=np.float64)
+
+    # The nearest voxel of every voxel is itself
+    _, nearest = cKDTree(xyz).query(xyz, k=neighbors + 1)
+
+    rows = np.repeat(np.arange(len(xyz)), neighbors)
+    columns = nearest[:, 1:].ravel()
+
+    return to_symmetric_matrix(rows, columns, len(xyz))
+
+
+def connect_components(xyz: np.ndarray, matrix: csr_matrix) -> csr_matrix:
+    """
+    Joins the separate parts of an adjacency matrix into one. Every round,
+    every part is connected to the nearest voxel outside of it with a
+    KD-tree, which at least halves the number of parts.
+
+    :param xyz: The coordinates, one row per voxel.
+    :param matrix: The adjacency matrix.
+    :return: The adjacency matrix with the edges that join its parts added.
+    """
+
+    count, components = connected_components(matrix, directed=False)
+
+    if count > 1:
+        print(warning(f"The voxels form {count} separate parts, joining them at their nearest voxels."))
+
+    while count > 1:
+        rows, columns = [], []
+
+        for component in range(count):
+            inside = np.flatnonzero(components == component)
+            outside = np.flatnonzero(components != component)
+
+            distances, nearest = cKDTree(xyz[outside]).query(xyz[inside])
+            closest = np.argmin(distances)
+
+            rows.append(inside[closest])
+            columns.append(outside[nearest[closest]])
+
+        matrix = matrix + to_symmetric_matrix(np.array(rows), np.array(columns), len(xyz))
+        matrix.data[:] = 1.0
+
+        count, components = connected_components(matrix, directed=False)
+
+    return matrix
+
+
+def get_adjacency(data: DataFrame,
+                  adjacency: str = SPATIAL_ADJACENCIES[0],
+                  neighbors: int = SPATIAL_NEIGHBORS) -> csr_matrix:
+    """
+    Gets the sparse adjacency matrix of the voxels of a data set.
+
+    :param data: A data set with X, Y and Z columns.
+    :param adjacency: One of SPATIAL_ADJACENCIES.
+    :param neighbors: The number of nearest voxels, for knn.
+    :return: A connected, symmetric n x n matrix with a 1 for every pair of neighbors.
+    """
+
+    if adjacency not in SPATIAL_ADJACENCIES:
+        raise ValueError(f"Invalid adjacency: {adjacency}. Expected one of {SPATIAL_ADJACENCIES}")
+
+    missing = [column for column in XYZ_COLUMNS if column not in data.columns]
+
+    if missing:
+        raise ValueError(f"The data set has no {', '.join(missing)} columns.")
+
+    xyz = data[XYZ_COLUMNS].to_numpy(dtype=np.float64)
+
+    matrix = get_grid_adjacency(xyz) if adjacency == "grid" else None
+
+    if matrix is None:
+        if adjacency == "grid":
+            print(warning("The voxels do not lie on a regular grid, connecting the nearest voxels instead."))
+
+        matrix = get_knn_adjacency(xyz, neighbors)
+
+    return connect_components(xyz, matrix)
@@ -0,0 +1,208 @@
+"""
+util/streaming.py
+
+This module is responsible for processing csv files that are too large
+to fit in memory. The file is read a chunk of rows at a time, each chunk
+is processed on its own, and the result is written straight to disk, so
+the memory used is bounded by the size of a chunk.
+
+Ex: StreamingDataset("data/sagittal.csv").filter_structure_ids([773, 136], "data/generated/sagittal_773_136.csv")
+
+"""
+
+# Imports
+import os
+from typing import Callable, Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+# Constants
+from util.constants import (
+    STREAM_CHUNK_ROWS,
+    STRUCTURE_IDS_COLUMN
+)
+
+# Utilities
+from util.binning import DensityBins, bin_density
+from util.data import column_is_gene_data
+
+
+def write_csv_chunks(chunks: Iterable[DataFrame], path: str) -> int:
+    """
+    Writes chunks of rows to a csv file, one after the other. The file is
+    written under a temporary name and only renamed once it is complete.
+
+    :param chunks:
+    :param path:
+    :return: The number of rows written.
+    """
+
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temp_path = f"{path}.tmp"
+    rows = 0
+
+    try:
+        with open(temp_path, "w", newline="") as f:
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(f, header=i == 0, index=False)
+                rows += len(chunk)
+
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return rows
+
+
+class StreamingDataset:
+    """
+    A class that represents a csv file that is processed one chunk of rows
+    at a time instead of being loaded whole.
+
+    Attributes
+    ----------
+    path : str
+        The path of the csv file.
+    chunk_rows : int
+        The number of rows in each chunk.
+
+    Methods
+    -------
+    chunks() -> Iterator[DataFrame]
+        Iterates over the chunks of the file.
+    get_columns() -> list[str]
+        Gets the column names without reading any rows.
+    filter_structure_ids(structure_ids: list[int], out_path: str) -> int
+        Keeps the rows of some Structure-IDs.
+    replace_nan(value: float, out_path: str) -> int
+        Replaces the missing values.
+    bin_density() -> DensityBins
+        Bins the density values, see util/binning.py.
+    column_min() -> Series
+        Gets the smallest value of every numeric column.
+    reduce_columns(threshold: float, out_path: str) -> list[str]
+        Removes the gene columns with a value below a threshold.
+    """
+
+    def __init__(self, path: str, chunk_rows: int = STREAM_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+
+    def chunks(self, columns: Optional[list[str]] = None) -> Iterator[DataFrame]:
+        """
+        Iterates over the chunks of the file, parsed the same way as
+        a whole file, see util/data.py.
+
+        :param columns: The columns to read, None for all of them.
+        :return:
+        """
+
+        with pd.read_csv(self.path, header=0, float_precision='high', index_col=False,
+                         usecols=columns, chunksize=self.chunk_rows) as reader:
+            yield from reader
+
+    def get_columns(self) -> list[str]:
+        return list(pd.read_csv(self.path, header=0, index_col=False, nrows=0).columns)
+
+    def transform(self, func: Callable[[DataFrame], DataFrame], out_path: str) -> int:
+        """
+        Applies a function to every chunk and writes the results to a csv file.
+
+        :param func:
+        :param out_path:
+        :return: The number of rows written.
+        """
+
+        return write_csv_chunks((func(chunk) for chunk in self.chunks()), out_path)
+
+    def filter_structure_ids(self, structure_ids: list[int], out_path: str) -> int:
+        """
+        Writes the rows whose Structure-ID is in the list to a csv file.
+
+        :param structure_ids:
+        :param out_path:
+        :return: The number of rows kept.
+        """
+
+        return self.transform(lambda chunk: chunk[chunk[STRUCTURE_IDS_COLUMN].isin(structure_ids)], out_path)
+
+    def replace_nan(self, value: float, out_path: str) -> int:
+        """
+        Writes the file with every missing value replaced to a csv file.
+
+        :param value:
+        :param out_path:
+        :return: The number of values replaced.
+        """
+
+        replaced = 0
+
+        def fill(chunk: DataFrame) -> DataFrame:
+            nonlocal replaced
+            replaced += int(chunk.isna().sum().sum())
+            return chunk.fillna(value)
+
+        self.transform(fill, out_path)
+
+        return replaced
+
+    def bin_density(self) -> DensityBins:
+        """
+        Bins the density values of the file into log-decade buckets.
+
+        :return:
+        """
+
+        bins = DensityBins()
+
+        for chunk in self.chunks():
+            bins = bins.merge(bin_density(chunk))
+
+        return bins
+
+    def column_min(self, columns: Optional[list[str]] = None) -> Series:
+        """
+        Gets the smallest value of every numeric column.
+
+        :param columns: The columns to read, None for all of them.
+        :return:
+        """
+
+        minimum: Optional[Series] = None
+
+        for chunk in self.chunks(columns):
+            chunk_min = chunk.min(numeric_only=True)
+            minimum = chunk_min if minimum is None else np.fmin(minimum, chunk_min.reindex(minimum.index))
+
+        return Series(dtype=np.float64) if minimum is None else minimum
+
+    def get_gene_columns(self) -> list[str]:
+        return [column for column in self.get_columns() if column_is_gene_data(column)]
+
+    def reduce_columns(self, threshold: float, out_path: str) -> list[str]:
+        """
+        Writes the file without the gene columns that have a value below the
+        threshold to a csv file. The file is read twice: once for the
+        minimum of every column, and once to write the columns that are kept.
+
+        :param threshold:
+        :param out_path:
+        :return: The columns that were removed.
+        """
+
+        minimum = self.column_min(self.get_gene_columns())
+        removed = list(minimum[minimum < threshold].index)
+
+        self.transform(lambda chunk: chunk.drop(columns=removed), out_path)
+
+        return removed
+
+    def __repr__(self):
+        return f"StreamingDataset({self.path!r}, chunk_rows={self.chunk_rows})"
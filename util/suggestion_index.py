@@ -0,0 +1,152 @@
+"""
+util/suggestion_index.py
+
+This module is responsible for providing an index that suggests
+the strings most alike to a misspelled one, without comparing the
+misspelled string to every string in the index.
+
+Strings are broken into character trigrams, and an inverted index
+maps every trigram to the strings that contain it. Only strings that
+share at least one trigram with the query are scored.
+
+"""
+
+# Imports
+from difflib import SequenceMatcher
+
+# Constants
+from util.constants import SUGGESTION_COUNT
+
+NGRAM_SIZE = 3
+
+# How many of the best trigram matches are re-ranked with SequenceMatcher
+RERANK_FACTOR = 4
+
+
+def get_ngrams(string: str, n: int = NGRAM_SIZE) -> set[str]:
+    """
+    Returns the character n-grams of a string. The string is lowercased
+    and padded so that its start and end form n-grams of their own.
+
+    :param string:
+    :param n:
+    :return:
+    """
+
+    padded = " " * (n - 1) + string.lower() + " "
+
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+class SuggestionIndex:
+    """
+    A class that represents a trigram index of strings.
+
+    Attributes
+    ----------
+    postings : dict[str, set[str]]
+        The strings that contain each trigram.
+    ngrams : dict[str, set[str]]
+        The trigrams of each string in the index.
+
+    Methods
+    -------
+    add(string: str)
+        Adds a string to the index.
+    remove(string: str)
+        Removes a string from the index.
+    clear()
+        Removes every string from the index.
+    query(string: str, k: int) -> list[str]
+        Gets the k strings most alike to the string, best first.
+    """
+
+    def __init__(self):
+        self.postings: dict[str, set[str]] = {}
+        self.ngrams: dict[str, set[str]] = {}
+
+    def add(self, string: str):
+        """
+        Adds a string to the index.
+
+        :param string:
+        :return:
+        """
+
+        if string in self.ngrams:
+            return
+
+        ngrams = get_ngrams(string)
+        self.ngrams[string] = ngrams
+
+        for ngram in ngrams:
+            self.postings.setdefault(ngram, set()).add(string)
+
+    def remove(self, string: str):
+        """
+        Removes a string from the index.
+
+        :param string:
+        :return:
+        """
+
+        ngrams = self.ngrams.pop(string, None)
+
+        if ngrams is None:
+            return
+
+        for ngram in ngrams:
+            strings = self.postings[ngram]
+            strings.discard(string)
+
+            if not strings:
+                del self.postings[ngram]
+
+    def clear(self):
+        self.postings.clear()
+        self.ngrams.clear()
+
+    def query(self, string: str, k: int = SUGGESTION_COUNT) -> list[str]:
+        """
+        Gets the strings most alike to the string, best first.
+
+        Candidates are scored by the trigrams they share with the query,
+        both relative to the query (so typing part of a path works) and
+        to the candidate (so shorter paths are preferred). The best few
+        are then re-ranked by their SequenceMatcher ratio against the full
+        path or its last part, whichever is closer.
+
+        :param string:
+        :param k: The number of suggestions.
+        :return:
+        """
+
+        query_ngrams = get_ngrams(string)
+        shared: dict[str, int] = {}
+
+        for ngram in query_ngrams:
+            for candidate in self.postings.get(ngram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        def ngram_score(candidate: str) -> float:
+            count = shared[candidate]
+            return count / len(query_ngrams) + 2 * count / (len(query_ngrams) + len(self.ngrams[candidate]))
+
+        candidates = sorted(shared, key=ngram_score, reverse=True)[:k * RERANK_FACTOR]
+
+        lowered = string.lower()
+
+        def ratio(candidate: str) -> float:
+            lowered_candidate = candidate.lower()
+            return max(
+                SequenceMatcher(None, lowered, lowered_candidate).ratio(),
+                SequenceMatcher(None, lowered, lowered_candidate.rsplit("/", 1)[-1]).ratio()
+            )
+
+        return sorted(candidates, key=lambda c: (ratio(c), ngram_score(c)), reverse=True)[:k]
+
+    def __len__(self):
+        return len(self.ngrams)
+
+    def __contains__(self, string: str) -> bool:
+        return string in self.ngrams